@@ -0,0 +1,196 @@
+import re
+import PyPDF2
+from PyPDF2.generic import ArrayObject, IndirectObject
+
+# Reads the interactive form (AcroForm) of a fillable PDF and describes its
+# fields in the {"forms": [{"title", "fields"}]} shape the form editor gets
+# from the vision model, so such PDFs need neither rendering nor an LLM call.
+
+# Field flags (PDF 32000-1, tables 221, 226, 227 and 228)
+FLAG_REQUIRED = 1 << 1
+FLAG_MULTILINE = 1 << 12
+FLAG_RADIO = 1 << 15
+FLAG_PUSHBUTTON = 1 << 16
+FLAG_MULTISELECT = 1 << 21
+
+# Keys a field passes down to its kids
+INHERITABLE_KEYS = ('/FT', '/Ff', '/V', '/Opt')
+
+DATE_NAME = re.compile(r'\bdate\b|\bdob\b', re.IGNORECASE)
+
+def clean_text(value):
+    """Collapse the tabs and runs of spaces that authoring tools leave in field names"""
+    return ' '.join(str(value).split()) if value is not None else None
+
+def pdf_name(value):
+    """A name object without its leading slash"""
+    return str(value)[1:] if str(value).startswith('/') else str(value)
+
+def widget_on_states(widget):
+    """The appearance states a checkbox or radio widget can switch on to"""
+    appearances = widget.get('/AP', {})
+    states = set()
+    for key in ('/N', '/D'):
+        stream = appearances.get(key)
+        if stream is not None and hasattr(stream.get_object(), 'keys'):
+            states.update(name for name in stream.get_object().keys() if name != '/Off')
+    return sorted(pdf_name(state) for state in states)
+
+def option_labels(options):
+    """/Opt entries are either strings or [export value, display text] pairs"""
+    labels = []
+    for option in options or []:
+        option = option.get_object()
+        if isinstance(option, ArrayObject) and len(option) == 2:
+            option = option[1]
+        labels.append(clean_text(option))
+    return labels
+
+def is_date_field(name, field):
+    actions = field.get('/AA')
+    if actions is not None:
+        # Acrobat date fields format and validate themselves with AFDate_* scripts
+        for action in actions.get_object().values():
+            script = action.get_object().get('/JS')
+            if script is None:
+                continue
+            script = script.get_object()
+            text = script.get_data().decode('latin-1') if hasattr(script, 'get_data') else str(script)
+            if 'AFDate_' in text:
+                return True
+    return bool(DATE_NAME.search(name))
+
+def page_numbers_by_widget(reader):
+    """Map each widget annotation's object number to the page it sits on"""
+    pages = {}
+    for page_number, page in enumerate(reader.pages, start=1):
+        annotations = page.get('/Annots')
+        for annotation in (annotations.get_object() if annotations is not None else []):
+            if isinstance(annotation, IndirectObject):
+                pages[annotation.idnum] = page_number
+    return pages
+
+def iter_terminal_fields(field_refs, parent_name=None, inherited=None):
+    """Walk the field tree, yielding (qualified name, field, inherited values, widgets).
+
+    A field whose kids carry no /T of their own is terminal; those kids (or the
+    field itself, when field and widget are merged) are its widget annotations.
+    """
+    for field_ref in field_refs:
+        field = field_ref.get_object()
+        values = dict(inherited or {})
+        values.update({key: field[key] for key in INHERITABLE_KEYS if key in field})
+
+        partial_name = field.get('/T')
+        name = parent_name
+        if partial_name is not None:
+            name = f"{parent_name}.{partial_name}" if parent_name else str(partial_name)
+
+        kids = field.get('/Kids')
+        kids = kids.get_object() if kids is not None else []
+        child_fields = [kid for kid in kids if '/T' in kid.get_object()]
+        if child_fields:
+            yield from iter_terminal_fields(child_fields, name, values)
+            continue
+        widgets = list(kids) if kids else [field_ref]
+        yield name, field, values, widgets
+
+def describe_field(name, field, values, widgets, widget_pages):
+    """One editor field for a terminal AcroForm field, or None for push buttons"""
+    field_type = values.get('/FT')
+    flags = int(values.get('/Ff', 0))
+    value = values.get('/V')
+    label = clean_text(field.get('/T')) or clean_text(name)
+
+    entry = {"name": label}
+    if field_type == '/Tx':
+        if is_date_field(label, field):
+            entry["type"] = "date"
+        else:
+            entry["type"] = "textarea" if flags & FLAG_MULTILINE else "textbox"
+        entry["value"] = str(value) if value is not None else ""
+    elif field_type == '/Btn':
+        if flags & FLAG_PUSHBUTTON:
+            return None
+        states = []
+        for widget in widgets:
+            states.extend(state for state in widget_on_states(widget.get_object()) if state not in states)
+        selected = pdf_name(value) if value is not None and value != '/Off' else None
+        if flags & FLAG_RADIO:
+            entry["type"] = "radio"
+            entry["options"] = states
+            entry["value"] = selected
+        else:
+            entry["type"] = "checkbox"
+            if selected is None:
+                # Older writers only record the state on the widget's /AS
+                selected = next((
+                    pdf_name(widget.get_object()['/AS']) for widget in widgets
+                    if widget.get_object().get('/AS') not in (None, '/Off')
+                ), None)
+            entry["value"] = selected is not None
+    elif field_type == '/Ch':
+        entry["type"] = "select"
+        entry["options"] = option_labels(values.get('/Opt'))
+        if flags & FLAG_MULTISELECT and isinstance(value, ArrayObject):
+            entry["value"] = [clean_text(item) for item in value]
+        else:
+            entry["value"] = clean_text(value) if value is not None else None
+    elif field_type == '/Sig':
+        entry["type"] = "signature"
+        entry["value"] = ""
+    else:
+        return None
+
+    entry["configuration"] = {"mandatory": bool(flags & FLAG_REQUIRED), "validation": False}
+    entry["field_name"] = name
+    description = clean_text(field.get('/TU'))
+    if description and description != label:
+        entry["description"] = description
+
+    entry["widgets"] = []
+    for widget in widgets:
+        rect = widget.get_object().get('/Rect')
+        entry["widgets"].append({
+            "page_number": widget_pages.get(widget.idnum) if isinstance(widget, IndirectObject) else None,
+            "rect": [round(float(coordinate), 2) for coordinate in rect] if rect else None
+        })
+    entry["page_number"] = entry["widgets"][0]["page_number"] if entry["widgets"] else None
+    return entry
+
+def extract_form_fields(stream):
+    """Read the AcroForm of the PDF in stream.
+
+    Returns {"has_acroform", "page_count", "forms": [{"title", "fields"}]};
+    fields are listed in page order, then top to bottom and left to right.
+    """
+    reader = PyPDF2.PdfReader(stream)
+    if reader.is_encrypted and not reader.decrypt(''):
+        raise ValueError("PDF is encrypted.")
+
+    info = reader.metadata
+    title = clean_text(info.get('/Title')) if info else None
+    acroform = reader.trailer['/Root'].get('/AcroForm')
+    field_refs = acroform.get_object().get('/Fields') if acroform is not None else None
+    field_refs = field_refs.get_object() if field_refs is not None else None
+
+    fields = []
+    if field_refs:
+        widget_pages = page_numbers_by_widget(reader)
+        for name, field, values, widgets in iter_terminal_fields(field_refs):
+            entry = describe_field(name, field, values, widgets, widget_pages)
+            if entry:
+                fields.append(entry)
+
+    def reading_order(entry):
+        rect = entry["widgets"][0]["rect"] if entry["widgets"] else None
+        top, left = (-rect[3], rect[0]) if rect else (0, 0)
+        # Widgets within a few points of each other vertically count as one row
+        return (entry["page_number"] or 0, round(top / 4), left)
+
+    fields.sort(key=reading_order)
+    return {
+        "has_acroform": bool(field_refs),
+        "page_count": len(reader.pages),
+        "forms": [{"title": title, "fields": fields}]
+    }
@@ -1,17 +1,33 @@
 import os
-import io
-import base64
-from flask import Flask, request, jsonify, send_from_directory
-from pdf2image import convert_from_bytes
+import re
+from flask import Flask, Response, abort, request, jsonify, send_from_directory, stream_with_context
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 import uuid
-import PyPDF2
-from datetime import datetime
-import hashlib
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
 import json
+from config import config
+import metrics
+from renderer import render_and_save, get_process_pool, resolve_process_count
+from jobs import job_manager, JOB_COMPLETED, JOB_FAILED, QueueFullError, ShuttingDownError
+from conversion_cache import conversion_cache, make_cache_key, write_manifest, stored_file_hash, hash_file
+from renditions import RENDITION_PROFILES, parse_rendition_names
+from pdf_metadata import extract_pdf_metadata, generate_metadata_hash, mapped_file, mapped_upload, fingerprint_pdf
+from uploads import SpoolingRequest, UploadSpool, spool_upload
+from acroform import extract_form_fields
+from blank_pages import parse_blank_page_mode
+from text_layer import extract_text_layer, TextLayerError
+from extraction import PageExtractor
+from page_fingerprints import page_content_fingerprints, document_fingerprint
+from page_index import page_index, merge_reused_pages
+from chunked_uploads import chunked_uploads, parse_content_range, UploadNotFoundError, UploadConflictError
+from retention import retention_index, retention_sweeper
 
 app = Flask(__name__)
+# Uploads are written to disk once and hashed on the way in
+app.request_class = SpoolingRequest
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_UPLOAD_BYTES
 CORS(app, resources={
     r"/conversion/*": {
         "origins": ["http://localhost:4201", "http://formbt.com", "https://formbt.com"],
@@ -22,145 +38,32 @@ CORS(app, resources={
 })
 
 # Configuration
-PORT = 5001
-GENERATED_IMAGES_DIR = 'generated_pngs'
+PORT = config.PORT
+GENERATED_IMAGES_DIR = config.GENERATED_IMAGES_DIR
 ALLOWED_EXTENSIONS = {'pdf'}
-POPPLER_PATH = None
+# What /conversion/generated_images/ serves, here and in the nginx configs; manifests stay private
+SERVED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg', 'webp'}
+POPPLER_PATH = config.POPPLER_PATH
 
 # Ensure the directory for generated images exists
 if not os.path.exists(GENERATED_IMAGES_DIR):
     os.makedirs(GENERATED_IMAGES_DIR)
     print(f"Created directory: {GENERATED_IMAGES_DIR}")
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+@app.before_request
+def start_retention_sweeper():
+    # Started on first use so each pre-forked worker gets its own thread
+    retention_sweeper.ensure_running()
 
-def generate_metadata_hash(metadata):
-    """Generate various hashes from PDF metadata for identification and comparison"""
-    try:
-        # Extract key fields for hashing
-        title = metadata.get('title', '')
-        creator = metadata.get('creator', '')
-        producer = metadata.get('producer', '')
-        creation_date = metadata.get('creation_date', '')
-        modification_date = metadata.get('modification_date', '')
-        
-        # Concatenate key metadata fields
-        metadata_string = f"{title}|{creator}|{producer}|{creation_date}|{modification_date}"
-        
-        # Generate different types of hashes
-        hashes = {}
-        
-        # MD5 hash
-        hashes['md5'] = hashlib.md5(metadata_string.encode('utf-8')).hexdigest()
-        
-        # SHA1 hash
-        hashes['sha1'] = hashlib.sha1(metadata_string.encode('utf-8')).hexdigest()
-        
-        # SHA256 hash
-        hashes['sha256'] = hashlib.sha256(metadata_string.encode('utf-8')).hexdigest()
-        
-        # Short ID (first 8 characters of SHA256)
-        hashes['short_id'] = hashes['sha256'][:8]
-        
-        # JSON fingerprint hash (for structured comparison)
-        json_metadata = json.dumps(metadata, sort_keys=True, default=str)
-        hashes['json_fingerprint'] = hashlib.sha256(json_metadata.encode('utf-8')).hexdigest()
-        
-        # Print hash information to console
-        print("METADATA HASHES GENERATED:")
-        print("-" * 30)
-        for hash_type, hash_value in hashes.items():
-            print(f"{hash_type.upper()}: {hash_value}")
-        print("-" * 30)
-        
-        return hashes
-        
-    except Exception as e:
-        print(f"Error generating metadata hash: {e}")
-        return {"error": f"Failed to generate hash: {str(e)}"}
+@app.after_request
+def count_error_responses(response):
+    if response.status_code >= 400:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.http_errors.inc(endpoint=endpoint, status=response.status_code)
+    return response
 
-def extract_pdf_metadata(pdf_bytes):
-    """Extract metadata from PDF bytes"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-        metadata = pdf_reader.metadata
-        
-        if not metadata:
-            print("No metadata found in PDF")
-            return {"message": "No metadata found in PDF"}
-        
-        # Extract common metadata fields
-        extracted_metadata = {}
-        
-        # Title
-        if '/Title' in metadata:
-            extracted_metadata['title'] = metadata['/Title']
-        
-        # Author
-        if '/Author' in metadata:
-            extracted_metadata['author'] = metadata['/Author']
-        
-        # Subject
-        if '/Subject' in metadata:
-            extracted_metadata['subject'] = metadata['/Subject']
-        
-        # Creator (application that created the PDF)
-        if '/Creator' in metadata:
-            extracted_metadata['creator'] = metadata['/Creator']
-        
-        # Producer (application that produced the PDF)
-        if '/Producer' in metadata:
-            extracted_metadata['producer'] = metadata['/Producer']
-        
-        # Creation date
-        if '/CreationDate' in metadata:
-            creation_date = metadata['/CreationDate']
-            try:
-                # PDF dates are in format D:YYYYMMDDHHmmSSOHH'mm'
-                if creation_date.startswith('D:'):
-                    date_str = creation_date[2:16]  # Extract YYYYMMDDHHMMSS
-                    parsed_date = datetime.strptime(date_str, '%Y%m%d%H%M%S')
-                    extracted_metadata['creation_date'] = parsed_date.isoformat()
-                else:
-                    extracted_metadata['creation_date'] = str(creation_date)
-            except:
-                extracted_metadata['creation_date'] = str(creation_date)
-        
-        # Modification date
-        if '/ModDate' in metadata:
-            mod_date = metadata['/ModDate']
-            try:
-                if mod_date.startswith('D:'):
-                    date_str = mod_date[2:16]  # Extract YYYYMMDDHHMMSS
-                    parsed_date = datetime.strptime(date_str, '%Y%m%d%H%M%S')
-                    extracted_metadata['modification_date'] = parsed_date.isoformat()
-                else:
-                    extracted_metadata['modification_date'] = str(mod_date)
-            except:
-                extracted_metadata['modification_date'] = str(mod_date)
-        
-        # Additional info
-        extracted_metadata['page_count'] = len(pdf_reader.pages)
-        
-        # Generate hashes from metadata
-        metadata_hashes = generate_metadata_hash(extracted_metadata)
-        extracted_metadata['hashes'] = metadata_hashes
-        
-        # Print metadata to console
-        print("=" * 50)
-        print("PDF METADATA EXTRACTED:")
-        print("=" * 50)
-        for key, value in extracted_metadata.items():
-            if key != 'hashes':  # Print hashes separately
-                print(f"{key.replace('_', ' ').title()}: {value}")
-        print("=" * 50)
-        
-        return extracted_metadata
-        
-    except Exception as e:
-        print(f"Error extracting PDF metadata: {e}")
-        return {"error": f"Failed to extract metadata: {str(e)}"}
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @app.route('/conversion/pdf-metadata', methods=['POST'])
 def pdf_metadata():
@@ -175,8 +78,9 @@ def pdf_metadata():
 
     if file and allowed_file(file.filename):
         try:
-            pdf_bytes = file.read()
-            metadata = extract_pdf_metadata(pdf_bytes)
+            # Uploads are spooled to disk as they arrive; map the file instead of copying it
+            with mapped_upload(file.stream) as pdf_data:
+                metadata = extract_pdf_metadata(pdf_data)
             
             return jsonify({
                 "filename": file.filename,
@@ -190,70 +94,813 @@ def pdf_metadata():
     else:
         return jsonify({"error": "Invalid file type. Only PDF files are allowed."}), 400
 
-@app.route('/conversion/pdf-to-png-save', methods=['POST'])
-def pdf_to_png_save():
+def iter_batch_pdfs():
+    """Yield (filename, pdf, sha256, error) for every PDF in a batch request.
+
+    PDFs come from repeated 'pdfFile' parts and/or from 'archive' zip files;
+    entries that are not PDFs are reported with an error instead of being read.
+    pdf is the path of a spooled upload, which workers memory-map, or the
+    bytes of a zip member; sha256 is known for spooled uploads only.
+    """
+    for file in request.files.getlist('pdfFile'):
+        if not allowed_file(file.filename):
+            yield file.filename, None, None, "Invalid file type. Only PDF files are allowed."
+            continue
+        if isinstance(file.stream, UploadSpool):
+            # Already on disk and hashed; the spool file lives until the response is done
+            file.stream.flush()
+            yield file.filename, file.stream.path, file.stream.sha256, None
+        else:
+            yield file.filename, file.read(), None, None
+
+    for archive in request.files.getlist('archive'):
+        try:
+            with zipfile.ZipFile(archive.stream) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not allowed_file(info.filename):
+                        continue
+                    if info.file_size > config.METADATA_BATCH_MAX_MEMBER_BYTES:
+                        yield info.filename, None, None, "PDF in archive is too large."
+                        continue
+                    yield info.filename, zf.read(info), None, None
+        except zipfile.BadZipFile:
+            yield archive.filename, None, None, "Archive is not a valid zip file."
+
+@app.route('/conversion/pdf-metadata/batch', methods=['POST'])
+def pdf_metadata_batch():
+    """Extract metadata and fingerprints for many PDFs, streaming one NDJSON line per file as it finishes"""
+    if 'pdfFile' not in request.files and 'archive' not in request.files:
+        return jsonify({"error": "No PDF files in the request. Use key 'pdfFile' (repeatable) or 'archive' (zip)."}), 400
+
+    pool = get_process_pool()
+    # Keep every core busy without reading the whole batch into memory up front
+    max_in_flight = 2 * resolve_process_count()
+
+    def result_line(index, filename, result=None, error=None):
+        line = {"index": index, "filename": filename}
+        if error:
+            line["error"] = error
+        else:
+            line.update(result)
+        return json.dumps(line, default=str) + "\n"
+
+    def generate():
+        in_flight = {}
+
+        def drain():
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, filename = in_flight.pop(future)
+                try:
+                    yield result_line(index, filename, future.result())
+                except Exception as e:
+                    print(f"Batch metadata extraction failed for {filename}: {e}")
+                    yield result_line(index, filename, error=f"Failed to extract metadata: {e}")
+
+        for index, (filename, pdf, pdf_sha256, error) in enumerate(iter_batch_pdfs()):
+            if index >= config.METADATA_BATCH_MAX_FILES:
+                yield result_line(index, filename, error="Batch file limit reached; file skipped.")
+                break
+            if error:
+                yield result_line(index, filename, error=error)
+                continue
+            in_flight[pool.submit(fingerprint_pdf, pdf, pdf_sha256)] = (index, filename)
+            if len(in_flight) >= max_in_flight:
+                yield from drain()
+        while in_flight:
+            yield from drain()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/conversion/form-fields', methods=['POST'])
+def pdf_form_fields():
+    """Describe the fillable fields of a PDF's AcroForm without rendering it"""
+    file, error_response = validate_pdf_upload()
+    if error_response:
+        return error_response
+
+    try:
+        file.stream.seek(0)
+        form = extract_form_fields(file.stream)
+        with mapped_upload(file.stream) as pdf_data:
+            metadata = extract_pdf_metadata(pdf_data)
+    except Exception as e:
+        app.logger.error(f"Error during PDF form field extraction: {e}")
+        return jsonify({"error": "Failed to extract PDF form fields.", "message": str(e)}), 500
+
+    field_count = len(form["forms"][0]["fields"])
+    form.update({
+        "filename": file.filename,
+        "field_count": field_count,
+        "metadata": metadata,
+        "message": f"Extracted {field_count} form fields." if form["has_acroform"] else "PDF has no fillable form fields."
+    })
+    return jsonify(form), 200
+
+@app.route('/conversion/text-layer', methods=['POST'])
+def pdf_text_layer():
+    """Per-page text with line boxes, flagging which pages still need to be sent as images"""
+    file, error_response = validate_pdf_upload()
+    if error_response:
+        return error_response
+    include_words = request.form.get('words', 'false').lower() == 'true'
+
+    pdf_path, pdf_sha256 = spool_upload(file)
+    try:
+        pages = extract_text_layer(pdf_path, include_words=include_words)
+    except TextLayerError as e:
+        app.logger.error(f"Error during PDF text extraction: {e}")
+        return jsonify({"error": "Failed to extract the PDF text layer.", "message": str(e)}), 500
+    finally:
+        os.remove(pdf_path)
+
+    text_pages = [page["page_number"] for page in pages if page["text_bearing"]]
+    image_pages = [page["page_number"] for page in pages if not page["text_bearing"]]
+    return jsonify({
+        "filename": file.filename,
+        "pdf_sha256": pdf_sha256,
+        "page_count": len(pages),
+        "text_bearing_pages": text_pages,
+        "image_pages": image_pages,
+        "pages": pages,
+        "message": f"{len(text_pages)} of {len(pages)} pages have a usable text layer."
+    }), 200
+
+class EmptyConversionError(Exception):
+    """Raised when poppler produced no pages for an uploaded PDF"""
+
+def validate_pdf_upload():
+    """Return (file, None) for a valid 'pdfFile' upload, or (None, error_response)"""
     if 'pdfFile' not in request.files:
-        return jsonify({"error": "No PDF file part in the request. Use key 'pdfFile'."}), 400
+        return None, (jsonify({"error": "No PDF file part in the request. Use key 'pdfFile'."}), 400)
 
     file = request.files['pdfFile']
 
     if file.filename == '':
-        return jsonify({"error": "No PDF file selected."}), 400
+        return None, (jsonify({"error": "No PDF file selected."}), 400)
 
-    if file and allowed_file(file.filename):
-        original_filename_base = os.path.splitext(secure_filename(file.filename))[0]
+    if not allowed_file(file.filename):
+        return None, (jsonify({"error": "Invalid file type. Only PDF files are allowed."}), 400)
+
+    return file, None
+
+def page_url(host_url, subdir_name, filename):
+    return host_url.rstrip('/') + f"/conversion/generated_images/{subdir_name}/{filename}"
+
+def parse_crop_padding():
+    """Padding in points for content cropping, or None when cropping is off; raises ValueError on bad values"""
+    crop = request.form.get('crop')
+    if crop is None:
+        enabled = config.DEFAULT_CROP
+    elif crop.lower() in ('true', 'false'):
+        enabled = crop.lower() == 'true'
+    else:
+        raise ValueError("crop must be 'true' or 'false'.")
+    if not enabled:
+        return None
+    padding = float(request.form.get('crop_padding', config.CROP_PADDING_POINTS))
+    if padding < 0:
+        raise ValueError("crop_padding must not be negative.")
+    return padding
+
+def parse_conversion_options():
+    """Read optional conversion settings from the form; raises ValueError on bad values"""
+    blank_pages = request.form.get('blank_pages')
+    return {
+        "crop_padding": parse_crop_padding(),
+        "renditions": parse_rendition_names(request.form.get('renditions')),
+        # Detection can be switched off server-wide unless a caller asks for it explicitly
+        "blank_pages": parse_blank_page_mode(blank_pages)
+        if blank_pages is not None or config.BLANK_PAGE_DETECTION else None
+    }
+
+def page_entry(host_url, subdir_name, page):
+    """Public description of one converted page, as listed under "pages" and streamed per page"""
+    entry = {
+        "page_number": page['page_number'],
+        "url": page_url(host_url, subdir_name, page['filename']) if page['filename'] else None,
+        "width": page['width'],
+        "height": page['height'],
+        "dpi": page.get('dpi'),
+        "sha256": page.get('sha256'),
+        "renditions": {
+            profile_name: page_url(host_url, subdir_name, rendition_name)
+            for profile_name, rendition_name in page['renditions'].items()
+        }
+    }
+    if 'blank' in page:
+        entry["blank"] = page['blank']
+        entry["ink_ratio"] = page['ink_ratio']
+    if 'crop' in page:
+        entry["crop"] = page['crop']
+    if 'color_class' in page:
+        entry["color_class"] = page['color_class']
+    for field in ('content_fingerprint', 'phash', 'reused'):
+        if field in page:
+            entry[field] = page[field]
+    return entry
+
+def conversion_response(subdir_name, pages, metadata, host_url, **extra):
+    """Response body shared by fresh and cached conversions"""
+    output_dir = os.path.join(GENERATED_IMAGES_DIR, subdir_name)
+    # Excluded blank pages have no files, only an entry in "pages"
+    filenames = [page['filename'] for page in pages if page['filename']]
+    renditions = {}
+    page_entries = []
+    for page in pages:
+        entry = page_entry(host_url, subdir_name, page)
+        for profile_name, url in entry["renditions"].items():
+            renditions.setdefault(profile_name, []).append(url)
+        page_entries.append(entry)
+
+    response = {
+        "message": f"Successfully converted PDF to {len(filenames)} PNG images.",
+        "saved_files_count": len(filenames),
+        "output_directory_on_server": output_dir,
+        "saved_file_paths_on_server": [os.path.join(output_dir, name) for name in filenames],
+        "accessible_urls": [page_url(host_url, subdir_name, name) for name in filenames],
+        "renditions": renditions,
+        "blank_pages": [page['page_number'] for page in pages if page.get('blank')],
+        "pages": page_entries,
+        "metadata": metadata
+    }
+    response.update(extra)
+    return response
+
+def make_render_params(options):
+    """Every setting that affects the rendered files; part of the conversion cache key"""
+    renditions = options.get('renditions', ())
+    blank_pages = options.get('blank_pages')
+    crop_padding = options.get('crop_padding')
+    render_params = {
+        "backend": config.RENDER_BACKEND,
+        "dpi": config.RENDER_DPI,
+        "max_pixels": config.RENDER_MAX_PIXELS,
+        "min_dpi": config.RENDER_MIN_DPI,
+        "fmt": "png",
+        "renditions": {name: RENDITION_PROFILES[name] for name in renditions},
+        "png": {
+            "adaptive_color": config.PNG_ADAPTIVE_COLOR,
+            "palette": config.PNG_COLOR_PALETTE,
+            "compress_level": config.PNG_COMPRESS_LEVEL
+        }
+    }
+    if blank_pages:
+        render_params["blank_pages"] = {
+            "mode": blank_pages,
+            "max_ink_ratio": config.BLANK_PAGE_MAX_INK_RATIO,
+            "ink_delta": config.BLANK_PAGE_INK_DELTA,
+            "margin_ratio": config.BLANK_PAGE_MARGIN_RATIO
+        }
+    if crop_padding is not None:
+        render_params["crop"] = {
+            "padding_points": crop_padding,
+            "min_ink_pixels": config.CROP_MIN_INK_PIXELS,
+            "ink_delta": config.BLANK_PAGE_INK_DELTA,
+            "margin_ratio": config.BLANK_PAGE_MARGIN_RATIO
+        }
+    return render_params
+
+def cached_conversion_response(cache_key, manifest, host_url, pdf_sha256):
+    """Response for a conversion served from the cache"""
+    for page in manifest['pages']:
+        # Entries written before pages carried their own hash
+        page.setdefault('sha256', manifest['file_hashes'].get(page['filename']))
+    return conversion_response(
+        cache_key, manifest['pages'], manifest['metadata'], host_url,
+        cache_hit=True, pdf_sha256=pdf_sha256, content_fingerprint=manifest.get('content_fingerprint')
+    )
+
+def convert_pdf_to_pngs(pdf_path, pdf_sha256, filename, host_url, job=None, options=None, on_page=None):
+    """Render the PDF at pdf_path into its output directory, reporting per-page progress to job.
+
+    Identical uploads rendered with the same parameters are served from the
+    content-addressed conversion cache instead of being rendered again.
+    on_page(page, output_dir) is called for every page once its files exist.
+    """
+    options = options or {}
+    renditions = options.get('renditions', ())
+    blank_pages = options.get('blank_pages')
+    crop_padding = options.get('crop_padding')
+    render_params = make_render_params(options)
+    cache_key = make_cache_key(pdf_sha256, render_params)
+    output_dir_for_this_pdf = None
+
+    if config.CACHE_ENABLED:
+        manifest = conversion_cache.lookup(cache_key)
+        metrics.cache_requests.inc(cache='conversion', result='hit' if manifest else 'miss')
+        if manifest:
+            print(f"Conversion cache hit for {filename}: {cache_key}")
+            response = cached_conversion_response(cache_key, manifest, host_url, pdf_sha256)
+            # Re-index in case the page index was lost while the cache survived
+            for page in manifest['pages']:
+                if page.get('content_fingerprint'):
+                    page_index.record_page(page['content_fingerprint'], render_params, cache_key, page)
+            if job:
+                job.start(len(manifest['pages']))
+                for page in response['pages']:
+                    job.page_completed(page['page_number'], page['url'], page)
+            if on_page:
+                for page in manifest['pages']:
+                    on_page(page, os.path.join(GENERATED_IMAGES_DIR, cache_key))
+            return response
+        output_dir_for_this_pdf = conversion_cache.claim(cache_key)
+
+    if output_dir_for_this_pdf:
+        unique_subdir_name = cache_key
+    else:
+        # Cache disabled, or the same document is being rendered by another request right now
         unique_subdir_name = str(uuid.uuid4())
         output_dir_for_this_pdf = os.path.join(GENERATED_IMAGES_DIR, unique_subdir_name)
         os.makedirs(output_dir_for_this_pdf, exist_ok=True)
+        retention_index.record(unique_subdir_name, pdf_sha256)
+    cached = unique_subdir_name == cache_key
+
+    try:
+        original_filename_base = os.path.splitext(secure_filename(filename))[0]
+
+        # Extract and print metadata
+        with mapped_file(pdf_path) as pdf_data, metrics.metadata_parse_seconds.time():
+            metadata = extract_pdf_metadata(pdf_data)
+        if job:
+            job.start(metadata.get('page_count'))
+
+        # Pages whose content was already rendered with these parameters are linked, not rendered
+        fingerprints = {}
+        if config.PAGE_REUSE_ENABLED:
+            try:
+                fingerprints = page_content_fingerprints(pdf_path)
+            except Exception as e:
+                print(f"Could not fingerprint the pages of {filename}: {e}")
+        reused = {}
+        for page_number, fingerprint in fingerprints.items():
+            record = page_index.lookup_page(fingerprint, render_params)
+            metrics.cache_requests.inc(cache='page', result='hit' if record else 'miss')
+            if not record:
+                continue
+            try:
+                reused[page_number] = page_index.reuse_page(
+                    record, output_dir_for_this_pdf, original_filename_base, page_number
+                )
+            except OSError:
+                # Evicted since the lookup; render it after all
+                pass
+        if reused:
+            print(f"Reusing {len(reused)} of {len(fingerprints)} pages of {filename} from earlier conversions")
+
+        pages = []
+
+        # Render, encode and write page windows across the process pool, in page order
+        rendered = render_and_save(
+            pdf_path, output_dir_for_this_pdf, original_filename_base,
+            dpi=render_params['dpi'], renditions=renditions, blank_pages=blank_pages,
+            crop_padding=crop_padding, skip_pages=reused
+        )
+        for page in merge_reused_pages(rendered, reused):
+            if 'render_seconds' in page:
+                metrics.page_render_seconds.observe(page.pop('render_seconds'), backend=config.RENDER_BACKEND)
+                metrics.page_encode_seconds.observe(page.pop('encode_seconds'))
+            if page['page_number'] in fingerprints:
+                page['content_fingerprint'] = fingerprints[page['page_number']]
+            if page['filepath']:
+                # Hashed once here; the manifest and ETags reuse it
+                page['sha256'] = hash_file(page['filepath'])
+            del page['filepath']
+            pages.append(page)
+            if job:
+                entry = page_entry(host_url, unique_subdir_name, page)
+                job.page_completed(page['page_number'], entry['url'], entry)
+            if on_page:
+                on_page(page, output_dir_for_this_pdf)
+
+        if not pages:
+            raise EmptyConversionError("Could not convert PDF to images. The PDF might be empty or corrupted.")
+
+        manifest = {
+            "pdf_sha256": pdf_sha256,
+            "pdf_size_bytes": os.path.getsize(pdf_path),
+            "render_params": render_params,
+            "filename": filename,
+            "files": [page['filename'] for page in pages if page['filename']],
+            "pages": pages,
+            "metadata": metadata
+        }
+        if len(fingerprints) == len(pages):
+            manifest["content_fingerprint"] = document_fingerprint(fingerprints[page['page_number']] for page in pages)
+        known_hashes = {page['filename']: page['sha256'] for page in pages if page['filename']}
+        if cached:
+            written = conversion_cache.commit(cache_key, manifest, known_hashes)
+        else:
+            # Still record content hashes so the images get strong ETags
+            written = write_manifest(output_dir_for_this_pdf, manifest, known_hashes)
+            retention_index.complete(unique_subdir_name, written['size_bytes'], pdf_sha256)
+        metrics.conversion_bytes_written.observe(written['size_bytes'])
+        metrics.conversion_pages.observe(len(pages))
+    except Exception as e:
+        metrics.conversion_errors.inc(error=type(e).__name__)
+        if cached:
+            conversion_cache.abandon(cache_key)
+        else:
+            retention_index.remove(unique_subdir_name)
+        raise
+
+    # Indexed only now that the files are committed; reused pages move to this newer entry
+    for page in pages:
+        if page.get('content_fingerprint'):
+            page_index.record_page(page['content_fingerprint'], render_params, unique_subdir_name, page)
+
+    return conversion_response(
+        unique_subdir_name, pages, metadata, host_url,
+        cache_hit=False, pdf_sha256=pdf_sha256,
+        content_fingerprint=manifest.get("content_fingerprint"),
+        reused_pages=sorted(reused)
+    )
+
+def page_image_path(page, output_dir):
+    """Image sent to the model for a page: its llm rendition, else the archive PNG"""
+    return os.path.join(output_dir, page['renditions'].get('llm', page['filename']))
+
+def extract_pdf_forms(pdf_path, pdf_sha256, filename, host_url, job=None, options=None):
+    """Convert the PDF and have the model read each page as soon as it is written.
+
+    Pages go to the model straight from disk, at most EXTRACTION_CONCURRENCY
+    at a time per server process, while later pages are still rendering;
+    blank pages are skipped. The conversion result gains an "extraction"
+    object with the merged form, the per-page results and any failed pages.
+    """
+    extraction = options['extraction']
+    extractor = PageExtractor(
+        extraction['prompt'], extraction['model'], on_result=job.page_extracted if job else None,
+        render_params=make_render_params(options)
+    )
 
+    def submit_page(page, output_dir):
+        if page['filename'] and not page.get('blank'):
+            extractor.submit(page['page_number'], page_image_path(page, output_dir), page.get('content_fingerprint'))
+
+    result = convert_pdf_to_pngs(pdf_path, pdf_sha256, filename, host_url, job, options, on_page=submit_page)
+    result["extraction"] = extractor.finish()
+    return result
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds the maximum size of {config.MAX_UPLOAD_BYTES} bytes."}), 413
+
+@app.errorhandler(QueueFullError)
+def conversion_queue_full(e):
+    return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+
+@app.errorhandler(ShuttingDownError)
+def conversion_shutting_down(e):
+    return jsonify({"error": str(e)}), 503, {"Retry-After": str(config.DEFAULT_RETRY_AFTER_SECONDS)}
+
+def submit_conversion_job(file, options, convert=convert_pdf_to_pngs):
+    """Take over the spooled upload and queue its conversion on the worker pool"""
+    pdf_path, pdf_sha256 = spool_upload(file)
+    try:
+        return submit_stored_conversion(
+            pdf_path, pdf_sha256, file.filename, options, convert, cleanup=lambda: os.remove(pdf_path)
+        )
+    except Exception:
+        os.remove(pdf_path)
+        raise
+
+def submit_stored_conversion(pdf_path, pdf_sha256, filename, options, convert=convert_pdf_to_pngs, cleanup=None):
+    """Queue the conversion of a PDF already on disk; cleanup() runs once the job has finished with it"""
+    host_url = request.host_url
+
+    def work(job):
         try:
-            pdf_bytes = file.read()
-            
-            # Extract and print metadata
-            metadata = extract_pdf_metadata(pdf_bytes)
-            
-            images = convert_from_bytes(
-                pdf_bytes,
-                dpi=200,
-                fmt='png',
-                thread_count=4,
-                poppler_path=POPPLER_PATH
-            )
+            return convert(pdf_path, pdf_sha256, filename, host_url, job, options)
+        finally:
+            if cleanup:
+                cleanup()
 
-            if not images:
-                return jsonify({"error": "Could not convert PDF to images. The PDF might be empty or corrupted."}), 500
+    return job_manager.submit(filename, work)
 
-            saved_file_paths = []
-            saved_file_urls = []
+def job_response(job):
+    """Job state plus the URLs a client needs to follow it"""
+    response = job.to_dict()
+    response["status_url"] = f"/conversion/jobs/{job.job_id}"
+    response["events_url"] = f"/conversion/jobs/{job.job_id}/events"
+    return response
 
-            for i, image in enumerate(images):
-                output_filename = f"{original_filename_base}_page_{i + 1}.png"
-                output_filepath = os.path.join(output_dir_for_this_pdf, output_filename)
+@app.route('/conversion/pdf-to-png-save', methods=['POST'])
+def pdf_to_png_save():
+    # Refuse saturated requests before the upload body is parsed
+    job_manager.check_capacity()
+    file, error_response = validate_pdf_upload()
+    if error_response:
+        return error_response
+    try:
+        options = parse_conversion_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-                image.save(output_filepath, 'PNG')
-                saved_file_paths.append(output_filepath)
+    # Thin synchronous wrapper over the job API
+    job = submit_conversion_job(file, options)
+    job.wait()
 
-                file_url = f"/conversion/generated_images/{unique_subdir_name}/{output_filename}"
-                saved_file_urls.append(request.host_url.rstrip('/') + file_url)
+    if job.status == JOB_FAILED:
+        if isinstance(job.exception, EmptyConversionError):
+            return jsonify({"error": job.error}), 500
+        app.logger.error(f"Error during PDF conversion and save: {job.error}")
+        return jsonify({"error": "Failed to convert PDF and save images.", "message": job.error}), 500
 
-            return jsonify({
-                "message": f"Successfully converted PDF to {len(saved_file_paths)} PNG images.",
-                "saved_files_count": len(saved_file_paths),
-                "output_directory_on_server": output_dir_for_this_pdf,
-                "saved_file_paths_on_server": saved_file_paths,
-                "accessible_urls": saved_file_urls,
-                "metadata": metadata
-            }), 200
+    return jsonify(job.result), 200
 
-        except Exception as e:
-            app.logger.error(f"Error during PDF conversion and save: {e}")
-            return jsonify({"error": "Failed to convert PDF and save images.", "message": str(e)}), 500
-    else:
+SHA256_HEX = re.compile(r'[0-9a-f]{64}')
+
+@app.route('/conversion/pdf-precheck', methods=['POST'])
+def pdf_precheck():
+    """Look up a finished conversion by the PDF's SHA-256 (and size) before uploading it.
+
+    Takes the same conversion options as /conversion/pdf-to-png-save. On a hit
+    the full conversion result comes back with 200 and the upload can be
+    skipped; a 404 with "upload_required" means the PDF has to be sent.
+    """
+    if not config.UPLOAD_PRECHECK_ENABLED:
+        return jsonify({"error": "Upload pre-check is disabled.", "upload_required": True}), 404
+
+    pdf_sha256 = (request.form.get('sha256') or '').strip().lower()
+    if not SHA256_HEX.fullmatch(pdf_sha256):
+        return jsonify({"error": "sha256 must be the 64 hex digit SHA-256 of the PDF."}), 400
+    size = request.form.get('size')
+    try:
+        size = int(size) if size is not None else None
+        options = parse_conversion_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    manifest = None
+    cache_key = make_cache_key(pdf_sha256, make_render_params(options))
+    if config.CACHE_ENABLED:
+        manifest = conversion_cache.lookup(cache_key)
+    # Entries from before sizes were recorded are matched on the hash alone
+    if manifest and size is not None and manifest.get('pdf_size_bytes', size) != size:
+        manifest = None
+    metrics.cache_requests.inc(cache='precheck', result='hit' if manifest else 'miss')
+    if not manifest:
+        return jsonify({
+            "error": "No conversion of this PDF with these options. Upload the file.",
+            "upload_required": True,
+            "pdf_sha256": pdf_sha256
+        }), 404
+
+    response = cached_conversion_response(cache_key, manifest, request.host_url, pdf_sha256)
+    response["upload_required"] = False
+    return jsonify(response), 200
+
+@app.route('/conversion/jobs', methods=['POST'])
+def create_conversion_job():
+    """Queue a PDF conversion and return its job id immediately"""
+    # Refuse saturated requests before the upload body is parsed
+    job_manager.check_capacity()
+    file, error_response = validate_pdf_upload()
+    if error_response:
+        return error_response
+    try:
+        options = parse_conversion_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job = submit_conversion_job(file, options)
+    response = job_response(job)
+    return jsonify(response), 202, {"Location": response["status_url"]}
+
+@app.errorhandler(UploadNotFoundError)
+def upload_not_found(e):
+    return jsonify({"error": str(e)}), 404
+
+@app.errorhandler(UploadConflictError)
+def upload_conflict(e):
+    body = {"error": str(e)}
+    if e.missing is not None:
+        body["missing"] = e.missing
+    return jsonify(body), 409
+
+def upload_status_response(status):
+    status = dict(status)
+    status["upload_url"] = f"/conversion/uploads/{status['upload_id']}"
+    status["finalize_url"] = f"/conversion/uploads/{status['upload_id']}/finalize"
+    return status
+
+@app.route('/conversion/uploads', methods=['POST'])
+def create_chunked_upload():
+    """Start a resumable upload from the PDF's filename, size and SHA-256"""
+    filename = request.form.get('filename', '')
+    if not allowed_file(filename):
         return jsonify({"error": "Invalid file type. Only PDF files are allowed."}), 400
+    pdf_sha256 = (request.form.get('sha256') or '').strip().lower()
+    if not SHA256_HEX.fullmatch(pdf_sha256):
+        return jsonify({"error": "sha256 must be the 64 hex digit SHA-256 of the PDF."}), 400
+    try:
+        status = chunked_uploads.create(filename, int(request.form.get('size', 0)), pdf_sha256)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = upload_status_response(status)
+    return jsonify(response), 201, {"Location": response["upload_url"]}
+
+@app.route('/conversion/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """Received and missing byte ranges, so an interrupted client knows what to resend"""
+    return jsonify(upload_status_response(chunked_uploads.status(upload_id))), 200
+
+@app.route('/conversion/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Write the request body at the offset given by Content-Range (or ?offset=)"""
+    length = request.content_length
+    if length is None:
+        return jsonify({"error": "Chunks need a Content-Length."}), 411
+    try:
+        if request.headers.get('Content-Range'):
+            offset, end, _ = parse_content_range(request.headers['Content-Range'])
+            if end - offset != length:
+                raise ValueError("Content-Range does not match Content-Length.")
+        else:
+            offset = int(request.args.get('offset', 0))
+        with metrics.upload_receive_seconds.time(kind='chunk'):
+            status = chunked_uploads.write_chunk(
+                upload_id, offset, length, request.stream, request.headers.get('X-Chunk-Sha256')
+            )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(upload_status_response(status)), 200
+
+@app.route('/conversion/uploads/<upload_id>', methods=['DELETE'])
+def delete_chunked_upload(upload_id):
+    chunked_uploads.discard(upload_id)
+    return '', 204
+
+@app.route('/conversion/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    """Verify the assembled PDF against its SHA-256 and queue its conversion as a job"""
+    job_manager.check_capacity()
+    try:
+        options = parse_conversion_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    pdf_path, filename, pdf_sha256 = chunked_uploads.finalize(upload_id)
+    try:
+        job = submit_stored_conversion(
+            pdf_path, pdf_sha256, filename, options, cleanup=lambda: chunked_uploads.release(upload_id)
+        )
+    except Exception:
+        # Keep the chunks so the client can finalize again once there is capacity
+        chunked_uploads.reopen(upload_id)
+        raise
+    response = job_response(job)
+    return jsonify(response), 202, {"Location": response["status_url"]}
+
+@app.route('/conversion/jobs/<job_id>', methods=['GET'])
+def get_conversion_job(job_id):
+    """Poll the progress of a conversion job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Conversion job not found."}), 404
+    return jsonify(job_response(job)), 200
+
+@app.route('/conversion/jobs/<job_id>/events', methods=['GET'])
+def conversion_job_events(job_id):
+    """Server-Sent Events stream of per-page progress for a conversion job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Conversion job not found."}), 404
+
+    def generate():
+        seen_version = None
+        while True:
+            if seen_version is None:
+                version = job.version
+            else:
+                version = job.wait_for_update(seen_version, timeout=config.JOB_EVENTS_KEEPALIVE_SECONDS)
+            if version == seen_version:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            seen_version = version
+
+            state = job_response(job)
+            event = state["status"] if state["status"] in (JOB_COMPLETED, JOB_FAILED) else "progress"
+            yield f"event: {event}\ndata: {json.dumps(state)}\n\n"
+            if event != "progress":
+                return
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route('/conversion/pdf-to-png-stream', methods=['POST'])
+def pdf_to_png_stream():
+    """Convert a PDF, streaming one NDJSON line per page the moment it is written.
+
+    Lines carry an "event" of "job" (first), "page", "keep-alive", and
+    finally "completed" with the full conversion result or "failed".
+    """
+    # Refuse saturated requests before the upload body is parsed
+    job_manager.check_capacity()
+    file, error_response = validate_pdf_upload()
+    if error_response:
+        return error_response
+    try:
+        options = parse_conversion_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job = submit_conversion_job(file, options)
+    return ndjson_job_stream(job)
+
+@app.route('/conversion/pdf-extract', methods=['POST'])
+def pdf_extract():
+    """Convert a PDF and extract its form fields with the vision model, streamed as NDJSON.
+
+    Lines follow /conversion/pdf-to-png-stream, plus an "extraction" line per
+    page as the model answers; the "completed" result carries "extraction".
+    Optional form fields "prompt" and "model" override the server defaults.
+    """
+    # Refuse saturated requests before the upload body is parsed
+    job_manager.check_capacity()
+    file, error_response = validate_pdf_upload()
+    if error_response:
+        return error_response
+    try:
+        options = parse_conversion_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # The model always reads the small grayscale rendition
+    options["renditions"] = tuple(dict.fromkeys(options["renditions"] + ('llm',)))
+    options["extraction"] = {"prompt": request.form.get('prompt'), "model": request.form.get('model')}
+
+    job = submit_conversion_job(file, options, convert=extract_pdf_forms)
+    return ndjson_job_stream(job)
+
+def ndjson_job_stream(job):
+    """Follow a job as NDJSON: "job", then "page"/"extraction" lines as they happen, then the outcome"""
+    def line(event, **fields):
+        return json.dumps({"event": event, **fields}) + "\n"
+
+    def generate():
+        yield line("job", job_id=job.job_id, status_url=f"/conversion/jobs/{job.job_id}")
+        pages_sent = 0
+        extractions_sent = 0
+        seen_version = None
+        while True:
+            version = job.wait_for_update(seen_version, timeout=config.JOB_EVENTS_KEEPALIVE_SECONDS)
+            if version == seen_version:
+                yield line("keep-alive")
+                continue
+            seen_version = version
+
+            state = job.to_dict()
+            for page in state["pages"][pages_sent:]:
+                yield line("page", **page)
+            pages_sent = len(state["pages"])
+            for extraction in state["extractions"][extractions_sent:]:
+                yield line("extraction", **extraction)
+            extractions_sent = len(state["extractions"])
+            if state["status"] == JOB_COMPLETED:
+                yield line("completed", result=state["result"])
+                return
+            if state["status"] == JOB_FAILED:
+                yield line("failed", error=state["error"])
+                return
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.route('/conversion/generated_images/<path:subpath_to_file>')
 def serve_generated_image(subpath_to_file):
-    return send_from_directory(GENERATED_IMAGES_DIR, subpath_to_file)
+    """Serve a generated page with validators; pages never change once written"""
+    if os.path.splitext(subpath_to_file)[1].lstrip('.').lower() not in SERVED_IMAGE_EXTENSIONS:
+        abort(404)
+    # Only <conversion>/<file>; in-progress renders start with a dot
+    parts = subpath_to_file.replace('\\', '/').split('/')
+    if len(parts) != 2 or any(part.startswith('.') for part in parts):
+        abort(404)
+
+    # Strong ETag from the hash recorded at conversion time; werkzeug's own otherwise
+    content_hash = stored_file_hash(GENERATED_IMAGES_DIR, subpath_to_file)
+    response = send_from_directory(
+        GENERATED_IMAGES_DIR,
+        subpath_to_file,
+        etag=content_hash or True,
+        conditional=True,
+        max_age=config.IMAGE_CACHE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/conversion/metrics', methods=['GET'])
+def conversion_metrics():
+    """Conversion internals of every server process in the Prometheus text format"""
+    if not config.METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/conversion/health-check', methods=['GET'])
 def index():
@@ -264,11 +911,39 @@ def index():
     
     <h2>Option 2: Save Images on Server & Get Info (JSON Response)</h2>
     <p>Send a POST request to <code>/conversion/pdf-to-png-save</code> with a PDF file (key <code>pdfFile</code>).</p>
-    <p>PNG images will be saved in the '{GENERATED_IMAGES_DIR}' directory on the server within a unique subfolder.</p>
+    <p>PNG images will be saved in the '{GENERATED_IMAGES_DIR}' directory on the server within a unique subfolder. Subfolders are removed {config.RETENTION_TTL_SECONDS // 86400} days after they were created, however often their pages are viewed, and the least recently converted ones go first once the directory exceeds {config.CACHE_MAX_BYTES:,} bytes, so keep your own copy of pages you need long term.</p>
+    <p>Optional form field <code>renditions</code> (comma-separated: <code>llm</code>, <code>preview</code>) adds downscaled copies of every page, returned under <code>renditions</code>. Default: <code>{config.DEFAULT_RENDITIONS or 'none'}</code>.</p>
+    <p>Pages are rendered at {config.RENDER_DPI} DPI unless that would exceed {config.RENDER_MAX_PIXELS:,} pixels (large plans, long receipts); those get a lower DPI, never below {config.RENDER_MIN_DPI}. Each page reports the <code>dpi</code> it was rendered at.</p>
     
     <h2>Option 3: Extract PDF Metadata (JSON Response)</h2>
     <p>Send a POST request to <code>/conversion/pdf-metadata</code> with a PDF file (key <code>pdfFile</code>).</p>
     <p>Returns metadata including title, author, creation date, modification date, and more.</p>
+    <p>For bulk work, POST many PDFs (repeat the key <code>pdfFile</code>) and/or zip files (key <code>archive</code>) to <code>/conversion/pdf-metadata/batch</code>. Files are processed in parallel and the response streams one NDJSON line per PDF with its <code>pdf_sha256</code>, <code>metadata</code> and metadata <code>hashes</code>.</p>
+    
+    <p>Fillable PDFs can skip rendering entirely: POST to <code>/conversion/form-fields</code> (key <code>pdfFile</code>) to get the AcroForm fields (names, types, options, checkbox states, widget rectangles and page numbers) in the form editor's <code>{{forms: [{{title, fields}}]}}</code> shape. <code>has_acroform</code> is false when the PDF has none.</p>
+    
+    <p>Born-digital PDFs can be read as text instead of images: POST to <code>/conversion/text-layer</code> (key <code>pdfFile</code>, optional <code>words=true</code>) for each page's text and line bounding boxes. <code>image_pages</code> lists the pages (typically scans) that still need rendering.</p>
+    
+    <p>Conversions detect blank and near-blank pages (such as empty scanned backsides) and list them in <code>blank_pages</code>. Send <code>blank_pages=exclude</code> to leave them out of <code>accessible_urls</code> and renditions entirely; the default <code>keep</code> only flags them.</p>
+    
+    <p>Send <code>crop=true</code> (and optionally <code>crop_padding</code> in points, default {config.CROP_PADDING_POINTS:g}) to trim each page to its content. Cropped pages carry a <code>crop</code> object with the crop box in pixels and PDF points, so positions on the cropped image can be mapped back to the page.</p>
+    
+    <p>To avoid re-uploading a document the server already converted, first POST its <code>sha256</code> (and <code>size</code> in bytes) with the same options to <code>/conversion/pdf-precheck</code>. A 200 returns the existing pages and metadata; a 404 with <code>"upload_required": true</code> means the PDF must be uploaded.</p>
+    
+    <p>Every converted page carries a <code>content_fingerprint</code> (hash of what the page is drawn from, independent of document metadata and re-saving) and, whenever its pixels are read for blank detection, cropping, renditions or colour depth (the default), a <code>phash</code> (64-bit difference hash of the raster, for clients to compare). Pages whose content was converted before with the same options are reused instead of rendered again and listed in <code>reused_pages</code>; Option 6 likewise reuses the model's answer for pages it has already read.</p>
+    
+    <h2>Option 4: Background Conversion Job (JSON + Server-Sent Events)</h2>
+    <p>Send a POST request to <code>/conversion/jobs</code> with a PDF file (key <code>pdfFile</code>). The response (202) carries a <code>job_id</code> straight away.</p>
+    <p>Poll <code>/conversion/jobs/&lt;job_id&gt;</code> or subscribe to <code>/conversion/jobs/&lt;job_id&gt;/events</code> for per-page progress and the final <code>accessible_urls</code>.</p>
+    
+    <p>Very large PDFs can be uploaded in resumable chunks: POST <code>filename</code>, <code>size</code> and <code>sha256</code> to <code>/conversion/uploads</code>, then PUT each chunk (at most {config.CHUNKED_UPLOAD_MAX_CHUNK_BYTES} bytes, any order, in parallel) to the returned <code>upload_url</code> with a <code>Content-Range: bytes start-end/size</code> header and optionally <code>X-Chunk-Sha256</code>. GET the upload to see its <code>missing</code> ranges after an interruption. POST the conversion options to <code>finalize_url</code> once nothing is missing; the assembled file is checked against <code>sha256</code> and queued as a job (202, as above).</p>
+    
+    <h2>Option 5: Streaming Conversion (NDJSON)</h2>
+    <p>Send a POST request to <code>/conversion/pdf-to-png-stream</code> with the same fields as Option 2. The response streams one JSON line per page (<code>"event": "page"</code> with its <code>url</code>, <code>width</code>, <code>height</code>, <code>sha256</code> and renditions) as soon as that page is written, then a final <code>completed</code> line with the full result.</p>
+    
+    <h2>Option 6: Server-side Form Extraction (NDJSON)</h2>
+    <p>Send a POST request to <code>/conversion/pdf-extract</code> with the same fields as Option 2, plus optional <code>prompt</code> and <code>model</code> (default <code>{config.OLLAMA_MODEL}</code>). Each page's <code>llm</code> rendition is sent from the server straight to <code>{config.OLLAMA_BASE_URL}/api/generate</code>, at most {config.EXTRACTION_CONCURRENCY} pages at a time, while later pages are still rendering.</p>
+    <p>The stream carries the same lines as Option 5 plus one <code>"event": "extraction"</code> line per page with that page's <code>forms</code> (or <code>error</code>). The final <code>completed</code> result has an <code>extraction</code> object whose <code>forms</code> merge all pages into one <code>{{forms: [{{title, fields}}]}}</code> description, each field tagged with its <code>page_number</code>.</p>
     
     <h3>Example using cURL for saving on server:</h3>
     <pre>
@@ -285,7 +960,10 @@ curl -X POST \\
     </pre>
     
     <p>If you enable the '/generated_images/' route, you can access saved images via URLs provided in the response.</p>
+
+    <p>Render and encode times per page, upload receive times, cache hit rates, queue depth and errors are exported for Prometheus at <code>/conversion/metrics</code> (summed over every server process; disable with <code>METRICS_ENABLED=false</code>).</p>
     """
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=PORT, debug=True)
\ No newline at end of file
+    # Development server only; containers run gunicorn (see gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=PORT, debug=os.getenv('FLASK_DEBUG', '0') == '1')
\ No newline at end of file
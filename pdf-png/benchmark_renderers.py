@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Compare the render backends on a corpus of PDFs, to pick RENDER_BACKEND per workload
+
+    python benchmark_renderers.py                      # every PDF under ../data
+    python benchmark_renderers.py --dpi 150 --repeat 5 forms/ scan.pdf
+    python benchmark_renderers.py --json > results.json
+
+For each PDF and backend it reports the best of --repeat runs of:
+  render       rasterizing every page (what the backend itself costs)
+  first page   time until the first page is on disk (what a streaming client waits for)
+  convert      the full render, encode and write pipeline used by the API
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from config import config
+from render_backends import BACKENDS, get_backend
+from renderer import render_pages, render_and_save
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+def find_pdfs(paths):
+    """PDF files named in paths, expanding directories recursively"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, '**', '*.pdf'), recursive=True)))
+        else:
+            found.append(path)
+    return found
+
+def time_render(pdf_path, backend, dpi):
+    started = time.perf_counter()
+    for _, image in render_pages(pdf_path, dpi=dpi, backend=backend):
+        image.close()
+    return time.perf_counter() - started
+
+def time_convert(pdf_path, backend, dpi, processes):
+    """(seconds to the first page, seconds for all pages) through render_and_save"""
+    output_dir = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        started = time.perf_counter()
+        first_page = None
+        for _ in render_and_save(pdf_path, output_dir, 'page', dpi=dpi, processes=processes, backend=backend):
+            if first_page is None:
+                first_page = time.perf_counter() - started
+        return first_page, time.perf_counter() - started
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+def benchmark_file(pdf_path, backend, dpi=None, repeat=3, processes=1):
+    """Best-of-repeat timings of one backend on one PDF"""
+    dpi = dpi or config.RENDER_DPI
+    result = {"file": pdf_path, "backend": backend, "dpi": dpi}
+    try:
+        result["pages"] = get_backend(backend).page_count(pdf_path)
+        renders, firsts, converts = [], [], []
+        for _ in range(max(1, repeat)):
+            renders.append(time_render(pdf_path, backend, dpi))
+            first_page, convert = time_convert(pdf_path, backend, dpi, processes)
+            firsts.append(first_page)
+            converts.append(convert)
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+        return result
+    result.update({
+        "render_seconds": min(renders),
+        "first_page_seconds": min(firsts),
+        "convert_seconds": min(converts),
+        "pages_per_second": result["pages"] / min(converts)
+    })
+    return result
+
+def available_backends(names):
+    """The named backends that can run here, printing why the others cannot"""
+    available = []
+    for name in names:
+        try:
+            get_backend(name)
+        except (ImportError, ValueError) as e:
+            print(f"Skipping {name}: {e}", file=sys.stderr)
+            continue
+        available.append(name)
+    return available
+
+def summarize(results):
+    """Per backend totals over the files every backend converted, fastest first"""
+    by_file = {}
+    for result in results:
+        by_file.setdefault(result["file"], []).append(result)
+    backends = sorted({result["backend"] for result in results})
+    common = [runs for runs in by_file.values() if len(runs) == len(backends) and not any('error' in r for r in runs)]
+    totals = {backend: {"files": 0, "wins": 0, "render_seconds": 0.0, "first_page_seconds": 0.0,
+                        "convert_seconds": 0.0} for backend in backends}
+    for runs in common:
+        fastest = min(runs, key=lambda run: run["convert_seconds"])
+        totals[fastest["backend"]]["wins"] += 1
+        for run in runs:
+            total = totals[run["backend"]]
+            total["files"] += 1
+            for key in ("render_seconds", "first_page_seconds", "convert_seconds"):
+                total[key] += run[key]
+    return sorted(({"backend": backend, **total} for backend, total in totals.items()),
+                  key=lambda total: total["convert_seconds"])
+
+def print_report(results, summary):
+    print(f"{'file':<48} {'backend':<8} {'pages':>5} {'render':>8} {'first':>8} {'convert':>8} {'pages/s':>8}")
+    for result in results:
+        name = os.path.basename(result["file"])[:48]
+        if 'error' in result:
+            print(f"{name:<48} {result['backend']:<8} failed: {result['error']}")
+            continue
+        print(f"{name:<48} {result['backend']:<8} {result['pages']:>5} {result['render_seconds']:>8.3f} "
+              f"{result['first_page_seconds']:>8.3f} {result['convert_seconds']:>8.3f} "
+              f"{result['pages_per_second']:>8.2f}")
+    print()
+    for total in summary:
+        print(f"{total['backend']:<8} convert {total['convert_seconds']:.3f}s over {total['files']} files, "
+              f"fastest on {total['wins']}")
+    if len(summary) > 1 and summary[0]["files"]:
+        print(f"Fastest overall: RENDER_BACKEND={summary[0]['backend']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the PDF render backends on a corpus")
+    parser.add_argument('paths', nargs='*', default=[DATA_DIR], help="PDF files or directories (default: ../data)")
+    parser.add_argument('--backends', default=','.join(BACKENDS), help="comma-separated backends to compare")
+    parser.add_argument('--dpi', type=int, default=config.RENDER_DPI)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per file; the fastest counts")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="render processes for the convert timing (0 = one per core)")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    backends = available_backends([name.strip() for name in args.backends.split(',') if name.strip()])
+    pdf_paths = find_pdfs(args.paths)
+    if not backends or not pdf_paths:
+        parser.error("nothing to benchmark")
+
+    results = [
+        benchmark_file(pdf_path, backend, args.dpi, args.repeat, args.processes)
+        for pdf_path in pdf_paths
+        for backend in backends
+    ]
+    summary = summarize(results)
+    if args.json:
+        print(json.dumps({"results": results, "summary": summary}, indent=2))
+    else:
+        print_report(results, summary)
+
+if __name__ == "__main__":
+    main()
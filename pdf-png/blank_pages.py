@@ -0,0 +1,59 @@
+import numpy as np
+from config import config
+
+# Blank and near-blank page detection on the rendered raster. Scanned forms
+# carry empty backsides and separator sheets; a page counts as blank when
+# it is light paper and almost none of its pixels are clearly darker than it.
+
+BLANK_PAGE_MODES = ('keep', 'exclude')
+
+def parse_blank_page_mode(value):
+    """'keep' flags blank pages, 'exclude' also leaves them out of the output; raises ValueError otherwise"""
+    mode = (value or config.DEFAULT_BLANK_PAGES).strip().lower()
+    if mode not in BLANK_PAGE_MODES:
+        raise ValueError(f"Unknown blank_pages mode: {value}. Available: {', '.join(BLANK_PAGE_MODES)}")
+    return mode
+
+def grayscale_pixels(image):
+    return np.asarray(image.convert('L') if image.mode != 'L' else image, dtype=np.uint8)
+
+def margin_slices(shape):
+    """Row and column slices of the page without the scanner margins"""
+    height, width = shape
+    margin_y = int(height * config.BLANK_PAGE_MARGIN_RATIO)
+    margin_x = int(width * config.BLANK_PAGE_MARGIN_RATIO)
+    return slice(margin_y, height - margin_y or None), slice(margin_x, width - margin_x or None)
+
+def ink_threshold(histogram, pixel_count):
+    """(paper level, grey level below which a pixel counts as ink) from a 256-bin histogram"""
+    # Paper is the brightest large population; the 90th percentile holds up on grey or yellowed scans
+    paper_level = int(np.searchsorted(np.cumsum(histogram), 0.9 * pixel_count))
+    return paper_level, max(0, paper_level - config.BLANK_PAGE_INK_DELTA)
+
+def page_ink_stats(image):
+    """Paper level, ink coverage and spread of the grayscale page, ignoring the scanner margins"""
+    pixels = grayscale_pixels(image)
+    pixels = pixels[margin_slices(pixels.shape)]
+    if pixels.size == 0:
+        return {"paper_level": 255, "ink_ratio": 0.0, "std": 0.0}
+
+    histogram = np.bincount(pixels.ravel(), minlength=256)
+    paper_level, threshold = ink_threshold(histogram, pixels.size)
+    ink_ratio = float(histogram[:threshold].sum()) / pixels.size
+
+    levels = np.arange(256)
+    mean = float(np.dot(histogram, levels)) / pixels.size
+    std = float(np.sqrt(np.dot(histogram, (levels - mean) ** 2) / pixels.size))
+    return {"paper_level": paper_level, "ink_ratio": round(ink_ratio, 6), "std": round(std, 2)}
+
+def is_blank_page(image):
+    """Return (blank, stats) for a rendered page"""
+    stats = page_ink_stats(image)
+    # The paper level of a dark or inverted page is its dark ground, against which
+    # nothing is darker; such pages, and pages with large mid-grey areas, are content
+    blank = (
+        stats["paper_level"] >= config.BLANK_PAGE_MIN_PAPER_LEVEL
+        and stats["ink_ratio"] <= config.BLANK_PAGE_MAX_INK_RATIO
+        and stats["std"] <= config.BLANK_PAGE_MAX_STD
+    )
+    return blank, stats
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+from config import config
+from conversion_cache import hash_file
+
+# Resumable uploads for PDFs too large to send in one request. The client
+# creates an upload with the file's size and SHA-256, PUTs chunks at byte
+# offsets in any order (in parallel, and again after an interruption), then
+# finalizes it. Everything lives on disk under CHUNKED_UPLOAD_DIR so any
+# server process can take any chunk:
+#
+#   <upload_id>/state.json        filename, size and expected hash
+#   <upload_id>/data              the file, preallocated and written in place
+#   <upload_id>/chunks/<start>-<end>   one marker per chunk fully written
+#   <upload_id>/finalized         present once the upload has been handed on; holds
+#                                 the pid of the process converting it
+
+STATE_FILENAME = 'state.json'
+DATA_FILENAME = 'data'
+CHUNKS_DIRNAME = 'chunks'
+FINALIZED_FILENAME = 'finalized'
+
+READ_SIZE = 1024 * 1024
+
+class UploadNotFoundError(Exception):
+    """No upload with this id (never created, expired or discarded)"""
+
+class UploadConflictError(Exception):
+    """The upload cannot take this request in its current state"""
+
+    def __init__(self, message, missing=None):
+        super().__init__(message)
+        self.missing = missing
+
+def merge_ranges(ranges):
+    """Sorted, non-overlapping [start, end) ranges covering the same bytes"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def missing_ranges(received, size):
+    """The [start, end) gaps in 0..size not covered by the merged received ranges"""
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+def parse_content_range(value):
+    """(start, end exclusive, total) from a 'bytes start-end/total' header; raises ValueError"""
+    unit, _, spec = (value or '').partition(' ')
+    span, _, total = spec.partition('/')
+    start, _, last = span.partition('-')
+    if unit != 'bytes' or not start or not last:
+        raise ValueError("Content-Range must look like 'bytes <start>-<end>/<total>'.")
+    start, end = int(start), int(last) + 1
+    if end <= start:
+        raise ValueError("Content-Range end must not be before its start.")
+    return start, end, None if total in ('', '*') else int(total)
+
+class ChunkedUploadStore:
+    """Uploads assembled on disk from chunks, shared by every server process"""
+
+    def __init__(self, root_dir=None, max_bytes=None, max_chunk_bytes=None, ttl_seconds=None):
+        self.root_dir = root_dir or config.CHUNKED_UPLOAD_DIR
+        self.max_bytes = max_bytes or config.CHUNKED_UPLOAD_MAX_BYTES
+        self.max_chunk_bytes = max_chunk_bytes or config.CHUNKED_UPLOAD_MAX_CHUNK_BYTES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.CHUNKED_UPLOAD_TTL_SECONDS
+
+    def _upload_dir(self, upload_id):
+        try:
+            # Only ids we issued map to a directory; anything else could escape root_dir
+            if uuid.UUID(upload_id).hex != upload_id:
+                raise ValueError
+        except ValueError:
+            raise UploadNotFoundError(f"Upload {upload_id} not found.")
+        return os.path.join(self.root_dir, upload_id)
+
+    def _load_state(self, upload_id):
+        upload_dir = self._upload_dir(upload_id)
+        try:
+            with open(os.path.join(upload_dir, STATE_FILENAME)) as f:
+                return upload_dir, json.load(f)
+        except (OSError, ValueError):
+            raise UploadNotFoundError(f"Upload {upload_id} not found.")
+
+    def create(self, filename, size, sha256):
+        """Start an upload of size bytes whose content must hash to sha256"""
+        if size <= 0:
+            raise ValueError("size must be a positive number of bytes.")
+        if size > self.max_bytes:
+            raise ValueError(f"size exceeds the maximum upload size of {self.max_bytes} bytes.")
+        self.prune()
+
+        upload_id = uuid.uuid4().hex
+        upload_dir = os.path.join(self.root_dir, upload_id)
+        os.makedirs(os.path.join(upload_dir, CHUNKS_DIRNAME))
+        with open(os.path.join(upload_dir, DATA_FILENAME), 'wb') as f:
+            # Sparse file of the final size, so chunks can be written at any offset
+            f.truncate(size)
+        state = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "size": size,
+            "sha256": sha256,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        with open(os.path.join(upload_dir, STATE_FILENAME), 'w') as f:
+            json.dump(state, f)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """State of the upload with its received and missing byte ranges"""
+        upload_dir, state = self._load_state(upload_id)
+        ranges = []
+        for name in os.listdir(os.path.join(upload_dir, CHUNKS_DIRNAME)):
+            start, _, end = name.partition('-')
+            ranges.append((int(start), int(end)))
+        received = merge_ranges(ranges)
+        state.update({
+            "received": received,
+            "received_bytes": sum(end - start for start, end in received),
+            "missing": missing_ranges(received, state["size"]),
+            "finalized": os.path.exists(os.path.join(upload_dir, FINALIZED_FILENAME)),
+            "max_chunk_bytes": self.max_chunk_bytes
+        })
+        return state
+
+    def write_chunk(self, upload_id, offset, length, stream, chunk_sha256=None):
+        """Write length bytes from stream at offset; the chunk counts only once it is complete and verified"""
+        upload_dir, state = self._load_state(upload_id)
+        if os.path.exists(os.path.join(upload_dir, FINALIZED_FILENAME)):
+            raise UploadConflictError("Upload is already finalized.")
+        if length <= 0 or length > self.max_chunk_bytes:
+            raise ValueError(f"Chunks must be between 1 and {self.max_chunk_bytes} bytes.")
+        if offset < 0 or offset + length > state["size"]:
+            raise ValueError(f"Chunk {offset}-{offset + length} lies outside the {state['size']} byte upload.")
+
+        digest = hashlib.sha256() if chunk_sha256 else None
+        written = 0
+        fd = os.open(os.path.join(upload_dir, DATA_FILENAME), os.O_WRONLY)
+        try:
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    break
+                os.pwrite(fd, data, offset + written)
+                if digest:
+                    digest.update(data)
+                written += len(data)
+        finally:
+            os.close(fd)
+
+        if written != length:
+            raise ValueError(f"Chunk ended after {written} of {length} bytes.")
+        if digest and digest.hexdigest() != chunk_sha256.lower():
+            raise ValueError("Chunk does not match its SHA-256; send it again.")
+        open(os.path.join(upload_dir, CHUNKS_DIRNAME, f"{offset}-{offset + length}"), 'w').close()
+        # Activity keeps the upload from expiring
+        os.utime(os.path.join(upload_dir, STATE_FILENAME))
+        return self.status(upload_id)
+
+    def finalize(self, upload_id):
+        """Claim a complete upload and verify its hash; returns (data path, filename, sha256).
+
+        The caller owns the data until it calls release(), or reopen() to give it back.
+        """
+        status = self.status(upload_id)
+        if status["missing"]:
+            raise UploadConflictError("Upload is incomplete.", missing=status["missing"])
+        upload_dir = self._upload_dir(upload_id)
+        try:
+            fd = os.open(os.path.join(upload_dir, FINALIZED_FILENAME), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            raise UploadConflictError("Upload is already finalized.")
+        try:
+            os.write(fd, str(os.getpid()).encode())
+        finally:
+            os.close(fd)
+
+        data_path = os.path.join(upload_dir, DATA_FILENAME)
+        sha256 = hash_file(data_path)
+        if sha256 != status["sha256"]:
+            # Some chunk arrived corrupted and we cannot tell which; start over
+            shutil.rmtree(os.path.join(upload_dir, CHUNKS_DIRNAME))
+            os.makedirs(os.path.join(upload_dir, CHUNKS_DIRNAME))
+            self.reopen(upload_id)
+            raise UploadConflictError(
+                f"Assembled file hashes to {sha256}, not {status['sha256']}. Upload all chunks again.",
+                missing=[[0, status["size"]]]
+            )
+        return data_path, status["filename"], sha256
+
+    def reopen(self, upload_id):
+        """Undo finalize() so the upload can be finalized again later"""
+        marker = os.path.join(self._upload_dir(upload_id), FINALIZED_FILENAME)
+        if os.path.exists(marker):
+            os.remove(marker)
+
+    def _converting(self, upload_dir):
+        """True while the process that finalized the upload is alive to convert it"""
+        try:
+            with open(os.path.join(upload_dir, FINALIZED_FILENAME)) as f:
+                pid = int(f.read() or 0)
+        except (OSError, ValueError):
+            return False
+        if pid <= 0:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def discard(self, upload_id):
+        """Remove an upload on the client's request; finalized uploads belong to their job"""
+        upload_dir = self._upload_dir(upload_id)
+        if not os.path.isdir(upload_dir):
+            raise UploadNotFoundError(f"Upload {upload_id} not found.")
+        if self._converting(upload_dir):
+            raise UploadConflictError("Upload is being converted; it is removed once the job is done.")
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def release(self, upload_id):
+        """Remove a finalized upload once its job is done with it; never raises"""
+        try:
+            shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+        except UploadNotFoundError:
+            pass
+
+    def prune(self):
+        """Remove uploads with no activity for ttl_seconds, except those a live job is converting"""
+        if not os.path.isdir(self.root_dir):
+            return
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.root_dir):
+            upload_dir = os.path.join(self.root_dir, name)
+            try:
+                # Covers uploads whose state file is still being written
+                last_activity = os.path.getmtime(upload_dir)
+            except OSError:
+                continue
+            for marker in (STATE_FILENAME, FINALIZED_FILENAME):
+                try:
+                    last_activity = max(last_activity, os.path.getmtime(os.path.join(upload_dir, marker)))
+                except OSError:
+                    pass
+            if last_activity < cutoff and not self._converting(upload_dir):
+                print(f"Removing expired upload {name}")
+                shutil.rmtree(upload_dir, ignore_errors=True)
+
+chunked_uploads = ChunkedUploadStore()
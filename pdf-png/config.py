@@ -0,0 +1,144 @@
+import os
+import tempfile
+
+class Config:
+    # Server Configuration
+    PORT = int(os.getenv('PORT', 5001))
+    GENERATED_IMAGES_DIR = os.getenv('GENERATED_IMAGES_DIR', 'generated_pngs')
+    POPPLER_PATH = os.getenv('POPPLER_PATH') or None
+
+    # Uploads: larger request bodies are refused with 413; files are spooled here while they arrive
+    MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 100 * 1024 ** 2))
+    UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR') or None
+
+    # Resumable chunked uploads (/conversion/uploads), for PDFs too large for one request.
+    # Chunks stay under nginx's client_max_body_size; the directory is shared by all server processes
+    CHUNKED_UPLOAD_DIR = os.getenv('CHUNKED_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'pdf-png-uploads'))
+    CHUNKED_UPLOAD_MAX_BYTES = int(os.getenv('CHUNKED_UPLOAD_MAX_BYTES', 1024 ** 3))
+    CHUNKED_UPLOAD_MAX_CHUNK_BYTES = int(os.getenv('CHUNKED_UPLOAD_MAX_CHUNK_BYTES', 8 * 1024 ** 2))
+    # Uploads with no new chunk for this long are removed
+    CHUNKED_UPLOAD_TTL_SECONDS = int(os.getenv('CHUNKED_UPLOAD_TTL_SECONDS', 24 * 3600))
+
+    # Generated pages are immutable, so browsers may keep them for a year
+    IMAGE_CACHE_MAX_AGE = int(os.getenv('IMAGE_CACHE_MAX_AGE', 365 * 24 * 3600))
+
+    # Rendering Configuration
+    # Rasterizer: 'poppler' (pdftoppm subprocess) or 'pdfium' (in-process, needs pypdfium2)
+    RENDER_BACKEND = os.getenv('RENDER_BACKEND', 'poppler').lower()
+    RENDER_DPI = int(os.getenv('RENDER_DPI', 200))
+    # Pixel budget per page: pages that would exceed it at RENDER_DPI (large plans, long receipts) are
+    # rendered at a lower DPI, but not below RENDER_MIN_DPI; 0 disables the budget
+    RENDER_MAX_PIXELS = int(os.getenv('RENDER_MAX_PIXELS', 12_000_000))
+    RENDER_MIN_DPI = int(os.getenv('RENDER_MIN_DPI', 72))
+    # Number of pages decoded at once; peak memory is bounded by this, not by page count
+    RENDER_WINDOW_SIZE = int(os.getenv('RENDER_WINDOW_SIZE', 2))
+    # Let poppler write page PNGs straight to disk instead of decoding and re-encoding them in Python
+    RENDER_DIRECT_TO_DISK = os.getenv('RENDER_DIRECT_TO_DISK', 'true').lower() == 'true'
+    # Render/encode worker processes shared by all conversions; 0 = one per available core
+    RENDER_PROCESSES = int(os.getenv('RENDER_PROCESSES', 0))
+
+    # Batch Metadata: files per request, and the largest PDF accepted from inside a zip archive
+    METADATA_BATCH_MAX_FILES = int(os.getenv('METADATA_BATCH_MAX_FILES', 10000))
+    METADATA_BATCH_MAX_MEMBER_BYTES = int(os.getenv('METADATA_BATCH_MAX_MEMBER_BYTES', 200 * 1024 ** 2))
+
+    # Text Layer: pages with fewer characters, or mostly non-alphanumeric ones, are treated as scans
+    TEXT_LAYER_MIN_CHARS = int(os.getenv('TEXT_LAYER_MIN_CHARS', 20))
+    TEXT_LAYER_MIN_READABLE_RATIO = float(os.getenv('TEXT_LAYER_MIN_READABLE_RATIO', 0.5))
+    TEXT_LAYER_TIMEOUT_SECONDS = int(os.getenv('TEXT_LAYER_TIMEOUT_SECONDS', 60))
+
+    # Blank Pages: a page is blank when at most BLANK_PAGE_MAX_INK_RATIO of its pixels are
+    # BLANK_PAGE_INK_DELTA grey levels darker than the paper (margins excluded), the paper is at least
+    # BLANK_PAGE_MIN_PAPER_LEVEL bright (so dark and inverted pages never are) and the grey levels
+    # spread no more than BLANK_PAGE_MAX_STD
+    BLANK_PAGE_DETECTION = os.getenv('BLANK_PAGE_DETECTION', 'true').lower() == 'true'
+    DEFAULT_BLANK_PAGES = os.getenv('DEFAULT_BLANK_PAGES', 'keep')
+    BLANK_PAGE_MAX_INK_RATIO = float(os.getenv('BLANK_PAGE_MAX_INK_RATIO', 0.001))
+    BLANK_PAGE_INK_DELTA = int(os.getenv('BLANK_PAGE_INK_DELTA', 64))
+    BLANK_PAGE_MARGIN_RATIO = float(os.getenv('BLANK_PAGE_MARGIN_RATIO', 0.03))
+    BLANK_PAGE_MIN_PAPER_LEVEL = int(os.getenv('BLANK_PAGE_MIN_PAPER_LEVEL', 160))
+    BLANK_PAGE_MAX_STD = float(os.getenv('BLANK_PAGE_MAX_STD', 24))
+
+    # Content Cropping (off by default): padding kept around the ink, and ink pixels a row or column needs
+    DEFAULT_CROP = os.getenv('DEFAULT_CROP', 'false').lower() == 'true'
+    CROP_PADDING_POINTS = float(os.getenv('CROP_PADDING_POINTS', 18))
+    CROP_MIN_INK_PIXELS = int(os.getenv('CROP_MIN_INK_PIXELS', 3))
+
+    # Archive PNG Encoding: write 1-bit, grayscale or palette PNGs depending on each page's content
+    PNG_ADAPTIVE_COLOR = os.getenv('PNG_ADAPTIVE_COLOR', 'true').lower() == 'true'
+    PNG_COMPRESS_LEVEL = int(os.getenv('PNG_COMPRESS_LEVEL', 6))
+    # Colour pages are reduced to a 256-colour palette unless this is off
+    PNG_COLOR_PALETTE = os.getenv('PNG_COLOR_PALETTE', 'true').lower() == 'true'
+    # Classification runs on every Nth pixel in each direction
+    COLOR_SAMPLE_FACTOR = int(os.getenv('COLOR_SAMPLE_FACTOR', 4))
+    # A pixel is tinted when its channels differ by more than the tolerance; pages above the ratio are colour
+    COLOR_CHANNEL_TOLERANCE = int(os.getenv('COLOR_CHANNEL_TOLERANCE', 24))
+    COLOR_MAX_TINTED_RATIO = float(os.getenv('COLOR_MAX_TINTED_RATIO', 0.001))
+    # Share of near-black or near-white pixels above which a page is stored as 1-bit
+    BILEVEL_MIN_EXTREME_RATIO = float(os.getenv('BILEVEL_MIN_EXTREME_RATIO', 0.995))
+
+    # Server-side Form Extraction (Ollama-compatible /api/generate endpoint)
+    OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'qwen2.5vl:latest')
+    OLLAMA_TIMEOUT_SECONDS = int(os.getenv('OLLAMA_TIMEOUT_SECONDS', 180))
+    OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '5m')
+    # Pages sent to the model at once, per server process; match the endpoint's OLLAMA_NUM_PARALLEL
+    EXTRACTION_CONCURRENCY = int(os.getenv('EXTRACTION_CONCURRENCY', 2))
+    EXTRACTION_RETRIES = int(os.getenv('EXTRACTION_RETRIES', 1))
+    # Default prompt, shipped as a file; condensed from the instructions the form editor sends
+    EXTRACTION_PROMPT_FILE = os.getenv('EXTRACTION_PROMPT_FILE',
+                                       os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts',
+                                                    'form_extraction.txt'))
+
+    # Page Reuse: pages are fingerprinted by content so unchanged pages of a re-uploaded
+    # or revised document are linked from earlier conversions instead of rendered again
+    PAGE_REUSE_ENABLED = os.getenv('PAGE_REUSE_ENABLED', 'true').lower() == 'true'
+    PAGE_INDEX_DIR = os.getenv('PAGE_INDEX_DIR', os.path.join(tempfile.gettempdir(), 'pdf-png-page-index'))
+
+    # Rendition Profiles (extra images derived from each rendered page)
+    DEFAULT_RENDITIONS = os.getenv('DEFAULT_RENDITIONS', '')
+    LLM_RENDITION_DPI = int(os.getenv('LLM_RENDITION_DPI', 150))
+    LLM_RENDITION_FORMAT = os.getenv('LLM_RENDITION_FORMAT', 'JPEG').upper()
+    LLM_RENDITION_MAX_PIXELS = int(os.getenv('LLM_RENDITION_MAX_PIXELS', 1_500_000))
+
+    # Conversion Cache (content-addressed by PDF hash and render parameters)
+    CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() == 'true'
+    # Size budget for everything under GENERATED_IMAGES_DIR; least recently used conversions go first
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 5 * 1024 ** 3))
+    # Entry directories left without a manifest this long are treated as abandoned
+    CACHE_STALE_SECONDS = int(os.getenv('CACHE_STALE_SECONDS', 3600))
+
+    # Retention: every conversion directory is recorded in a SQLite index that a background sweeper
+    # uses instead of walking the tree. It lists every PDF hash, so it must stay outside the served
+    # GENERATED_IMAGES_DIR; all server processes share it
+    RETENTION_INDEX_PATH = os.getenv('RETENTION_INDEX_PATH',
+                                     os.path.join(tempfile.gettempdir(), 'pdf-png-retention.sqlite3'))
+    # Conversions are removed this long after they were created; 0 keeps them until CACHE_MAX_BYTES needs
+    # the room. Page views do not extend it: nginx serves the images without the app seeing the requests
+    RETENTION_TTL_SECONDS = int(os.getenv('RETENTION_TTL_SECONDS', 30 * 24 * 3600))
+    RETENTION_SWEEP_INTERVAL_SECONDS = int(os.getenv('RETENTION_SWEEP_INTERVAL_SECONDS', 300))
+    # Last-use times (conversion cache hits, which order CACHE_MAX_BYTES evictions) are written at most
+    # this often per conversion and server process
+    RETENTION_ACCESS_RESOLUTION_SECONDS = int(os.getenv('RETENTION_ACCESS_RESOLUTION_SECONDS', 60))
+    # Serve cached conversions by hash before the upload (/conversion/pdf-precheck).
+    # Anyone who knows a document's SHA-256 can then fetch its pages; disable where that matters.
+    UPLOAD_PRECHECK_ENABLED = os.getenv('UPLOAD_PRECHECK_ENABLED', 'true').lower() == 'true'
+
+    # Metrics (/conversion/metrics, Prometheus text format). Every server process writes its values
+    # to METRICS_DIR at most every METRICS_FLUSH_SECONDS, so scrapes see all of them
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'pdf-png-metrics'))
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+
+    # Background Conversion Jobs
+    CONVERSION_WORKERS = int(os.getenv('CONVERSION_WORKERS', 2))
+    JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', 3600))
+    JOB_EVENTS_KEEPALIVE_SECONDS = int(os.getenv('JOB_EVENTS_KEEPALIVE_SECONDS', 15))
+    # Shared by all server processes so any of them can answer polls for any job; the retention
+    # sweeper deletes files idle for JOB_RETENTION_SECONDS whose job finished or whose owner exited
+    JOB_STATE_DIR = os.getenv('JOB_STATE_DIR', os.path.join(tempfile.gettempdir(), 'pdf-png-jobs'))
+
+    # Backpressure: conversions beyond CONVERSION_WORKERS wait in a queue of this size, the rest get 429
+    MAX_QUEUED_CONVERSIONS = int(os.getenv('MAX_QUEUED_CONVERSIONS', 8))
+    DEFAULT_RETRY_AFTER_SECONDS = int(os.getenv('DEFAULT_RETRY_AFTER_SECONDS', 10))
+
+config = Config()
@@ -0,0 +1,64 @@
+"""
+Shared test fixtures: sample PDFs and isolated server state
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+SAMPLE_PDF = os.path.join(DATA_DIR, 'Business-Guest-Application-Form-Revised-.pdf')
+
+def poppler_marker(pdf_path=SAMPLE_PDF, tool='pdftoppm'):
+    """Skip a test unless the poppler tool and the sample PDF it renders are available"""
+    return pytest.mark.skipif(
+        shutil.which(tool) is None or not os.path.exists(pdf_path),
+        reason="poppler or sample PDFs not available"
+    )
+
+requires_poppler = poppler_marker()
+
+def hamming_distance(first_hash, second_hash):
+    """Bits in which two hex perceptual hashes differ"""
+    return bin(int(first_hash, 16) ^ int(second_hash, 16)).count('1')
+
+# Modules read their directories from the environment at import, so point them at a scratch
+# directory before any test imports the app; the fixture below then moves them per test
+_scratch_dir = tempfile.mkdtemp(prefix='pdf-png-tests-')
+atexit.register(shutil.rmtree, _scratch_dir, ignore_errors=True)
+for _name, _path in (('GENERATED_IMAGES_DIR', 'generated_pngs'), ('RETENTION_INDEX_PATH', 'retention.sqlite3'),
+                     ('JOB_STATE_DIR', 'jobs'), ('PAGE_INDEX_DIR', 'page-index'), ('METRICS_DIR', 'metrics'),
+                     ('CHUNKED_UPLOAD_DIR', 'uploads')):
+    os.environ[_name] = os.path.join(_scratch_dir, _path)
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Give every test its own images tree, retention index and job, page-index and metrics dirs"""
+    from config import config
+    from conversion_cache import conversion_cache
+    from retention import RetentionIndex, retention_sweeper
+    from jobs import job_manager
+    from page_index import page_index
+    from metrics import registry
+    from chunked_uploads import chunked_uploads
+
+    images_dir = str(tmp_path / 'generated_pngs')
+    os.makedirs(images_dir)
+    index = RetentionIndex(images_dir, db_path=str(tmp_path / 'retention.sqlite3'))
+    monkeypatch.setattr(config, 'GENERATED_IMAGES_DIR', images_dir)
+    monkeypatch.setattr(conversion_cache, 'root_dir', images_dir)
+    monkeypatch.setattr(conversion_cache, 'index', index)
+    monkeypatch.setattr(retention_sweeper, 'index', index)
+    monkeypatch.setattr(job_manager, 'state_dir', str(tmp_path / 'jobs'))
+    monkeypatch.setattr(page_index, 'root_dir', str(tmp_path / 'page-index'))
+    monkeypatch.setattr(page_index, 'images_dir', images_dir)
+    monkeypatch.setattr(registry, 'directory', str(tmp_path / 'metrics'))
+    monkeypatch.setattr(chunked_uploads, 'root_dir', str(tmp_path / 'uploads'))
+    # The app copies some of these into module globals at import
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        monkeypatch.setattr(app_module, 'GENERATED_IMAGES_DIR', images_dir)
+        monkeypatch.setattr(app_module, 'retention_index', index)
+    return tmp_path
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from config import config
+from retention import RetentionIndex, STATE_READY, retention_index
+
+MANIFEST_FILENAME = 'manifest.json'
+
+def make_cache_key(pdf_sha256, render_params):
+    """Content address of a conversion: the PDF bytes hash plus every parameter that affects the output"""
+    params = json.dumps(render_params, sort_keys=True)
+    return hashlib.sha256(f"{pdf_sha256}|{params}".encode('utf-8')).hexdigest()
+
+def is_cache_key(name):
+    return len(name) == 64 and all(c in '0123456789abcdef' for c in name)
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_manifest(entry_dir, manifest, known_hashes=None):
+    """Record the size and a content hash of every file in entry_dir, then atomically write the manifest.
+
+    known_hashes maps filenames already hashed by the caller to their hash.
+    """
+    manifest = dict(manifest)
+    known_hashes = known_hashes or {}
+    file_hashes = {}
+    size_bytes = 0
+    # Count everything in the entry (archive pages and derived renditions)
+    for entry in os.scandir(entry_dir):
+        if entry.is_file() and entry.name != MANIFEST_FILENAME and not entry.name.endswith('.tmp'):
+            file_hashes[entry.name] = known_hashes.get(entry.name) or hash_file(entry.path)
+            size_bytes += entry.stat().st_size
+    manifest['file_hashes'] = file_hashes
+    manifest['size_bytes'] = size_bytes
+    manifest['created_at'] = datetime.utcnow().isoformat()
+
+    manifest_path = os.path.join(entry_dir, MANIFEST_FILENAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, default=str)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+_manifest_memo = OrderedDict()  # entry_dir -> (manifest mtime_ns, manifest)
+_manifest_memo_lock = threading.Lock()
+MANIFEST_MEMO_SIZE = 1024
+
+def load_manifest(entry_dir):
+    """Read an entry's manifest, memoized on its mtime; None if there is none"""
+    manifest_path = os.path.join(entry_dir, MANIFEST_FILENAME)
+    try:
+        mtime_ns = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        return None
+    with _manifest_memo_lock:
+        memo = _manifest_memo.get(entry_dir)
+        if memo and memo[0] == mtime_ns:
+            _manifest_memo.move_to_end(entry_dir)
+            return memo[1]
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _manifest_memo_lock:
+        _manifest_memo[entry_dir] = (mtime_ns, manifest)
+        _manifest_memo.move_to_end(entry_dir)
+        while len(_manifest_memo) > MANIFEST_MEMO_SIZE:
+            _manifest_memo.popitem(last=False)
+    return manifest
+
+def stored_file_hash(root_dir, subpath):
+    """Content hash recorded for a generated file (<entry>/<filename>), or None if unknown"""
+    entry_name, _, filename = subpath.replace('\\', '/').partition('/')
+    if not entry_name or not filename or '/' in filename:
+        return None
+    manifest = load_manifest(os.path.join(root_dir, entry_name))
+    if not manifest:
+        return None
+    return manifest.get('file_hashes', {}).get(filename)
+
+class ConversionCache:
+    """Content-addressed page sets under the generated images directory with LRU eviction.
+
+    Each entry is a directory named after its cache key. The manifest is written
+    last, so a directory without one is a conversion still in progress (or one
+    that died midway). Sizes and last-access times live in the retention index
+    shared by all server processes, which also removes entries over the byte
+    budget or past their TTL (see retention).
+    """
+
+    def __init__(self, root_dir=None, max_bytes=None, stale_seconds=None, index=None):
+        self.root_dir = root_dir or config.GENERATED_IMAGES_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else config.CACHE_MAX_BYTES
+        self.stale_seconds = stale_seconds if stale_seconds is not None else config.CACHE_STALE_SECONDS
+        if index is None:
+            index = retention_index if root_dir is None else RetentionIndex(self.root_dir)
+        self.index = index
+
+    def entry_dir(self, cache_key):
+        return os.path.join(self.root_dir, cache_key)
+
+    def _manifest_path(self, cache_key):
+        return os.path.join(self.entry_dir(cache_key), MANIFEST_FILENAME)
+
+    def lookup(self, cache_key):
+        """Return the manifest of a completed conversion, or None on a miss"""
+        record = self.index.get(cache_key)
+        if record is None or record['state'] != STATE_READY:
+            return None
+        try:
+            with open(self._manifest_path(cache_key)) as f:
+                manifest = json.load(f)
+            entry_dir = self.entry_dir(cache_key)
+            if not all(os.path.exists(os.path.join(entry_dir, name)) for name in manifest['files']):
+                raise OSError("cached page files are missing")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Dropping unusable cache entry {cache_key}: {e}")
+            self.index.remove(cache_key)
+            return None
+        self.index.touch(cache_key)
+        return manifest
+
+    def claim(self, cache_key):
+        """Reserve the entry directory for rendering; returns its path, or None if another conversion holds it"""
+        entry_dir = self.entry_dir(cache_key)
+        try:
+            os.makedirs(entry_dir)
+            self.index.record(cache_key)
+            return entry_dir
+        except FileExistsError:
+            pass
+        # A directory without a manifest is either being rendered right now or was abandoned
+        if os.path.exists(self._manifest_path(cache_key)):
+            return None
+        try:
+            if time.time() - os.path.getmtime(entry_dir) < self.stale_seconds:
+                return None
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.makedirs(entry_dir)
+            self.index.record(cache_key)
+            return entry_dir
+        except OSError:
+            return None
+
+    def commit(self, cache_key, manifest, known_hashes=None):
+        """Publish a rendered entry by writing its manifest, then evict down to the size budget"""
+        manifest = dict(manifest)
+        manifest['cache_key'] = cache_key
+        manifest = write_manifest(self.entry_dir(cache_key), manifest, known_hashes)
+        self.index.complete(cache_key, manifest['size_bytes'], manifest.get('pdf_sha256'))
+        self.index.enforce_quota(self.max_bytes, keep=cache_key)
+        return manifest
+
+    def abandon(self, cache_key):
+        """Discard a claimed entry whose conversion failed"""
+        self.index.remove(cache_key)
+
+    def stats(self):
+        stats = self.index.stats()
+        return {
+            "entries": stats['entries'],
+            "total_bytes": stats['total_bytes'],
+            "max_bytes": self.max_bytes
+        }
+
+conversion_cache = ConversionCache()
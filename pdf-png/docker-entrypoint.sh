@@ -21,5 +21,5 @@ fi
 echo "📋 Current directory structure:"
 ls -la /app/generated_pngs
 
-echo "🚀 Starting Flask application..."
-exec python app.py
+echo "🚀 Starting PDF Converter with gunicorn..."
+exec gunicorn -c gunicorn.conf.py app:app
@@ -0,0 +1,188 @@
+import base64
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import config
+import metrics
+from page_index import page_index
+
+# Server-side form extraction: each rendered page goes straight from disk to
+# an Ollama-compatible /api/generate endpoint, instead of travelling through
+# the browser and the Node server as a base64 upload.
+
+FORM_DATE_FIELD = 'Form Date'
+
+FENCED_JSON = re.compile(r'```(?:json)?\s*([\s\S]*?)```')
+
+class ExtractionError(Exception):
+    """The model endpoint failed or returned something that is not a form description"""
+
+def extraction_prompt():
+    """The default prompt, read from EXTRACTION_PROMPT_FILE (prompts/form_extraction.txt)"""
+    with open(config.EXTRACTION_PROMPT_FILE, encoding='utf-8') as f:
+        return f.read().strip()
+
+def parse_model_json(text):
+    """Parse the model's answer, with or without a ```json fence around it"""
+    match = FENCED_JSON.search(text or '')
+    candidate = match.group(1) if match else (text or '')
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        # Some models wrap the object in prose; fall back to the outermost braces
+        start, end = candidate.find('{'), candidate.rfind('}')
+        if start != -1 and end > start:
+            try:
+                return json.loads(candidate[start:end + 1])
+            except ValueError:
+                pass
+    raise ExtractionError("Model response is not valid JSON.")
+
+def normalize_forms(parsed):
+    """Reduce the shapes the model answers in to a list of {"title", "fields"}"""
+    if isinstance(parsed, dict) and isinstance(parsed.get('forms'), list):
+        forms = parsed['forms']
+    elif isinstance(parsed, dict) and isinstance(parsed.get('form'), dict):
+        form = parsed['form']
+        forms = [{"title": form.get('title'), "fields": form.get('fields') or form.get('sections') or []}]
+    elif isinstance(parsed, dict) and 'fields' in parsed:
+        forms = [parsed]
+    else:
+        raise ExtractionError("Model response has no forms or fields.")
+    return [
+        {"title": form.get('title'), "fields": [field for field in form.get('fields') or [] if isinstance(field, dict)]}
+        for form in forms if isinstance(form, dict)
+    ]
+
+def generate(image_bytes, prompt, model, base_url=None, timeout=None):
+    """POST one image to {base_url}/api/generate and return Ollama's response object"""
+    base_url = (base_url or config.OLLAMA_BASE_URL).rstrip('/')
+    body = {
+        "model": model,
+        "prompt": prompt,
+        "images": [base64.b64encode(image_bytes).decode('ascii')],
+        "stream": False,
+        "format": "json",
+        "keep_alive": config.OLLAMA_KEEP_ALIVE
+    }
+    request = urllib.request.Request(
+        f"{base_url}/api/generate",
+        data=json.dumps(body).encode('utf-8'),
+        headers={"Content-Type": "application/json"},
+        method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=timeout or config.OLLAMA_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read())
+
+def extract_page(page_number, image_path, prompt, model):
+    """Send one page image to the model; returns its result entry, with "error" set on failure"""
+    started = time.monotonic()
+    entry = {"page_number": page_number, "model": model}
+    attempts = config.EXTRACTION_RETRIES + 1
+    try:
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+        for attempt in range(attempts):
+            try:
+                answer = generate(image_bytes, prompt, model)
+                break
+            except urllib.error.HTTPError as e:
+                # Model errors and bad requests will not go away on a retry
+                if e.code < 500 or attempt == attempts - 1:
+                    raise ExtractionError(f"Model endpoint answered {e.code}: {e.read().decode('utf-8', 'replace').strip()}")
+            except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+                if attempt == attempts - 1:
+                    raise ExtractionError(f"Model endpoint unreachable: {getattr(e, 'reason', e)}")
+        entry["forms"] = normalize_forms(parse_model_json(answer.get('response')))
+        entry["eval_count"] = answer.get('eval_count')
+    except (ExtractionError, OSError, ValueError) as e:
+        print(f"Extraction of page {page_number} failed: {e}")
+        entry["error"] = str(e)
+    entry["duration_ms"] = int((time.monotonic() - started) * 1000)
+    return entry
+
+def merge_page_results(page_results):
+    """Combine per-page results into one {"title", "fields"} form in page order.
+
+    The prompt makes every page start with a "Form Date" field; only the first
+    one is kept. Each field records the page it was read from.
+    """
+    title = None
+    fields = []
+    has_form_date = False
+    for result in sorted(page_results, key=lambda result: result["page_number"]):
+        for form in result.get("forms", []):
+            title = title or form.get("title")
+            for field in form["fields"]:
+                if field.get("name") == FORM_DATE_FIELD and field.get("type") == "date":
+                    if has_form_date:
+                        continue
+                    has_form_date = True
+                fields.append(dict(field, page_number=result["page_number"]))
+    return {"title": title, "fields": fields}
+
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+def get_extraction_pool():
+    """Threads shared by every job in this process, so model calls stay bounded server-wide"""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ThreadPoolExecutor(
+                max_workers=max(1, config.EXTRACTION_CONCURRENCY), thread_name_prefix='page-extraction'
+            )
+        return _extraction_pool
+
+class PageExtractor:
+    """Submits pages of one document to the model as they are rendered and collects the results"""
+
+    def __init__(self, prompt=None, model=None, on_result=None, render_params=None):
+        self.prompt = prompt or extraction_prompt()
+        self.model = model or config.OLLAMA_MODEL
+        self.on_result = on_result
+        # How the pages were rendered; stored answers are only reused for the same rasters
+        self.render_params = render_params or {}
+        self._futures = []
+
+    def submit(self, page_number, image_path, fingerprint=None):
+        """Queue a page for the model; pages already read with the same rendering, model and prompt are answered at once"""
+        stored = (page_index.lookup_extraction(fingerprint, self.render_params, self.model, self.prompt)
+                  if fingerprint else None)
+        metrics.cache_requests.inc(cache='extraction', result='hit' if stored else 'miss')
+        if stored:
+            future = Future()
+            future.set_result(self._report(dict(stored, page_number=page_number, reused=True, duration_ms=0)))
+        else:
+            future = get_extraction_pool().submit(self._extract, page_number, image_path, fingerprint)
+        self._futures.append(future)
+
+    def _report(self, result):
+        # Reported before the future resolves, so finish() never returns ahead of an on_result call
+        if self.on_result:
+            self.on_result(result)
+        return result
+
+    def _extract(self, page_number, image_path, fingerprint):
+        result = extract_page(page_number, image_path, self.prompt, self.model)
+        if "error" in result:
+            metrics.extraction_page_errors.inc()
+        if fingerprint and "error" not in result:
+            page_index.record_extraction(fingerprint, self.render_params, self.model, self.prompt, {
+                "model": result["model"], "forms": result["forms"], "eval_count": result.get("eval_count")
+            })
+        return self._report(result)
+
+    def finish(self):
+        """Wait for every submitted page; returns the merged forms and per-page results"""
+        page_results = sorted((future.result() for future in self._futures), key=lambda result: result["page_number"])
+        return {
+            "model": self.model,
+            "forms": [merge_page_results(page_results)],
+            "pages": page_results,
+            "failed_pages": [result["page_number"] for result in page_results if "error" in result]
+        }
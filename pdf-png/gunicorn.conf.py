@@ -0,0 +1,31 @@
+# Production server settings for the PDF converter (gunicorn -c gunicorn.conf.py app:app)
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+
+# Pre-forked workers, each with a thread pool for long-lived SSE streams and synchronous waits.
+# Each worker runs up to CONVERSION_WORKERS conversions with MAX_QUEUED_CONVERSIONS waiting;
+# anything beyond that is answered with 429 and Retry-After.
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Load the app once in the master so workers fork with it already imported
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 300))
+# How long a worker may take on SIGTERM to finish in-flight requests and background jobs
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 120))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+def worker_exit(server, worker):
+    """Drain queued and running conversions before the worker process goes away"""
+    from jobs import job_manager
+    stats = job_manager.stats()
+    if stats['running'] or stats['queued']:
+        server.log.info(f"Worker {worker.pid} draining {stats['running']} running and {stats['queued']} queued conversions")
+    job_manager.shutdown(wait=True)
@@ -0,0 +1,433 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import config
+import metrics
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+class QueueFullError(Exception):
+    """Raised when every conversion slot and queue position is taken"""
+
+    def __init__(self, retry_after):
+        super().__init__("Conversion queue is full. Please retry later.")
+        self.retry_after = retry_after
+
+class ShuttingDownError(Exception):
+    """Raised for submissions that arrive while the process drains its jobs"""
+
+def process_alive(pid):
+    """True unless no process with this pid exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# A job's state on disk is a snapshot of its fixed-size fields (<job>.json,
+# rewritten on every change) plus the pages and extractions it accumulates,
+# appended once each to <job>.events as one JSON line per page or extraction.
+# Rewriting the growing lists on every page made a job's I/O quadratic.
+ACCUMULATED_FIELDS = ('accessible_urls', 'pages', 'extractions')
+
+def job_events_path(state_path):
+    return os.path.splitext(state_path)[0] + '.events'
+
+def write_job_state(state_path, state):
+    tmp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, default=str)
+    os.replace(tmp_path, state_path)
+
+def append_job_event(state_path, event):
+    with open(job_events_path(state_path), 'a') as f:
+        f.write(json.dumps(event, default=str) + '\n')
+
+def read_job_events(state_path):
+    """{accessible_urls, pages, extractions} from a job's events file"""
+    accumulated = {field: [] for field in ACCUMULATED_FIELDS}
+    try:
+        with open(job_events_path(state_path)) as f:
+            lines = f.readlines()
+    except OSError:
+        return accumulated
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            # The owner may be halfway through appending the last line
+            break
+        if 'extraction' in event:
+            accumulated['extractions'].append(event['extraction'])
+            continue
+        if event.get('url'):
+            accumulated['accessible_urls'].append(event['url'])
+        if event.get('page') is not None:
+            accumulated['pages'].append(event['page'])
+    return accumulated
+
+def remove_job_state(state_path):
+    # Events first, so a file left by a crash in between is still found by its .json
+    for path in (job_events_path(state_path), state_path):
+        try:
+            os.remove(path)
+        except OSError:
+            # Already removed by another process, or the job never had events
+            pass
+
+class ConversionJob:
+    """State of one background conversion, shared between the worker and pollers"""
+
+    def __init__(self, filename):
+        self.job_id = str(uuid.uuid4())
+        # Snapshot on disk so other server processes can answer polls for this job
+        self.state_path = None
+        self.filename = filename
+        self.status = JOB_QUEUED
+        self.page_count = None
+        self.pages_completed = 0
+        self.accessible_urls = []
+        self.pages = []
+        # Per-page model results of extraction jobs, in the order they arrive
+        self.extractions = []
+        self.result = None
+        self.error = None
+        self.exception = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.updated_at = self.created_at
+        self.finished_monotonic = None
+        self.submitted_monotonic = time.monotonic()
+        # Bumped on every change so SSE subscribers can wait for the next update
+        self.version = 0
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def _touch(self, event=None):
+        self.version += 1
+        self.updated_at = datetime.utcnow().isoformat()
+        self.persist(event)
+        self._condition.notify_all()
+
+    def persist(self, event=None):
+        """Write the snapshot other processes poll, first appending event (a new page or extraction) if given"""
+        if not self.state_path:
+            return
+        try:
+            if event is not None:
+                append_job_event(self.state_path, event)
+            # The owner's pid lets readers tell a running job from one whose process died
+            write_job_state(self.state_path, dict(self._snapshot(), owner_pid=os.getpid()))
+        except OSError as e:
+            print(f"Could not persist state of job {self.job_id}: {e}")
+
+    def start(self, page_count=None):
+        with self._condition:
+            self.status = JOB_RUNNING
+            self.page_count = page_count
+            self._touch()
+
+    def page_completed(self, page_number, url, page=None):
+        """Record progress; url is None for pages that produced no image (excluded blank pages).
+
+        page is the page's public description, kept so streams can relay it as soon as it exists.
+        """
+        with self._condition:
+            self.pages_completed = page_number
+            if url:
+                self.accessible_urls.append(url)
+            if page is not None:
+                self.pages.append(page)
+            self._touch({"url": url, "page": page})
+
+    def page_extracted(self, extraction):
+        with self._condition:
+            self.extractions.append(extraction)
+            self._touch({"extraction": extraction})
+
+    def complete(self, result):
+        with self._condition:
+            self.status = JOB_COMPLETED
+            self.result = result
+            self.page_count = result.get('saved_files_count', self.page_count)
+            self.finished_monotonic = time.monotonic()
+            self._touch()
+
+    def fail(self, exception):
+        with self._condition:
+            self.status = JOB_FAILED
+            self.exception = exception
+            self.error = str(exception)
+            self.finished_monotonic = time.monotonic()
+            self._touch()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; returns True if it did within the timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.finished, timeout)
+
+    def wait_for_update(self, seen_version, timeout=None):
+        """Block until the job changes after seen_version; returns the current version"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != seen_version, timeout)
+            return self.version
+
+    def _snapshot(self):
+        """Every field but the accumulated ones"""
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "page_count": self.page_count,
+            "pages_completed": self.pages_completed,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+    def to_dict(self):
+        with self._condition:
+            return dict(self._snapshot(), accessible_urls=list(self.accessible_urls), pages=list(self.pages),
+                        extractions=list(self.extractions))
+
+class StoredJob:
+    """Read-only view of a job owned by another server process, backed by its state file.
+
+    A job whose owner exited before finishing it (recycled, killed after the
+    graceful timeout, OOM-killed) reads as failed.
+    """
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+        self.job_id = os.path.splitext(os.path.basename(state_path))[0]
+
+    @property
+    def version(self):
+        try:
+            modified = os.stat(self.state_path).st_mtime_ns
+        except OSError:
+            return None
+        # A dead owner never writes again, so its death has to count as an update
+        return modified, self.status
+
+    @property
+    def status(self):
+        return self._read_state().get('status')
+
+    @property
+    def finished(self):
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def _read_state(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {"job_id": self.job_id, "status": JOB_FAILED, "error": "Job state is no longer available."}
+        owner_pid = state.pop('owner_pid', None)
+        if state.get('status') in (JOB_QUEUED, JOB_RUNNING) and owner_pid and not process_alive(owner_pid):
+            state['status'] = JOB_FAILED
+            state['error'] = "The server process running this job exited before it finished."
+        return state
+
+    def to_dict(self):
+        state = self._read_state()
+        state.update(read_job_events(self.state_path))
+        return state
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.finished:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL)
+        return True
+
+    def wait_for_update(self, seen_version, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.version == seen_version:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(self.POLL_INTERVAL)
+        return self.version
+
+class JobManager:
+    """Runs conversions on a bounded worker pool and keeps their state for polling.
+
+    At most max_workers conversions run at once and at most queue_size wait
+    behind them; further submissions are refused with QueueFullError so the
+    server can answer 429 instead of piling up work. Job state is also written
+    to state_dir so that every pre-forked server process can serve polls.
+    """
+
+    def __init__(self, max_workers=None, retention_seconds=None, queue_size=None, state_dir=None):
+        self.max_workers = max_workers or config.CONVERSION_WORKERS
+        self.retention_seconds = retention_seconds if retention_seconds is not None else config.JOB_RETENTION_SECONDS
+        self.queue_size = queue_size if queue_size is not None else config.MAX_QUEUED_CONVERSIONS
+        self.state_dir = state_dir
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pdf-conversion')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._draining = False
+        # Moving average of job duration, used to suggest a Retry-After
+        self._average_seconds = None
+
+    def _state_path(self, job_id):
+        if not self.state_dir:
+            return None
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _check_capacity(self):
+        if self._draining:
+            raise ShuttingDownError("Server is shutting down. Please retry later.")
+        if self._running + self._queued >= self.max_workers + self.queue_size:
+            raise QueueFullError(self._retry_after())
+
+    def check_capacity(self):
+        """Raise QueueFullError/ShuttingDownError now, before an upload is read, if submit would"""
+        with self._lock:
+            self._check_capacity()
+
+    def submit(self, filename, work):
+        """Queue work(job) on the pool and return the job immediately"""
+        with self._lock:
+            self._check_capacity()
+            self._prune()
+            if self.state_dir:
+                os.makedirs(self.state_dir, exist_ok=True)
+            job = ConversionJob(filename)
+            job.state_path = self._state_path(job.job_id)
+            job.persist()
+            self._jobs[job.job_id] = job
+            self._queued += 1
+        self._executor.submit(self._run, job, work)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.state_dir and self._is_job_id(job_id):
+            state_path = self._state_path(job_id)
+            if os.path.exists(state_path):
+                return StoredJob(state_path)
+        return job
+
+    @staticmethod
+    def _is_job_id(job_id):
+        try:
+            return str(uuid.UUID(job_id)) == job_id
+        except ValueError:
+            return False
+
+    def _run(self, job, work):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        started = time.monotonic()
+        metrics.conversion_queue_seconds.observe(started - job.submitted_monotonic)
+        try:
+            job.complete(work(job))
+        except Exception as e:
+            print(f"Conversion job {job.job_id} failed: {e}")
+            job.fail(e)
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.conversion_seconds.observe(elapsed, status=job.status)
+            with self._lock:
+                self._running -= 1
+                if self._average_seconds is None:
+                    self._average_seconds = elapsed
+                else:
+                    self._average_seconds = 0.8 * self._average_seconds + 0.2 * elapsed
+
+    def _retry_after(self):
+        # Roughly how long until a slot frees up, clamped to something a client will honour
+        average = self._average_seconds or config.DEFAULT_RETRY_AFTER_SECONDS
+        waiting_rounds = (self._queued + 1) / float(self.max_workers)
+        return max(1, min(60, int(math.ceil(average * waiting_rounds))))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": self._queued,
+                "max_workers": self.max_workers,
+                "queue_size": self.queue_size,
+                "draining": self._draining
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and, if wait, let queued and running ones finish"""
+        with self._lock:
+            self._draining = True
+        self._executor.shutdown(wait=wait)
+
+    def _prune(self):
+        # Forget finished jobs once their retention window has passed
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_monotonic is not None and now - job.finished_monotonic > self.retention_seconds
+        ]
+        for job_id in expired:
+            state_path = self._jobs.pop(job_id).state_path
+            if state_path:
+                remove_job_state(state_path)
+
+    def prune_state_files(self):
+        """Delete state files no process will clean up; returns the job ids removed.
+
+        The owner deletes a job's file when it forgets the job, but an owner
+        that exits first leaves it behind. Files untouched for
+        retention_seconds go once their job has finished or its owner is gone.
+        """
+        if not self.state_dir:
+            return []
+        with self._lock:
+            held = set(self._jobs)
+        cutoff = time.time() - self.retention_seconds
+        removed = []
+        try:
+            names = os.listdir(self.state_dir)
+        except OSError:
+            return removed
+        for name in names:
+            job_id, extension = os.path.splitext(name)
+            if extension != '.json' or job_id in held or not self._is_job_id(job_id):
+                continue
+            state_path = os.path.join(self.state_dir, name)
+            try:
+                if os.stat(state_path).st_mtime >= cutoff:
+                    continue
+            except OSError:
+                continue
+            if StoredJob(state_path).finished:
+                remove_job_state(state_path)
+                removed.append(job_id)
+        return removed
+
+job_manager = JobManager(state_dir=config.JOB_STATE_DIR)
+
+def collect_job_metrics():
+    stats = job_manager.stats()
+    metrics.conversions_in_flight.set(stats['running'])
+    metrics.conversion_queue_depth.set(stats['queued'])
+
+metrics.registry.add_collector(collect_job_metrics)
@@ -0,0 +1,278 @@
+import json
+import os
+import threading
+import time
+from config import config
+
+# Prometheus text-format metrics for /conversion/metrics, without a client
+# library. Each server process keeps its own values and writes them to
+# METRICS_DIR at most every METRICS_FLUSH_SECONDS (and whenever it answers a
+# scrape); a scrape adds up the files of every process, so any worker can
+# answer it. Gauges of processes that have exited are left out; their
+# counters and histograms still count.
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(16 * 1024 * 4 ** power for power in range(9))  # 16 KiB .. 1 GiB
+PAGES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+        if not self.label_names:
+            # Unlabelled series are exported from the start, at zero
+            self.values[()] = self.initial()
+
+    def initial(self):
+        return 0.0
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        with self.registry.lock:
+            key = self._key(labels)
+            self.values[key] = self.values.get(key, 0.0) + amount
+        self.registry.maybe_flush()
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.registry.lock:
+            self.values[self._key(labels)] = float(value)
+        self.registry.maybe_flush()
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, documentation, labels)
+
+    def initial(self):
+        # A count per bucket (not cumulative), then the sum and the total count
+        return [0] * len(self.buckets) + [0.0, 0]
+
+    def observe(self, value, **labels):
+        with self.registry.lock:
+            key = self._key(labels)
+            series = self.values.setdefault(key, self.initial())
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+        self.registry.maybe_flush()
+
+    def time(self, **labels):
+        """Context manager observing the seconds its block took"""
+        return Timer(self, labels)
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Registry:
+    """The metrics of this process, and the merged view over every process sharing METRICS_DIR"""
+
+    def __init__(self, directory=None, flush_seconds=None):
+        self.directory = directory or config.METRICS_DIR
+        self.flush_seconds = flush_seconds if flush_seconds is not None else config.METRICS_FLUSH_SECONDS
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.RLock()
+        self._last_flush = 0.0
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(self, name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=SECONDS_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labels, buckets))
+
+    def add_collector(self, collect):
+        """collect() runs before every flush, to set gauges that are read rather than updated"""
+        self.collectors.append(collect)
+
+    def snapshot(self):
+        for collect in self.collectors:
+            collect()
+        with self.lock:
+            return {
+                name: [[list(key), list(value) if isinstance(value, list) else value]
+                       for key, value in metric.values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def flush(self):
+        """Write this process's values for other processes to merge"""
+        if not config.METRICS_ENABLED:
+            return
+        # Set first: collectors update gauges, which would otherwise flush again
+        self._last_flush = time.monotonic()
+        snapshot = self.snapshot()
+        path = self._path(os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {e}")
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def _snapshots(self):
+        """(pid, snapshot) of every process, with this one's taken live"""
+        own_pid = os.getpid()
+        yield own_pid, self.snapshot()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            stem, extension = os.path.splitext(name)
+            if extension != '.json' or not stem.isdigit() or int(stem) == own_pid:
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    yield int(stem), json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def collect(self):
+        """{metric name: {label values: value}} summed over every process"""
+        self.flush()
+        merged = {name: {} for name in self.metrics}
+        for pid, snapshot in self._snapshots():
+            alive = None
+            for name, series in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                if metric.kind == 'gauge':
+                    alive = process_alive(pid) if alive is None else alive
+                    if not alive:
+                        continue
+                for key, value in series:
+                    key = tuple(key)
+                    if metric.kind == 'histogram':
+                        if len(value) != len(metric.buckets) + 2:
+                            continue  # written with other buckets by an older build
+                        total = merged[name].setdefault(key, metric.initial())
+                        merged[name][key] = [a + b for a, b in zip(total, value)]
+                    else:
+                        merged[name][key] = merged[name].get(key, 0.0) + value
+        return merged
+
+    def render(self):
+        """The merged metrics in the Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(merged[name].items()):
+                if metric.kind != 'histogram':
+                    lines.append(f"{name}{format_labels(metric.label_names, key)} {format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value[:-2] + [value[-1] - sum(value[:-2])]):
+                    cumulative += count
+                    labels = format_labels(metric.label_names, key, [('le', format_value(bound))])
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+                labels = format_labels(metric.label_names, key)
+                lines.append(f"{name}_sum{labels} {format_value(value[-2])}")
+                lines.append(f"{name}_count{labels} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+# Requests and uploads
+upload_receive_seconds = registry.histogram(
+    'pdfpng_upload_receive_seconds', "Time spent receiving an uploaded PDF (whole form body or one chunk)",
+    labels=('kind',))
+http_errors = registry.counter(
+    'pdfpng_http_errors_total', "Responses with a 4xx or 5xx status", labels=('endpoint', 'status'))
+
+# Conversions
+metadata_parse_seconds = registry.histogram(
+    'pdfpng_metadata_parse_seconds', "Time spent reading PDF metadata before rendering")
+page_render_seconds = registry.histogram(
+    'pdfpng_page_render_seconds', "Time rasterizing one page (including poppler's own PNG write when direct)",
+    labels=('backend',))
+page_encode_seconds = registry.histogram(
+    'pdfpng_page_encode_seconds', "Time encoding and writing one page's PNG and renditions in Python")
+conversion_bytes_written = registry.histogram(
+    'pdfpng_conversion_bytes_written', "Bytes written to the generated images directory per conversion",
+    buckets=BYTES_BUCKETS)
+conversion_pages = registry.histogram(
+    'pdfpng_conversion_pages', "Pages per converted document", buckets=PAGES_BUCKETS)
+conversion_errors = registry.counter(
+    'pdfpng_conversion_errors_total', "Conversions that failed, by exception type", labels=('error',))
+
+# Queueing
+conversions_in_flight = registry.gauge('pdfpng_conversions_in_flight', "Conversions running right now")
+conversion_queue_depth = registry.gauge('pdfpng_conversion_queue_depth', "Conversions waiting for a worker")
+conversion_queue_seconds = registry.histogram(
+    'pdfpng_conversion_queue_seconds', "Time a conversion waited for a worker")
+conversion_seconds = registry.histogram(
+    'pdfpng_conversion_seconds', "Time a conversion ran, by outcome", labels=('status',))
+
+# Reuse
+cache_requests = registry.counter(
+    'pdfpng_cache_requests_total', "Lookups of earlier work, by cache and result", labels=('cache', 'result'))
+extraction_page_errors = registry.counter(
+    'pdfpng_extraction_page_errors_total', "Pages the model could not read")
@@ -0,0 +1,58 @@
+import numpy as np
+from config import config
+from blank_pages import grayscale_pixels, ink_threshold, margin_slices
+
+# Content cropping: trims the empty margins around a rendered page so the
+# archive PNG and every rendition carry only the part of the page with ink.
+# The crop box is recorded so coordinates found on the cropped image can be
+# mapped back onto the full page.
+
+def ink_bounding_box(image):
+    """(left, top, right, bottom) pixel box around the page's ink, or None for a page without any.
+
+    Rows and columns need a few ink pixels to count, so isolated scanner
+    speckles do not stretch the box; the scanner margins are ignored.
+    """
+    pixels = grayscale_pixels(image)
+    rows, cols = margin_slices(pixels.shape)
+    inner = pixels[rows, cols]
+    if inner.size == 0:
+        return None
+    _, threshold = ink_threshold(np.bincount(inner.ravel(), minlength=256), inner.size)
+    ink = inner < threshold
+
+    min_pixels = config.CROP_MIN_INK_PIXELS
+    ink_rows = np.flatnonzero(np.count_nonzero(ink, axis=1) >= min_pixels)
+    ink_cols = np.flatnonzero(np.count_nonzero(ink, axis=0) >= min_pixels)
+    if ink_rows.size == 0 or ink_cols.size == 0:
+        return None
+    top_offset, left_offset = rows.start or 0, cols.start or 0
+    return (
+        int(ink_cols[0]) + left_offset,
+        int(ink_rows[0]) + top_offset,
+        int(ink_cols[-1]) + 1 + left_offset,
+        int(ink_rows[-1]) + 1 + top_offset
+    )
+
+def crop_box(image, padding_points, dpi):
+    """The padded crop box for a page, clamped to the image; None when there is nothing to trim"""
+    box = ink_bounding_box(image)
+    if box is None:
+        return None
+    padding = int(round(padding_points * dpi / 72.0))
+    left, top, right, bottom = box
+    box = (max(0, left - padding), max(0, top - padding),
+           min(image.width, right + padding), min(image.height, bottom + padding))
+    if box == (0, 0, image.width, image.height):
+        return None
+    return box
+
+def crop_details(box, original_size, dpi):
+    """Offsets needed to map the cropped image back onto the full page, in pixels and in PDF points"""
+    to_points = 72.0 / dpi
+    return {
+        "box": list(box),
+        "box_points": [round(value * to_points, 2) for value in box],
+        "original_width": original_size[0],
+        "original_height": original_size[1]
+    }
@@ -0,0 +1,230 @@
+import hashlib
+import numpy as np
+import PyPDF2
+from PIL import Image
+from PyPDF2.generic import (
+    ArrayObject, ByteStringObject, ContentStream, DictionaryObject, FloatObject, IndirectObject, NumberObject,
+    StreamObject, TextStringObject
+)
+
+# Per-page fingerprints. The content fingerprint hashes everything poppler
+# draws a page from (decoded content streams, resources, boxes and annotation
+# appearances) but not document metadata, object numbers or compression, so
+# a page survives a re-save or a touched ModDate with the same fingerprint.
+# The perceptual hash summarizes the rendered raster for clients; it is not
+# indexed, since a near match is no reason to reuse another page's output.
+
+# Page attributes that affect rendering; /Resources, /MediaBox, /CropBox and
+# /Rotate inherited from the page tree are copied onto each page by PyPDF2
+PAGE_KEYS = ('/Contents', '/Resources', '/MediaBox', '/CropBox', '/Rotate', '/UserUnit', '/Group', '/Annots')
+
+# Back-references and bookkeeping that do not change what is drawn
+IGNORED_KEYS = frozenset((
+    '/Parent', '/P', '/Popup', '/StructParent', '/StructParents', '/Metadata', '/PieceInfo',
+    '/LastModified', '/M', '/CreationDate', '/NM', '/Thumb'
+))
+
+# Field attributes a widget inherits from its parent fields (which /Parent
+# would otherwise hide); with /NeedAppearances the viewer draws the value itself
+INHERITABLE_FIELD_KEYS = ('/FT', '/Ff', '/V', '/DA', '/Q', '/Opt', '/MaxLen')
+
+# Document-wide form settings that change how fields are drawn
+ACROFORM_KEYS = ('/NeedAppearances', '/DA', '/DR', '/Q')
+
+# Encoding of a stream, irrelevant once its data has been decoded
+STREAM_ENCODING_KEYS = frozenset(('/Length', '/Filter', '/DecodeParms', '/DL'))
+
+# Content streams are hashed operator by operator so that re-serializing them
+# (whitespace, string escapes, 1 vs 1.0) keeps the fingerprint; beyond this
+# size the decoded bytes are hashed instead, as parsing gets slow
+CONTENT_PARSE_MAX_BYTES = 256 * 1024
+
+def framed(data):
+    """data with its length in front, so consecutive values cannot run together"""
+    return b'%d:' % len(data) + data
+
+def scalar_bytes(obj):
+    """Canonical bytes of a number, string, name, boolean or null"""
+    kind = type(obj)
+    if kind is NumberObject or kind is FloatObject:
+        return b'n' + repr(float(obj)).encode('ascii')
+    if kind is ByteStringObject:
+        return b's' + bytes(obj)
+    if kind is TextStringObject:
+        try:
+            return b's' + obj.original_bytes
+        except Exception:
+            return b's' + str(obj).encode('utf-8', 'surrogatepass')
+    return f"{type(obj).__name__}:{obj}".encode('utf-8', 'surrogatepass')
+
+class ContentHasher:
+    """Hashes the PDF objects a page is drawn from by value.
+
+    Shared objects such as fonts are hashed once per document.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self._memo = {}
+        self._active = set()
+        self._form_digest = None
+
+    def digest(self, obj):
+        """(digest, complete); complete is False when a reference cycle was cut short"""
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key in self._memo:
+                return self._memo[key], True
+            if key in self._active:
+                return b'cycle', False
+            self._active.add(key)
+            try:
+                digest, complete = self.digest(obj.get_object())
+            finally:
+                self._active.discard(key)
+            if complete:
+                self._memo[key] = digest
+            return digest, complete
+
+        h = hashlib.sha256()
+        complete = True
+        if isinstance(obj, DictionaryObject):
+            skipped = IGNORED_KEYS
+            if isinstance(obj, StreamObject):
+                is_image = obj.get('/Subtype') == '/Image'
+                h.update(b'stream:')
+                h.update(self.stream_digest(obj, is_image))
+                if not is_image:
+                    skipped = IGNORED_KEYS | STREAM_ENCODING_KEYS
+            h.update(b'dict:')
+            for key in sorted(obj):
+                if key in skipped:
+                    continue
+                h.update(framed(key.encode('utf-8')))
+                value_digest, value_complete = self.digest(obj.raw_get(key))
+                h.update(value_digest)
+                complete = complete and value_complete
+            if '/Parent' in obj and ('/T' in obj or obj.get('/Subtype') == '/Widget'):
+                for key, value in self.inherited_field_values(obj):
+                    h.update(framed(b'inherited' + key.encode('utf-8')))
+                    value_digest, value_complete = self.digest(value)
+                    h.update(value_digest)
+                    complete = complete and value_complete
+        elif isinstance(obj, ArrayObject):
+            h.update(b'array:')
+            for item in obj:
+                item_digest, item_complete = self.digest(item)
+                h.update(item_digest)
+                complete = complete and item_complete
+        else:
+            h.update(framed(scalar_bytes(obj)))
+        return h.digest(), complete
+
+    def inherited_field_values(self, field):
+        """(key, value) of the field attributes a widget or field takes from its ancestors"""
+        values = {}
+        parent = field.raw_get('/Parent').get_object()
+        for _ in range(32):
+            if not isinstance(parent, DictionaryObject):
+                break
+            for key in INHERITABLE_FIELD_KEYS:
+                if key in parent and key not in field and key not in values:
+                    values[key] = parent.raw_get(key)
+            parent = parent.raw_get('/Parent').get_object() if '/Parent' in parent else None
+        return sorted(values.items())
+
+    def form_digest(self):
+        """Digest of the AcroForm settings that affect how a page's fields are drawn"""
+        if self._form_digest is None:
+            h = hashlib.sha256(b'acroform:')
+            try:
+                acroform = self.reader.trailer['/Root'].get_object().get('/AcroForm')
+                acroform = acroform.get_object() if acroform is not None else None
+            except Exception:
+                acroform = None
+            if isinstance(acroform, DictionaryObject):
+                for key in ACROFORM_KEYS:
+                    if key in acroform:
+                        h.update(framed(key.encode('utf-8')))
+                        h.update(self.digest(acroform.raw_get(key))[0])
+            self._form_digest = h.digest()
+        return self._form_digest
+
+    def stream_digest(self, stream, is_image):
+        if is_image:
+            # Hashed as stored; decoding a scan just to hash it costs more than rendering it
+            return hashlib.sha256(stream._data or b'').digest()
+        try:
+            data = stream.get_data()
+        except Exception:
+            return hashlib.sha256(stream._data or b'').digest()
+        if stream.get('/Subtype') == '/Form' or stream.get('/PatternType') == 1:
+            return self.content_digest(stream, data)
+        return hashlib.sha256(data).digest()
+
+    def content_digest(self, contents, data):
+        """Digest of a content stream (or array of them) by its parsed operations"""
+        if len(data) <= CONTENT_PARSE_MAX_BYTES:
+            try:
+                operations = ContentStream(contents, self.reader).operations
+            except Exception:
+                operations = None
+            if operations is not None:
+                h = hashlib.sha256(b'ops:')
+                for operands, operator in operations:
+                    h.update(framed(operator))
+                    if isinstance(operands, dict):
+                        # Inline image: its settings dictionary and raw data
+                        h.update(self.digest(operands['settings'])[0])
+                        h.update(framed(operands['data']))
+                        continue
+                    for operand in operands:
+                        # Exact type checks: isinstance against PyPDF2's Protocol-based classes is slow
+                        if type(operand) in (ArrayObject, DictionaryObject):
+                            h.update(self.digest(operand)[0])
+                        else:
+                            h.update(framed(scalar_bytes(operand)))
+                return h.digest()
+        return hashlib.sha256(data).digest()
+
+    def page_fingerprint(self, page):
+        h = hashlib.sha256()
+        for key in PAGE_KEYS:
+            if key not in page:
+                continue
+            h.update(framed(key.encode('utf-8')))
+            if key == '/Contents':
+                contents = page['/Contents']
+                if isinstance(contents, ArrayObject):
+                    data = b'\n'.join(part.get_object().get_data() for part in contents)
+                else:
+                    data = contents.get_data()
+                h.update(self.content_digest(contents, data))
+            else:
+                h.update(self.digest(page.raw_get(key))[0])
+        if '/Annots' in page:
+            h.update(self.form_digest())
+        return h.hexdigest()
+
+def page_content_fingerprints(pdf_path):
+    """{page number: content fingerprint} for every page of the PDF at pdf_path"""
+    reader = PyPDF2.PdfReader(pdf_path)
+    if reader.is_encrypted and not reader.decrypt(''):
+        raise ValueError("PDF is encrypted.")
+    hasher = ContentHasher(reader)
+    return {
+        page_number: hasher.page_fingerprint(page)
+        for page_number, page in enumerate(reader.pages, start=1)
+    }
+
+def document_fingerprint(page_fingerprints):
+    """Fingerprint of a whole document from its pages' fingerprints, in page order"""
+    return hashlib.sha256('|'.join(page_fingerprints).encode('ascii')).hexdigest()
+
+def perceptual_hash(image):
+    """64-bit difference hash of a page raster as 16 hex digits"""
+    # Box-filter straight down to 9x8 and only then drop colour, so the full page is never converted
+    small = image.resize((9, 8), Image.Resampling.BOX).convert('L')
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import shutil
+from config import config
+from conversion_cache import make_cache_key
+from renderer import page_filename
+from renditions import rendition_filename
+
+# Work already done per page, keyed by content fingerprint (see
+# page_fingerprints). A re-uploaded or lightly revised form then only renders,
+# and only sends to the model, the pages that actually changed.
+#
+#   pages/<key>.json         rendered files of a page for one set of render params
+#   extractions/<key>.json   the model's answer for a page for one set of render params, model and prompt
+#
+# Records are small JSON files shared by every server process. A page record
+# points at files in another conversion's directory; it is dropped once those
+# files are gone (evicted from the conversion cache).
+
+# Page fields that describe the image itself and carry over to a reused page
+REUSABLE_PAGE_FIELDS = ('width', 'height', 'dpi', 'sha256', 'blank', 'ink_ratio', 'crop', 'color_class', 'phash')
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Different filesystem, or one that does not do hard links
+        shutil.copyfile(source, destination)
+
+def merge_reused_pages(rendered, reused):
+    """Interleave reused pages ({page number: page}) with the rendered ones, in page order"""
+    pending = sorted(reused)
+    for page in rendered:
+        while pending and pending[0] < page['page_number']:
+            yield reused[pending.pop(0)]
+        yield page
+    for page_number in pending:
+        yield reused[page_number]
+
+class PageIndex:
+    """Maps page content fingerprints to rendered pages and extraction results"""
+
+    def __init__(self, root_dir=None, images_dir=None):
+        self.root_dir = root_dir or config.PAGE_INDEX_DIR
+        self.images_dir = images_dir or config.GENERATED_IMAGES_DIR
+
+    def _path(self, kind, key):
+        return os.path.join(self.root_dir, kind, key[:2], f"{key}.json")
+
+    def _read(self, kind, key):
+        try:
+            with open(self._path(kind, key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, kind, key, record):
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def _drop(self, kind, key):
+        try:
+            os.remove(self._path(kind, key))
+        except OSError:
+            pass
+
+    def lookup_page(self, fingerprint, render_params):
+        """The recorded page for this content and render params, or None if there is none or its files are gone"""
+        key = make_cache_key(fingerprint, render_params)
+        record = self._read('pages', key)
+        if record is None:
+            return None
+        entry_dir = os.path.join(self.images_dir, record['entry'])
+        page = record['page']
+        names = ([page['filename']] if page['filename'] else []) + list(page['renditions'].values())
+        if not all(os.path.exists(os.path.join(entry_dir, name)) for name in names):
+            self._drop('pages', key)
+            return None
+        return record
+
+    def record_page(self, fingerprint, render_params, entry_name, page):
+        """Remember where the files of a rendered page live"""
+        stored = {field: page[field] for field in REUSABLE_PAGE_FIELDS if field in page}
+        stored.update({"filename": page['filename'], "renditions": page['renditions']})
+        self._write('pages', make_cache_key(fingerprint, render_params), {"entry": entry_name, "page": stored})
+
+    def reuse_page(self, record, output_dir, filename_base, page_number):
+        """Link a recorded page's files into output_dir under this document's names; returns its page dict"""
+        source_dir = os.path.join(self.images_dir, record['entry'])
+        source = record['page']
+        page = {field: source[field] for field in REUSABLE_PAGE_FIELDS if field in source}
+        page.update({"page_number": page_number, "filename": None, "filepath": None, "renditions": {}, "reused": True})
+        if source['filename']:
+            page['filename'] = page_filename(filename_base, page_number)
+            link_or_copy(os.path.join(source_dir, source['filename']), os.path.join(output_dir, page['filename']))
+        for profile_name, filename in source['renditions'].items():
+            page['renditions'][profile_name] = rendition_filename(filename_base, page_number, profile_name)
+            link_or_copy(os.path.join(source_dir, filename), os.path.join(output_dir, page['renditions'][profile_name]))
+        return page
+
+    @staticmethod
+    def _extraction_key(fingerprint, render_params, model, prompt):
+        # The model reads the rendered raster, so its answer only holds for the same DPI, crop and profile
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        return make_cache_key(fingerprint, {"render": render_params, "model": model, "prompt": prompt_hash})
+
+    def lookup_extraction(self, fingerprint, render_params, model, prompt):
+        return self._read('extractions', self._extraction_key(fingerprint, render_params, model, prompt))
+
+    def record_extraction(self, fingerprint, render_params, model, prompt, result):
+        self._write('extractions', self._extraction_key(fingerprint, render_params, model, prompt), result)
+
+page_index = PageIndex()
@@ -0,0 +1,632 @@
+import hashlib
+import io
+import json
+import mmap
+import re
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+import PyPDF2
+from PyPDF2.generic import create_string_object
+
+# Metadata extraction for /conversion/pdf-metadata and its batch variant.
+#
+# The fast path is a lightweight reader that follows
+# startxref to the cross-reference data, then fetches only the objects it
+# needs: the trailer, the Info dictionary, the Catalog and the page tree root.
+# Nothing else in the file is parsed, so the cost is independent of file size.
+# Anything unexpected raises FastPathUnavailable and callers fall back to the
+# full PyPDF2 parser, which can also reconstruct damaged files.
+
+WHITESPACE = b' \t\r\n\x0c\x00'
+DELIMITERS = b'()<>[]{}/%'
+TAIL_SEARCH_BYTES = 2048
+XREF_ENTRY = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+
+Ref = namedtuple('Ref', 'num gen')
+
+class FastPathUnavailable(Exception):
+    """The file uses something the fast path does not handle; use the full parser"""
+
+Stream = namedtuple('Stream', 'dict data_start')
+
+@contextmanager
+def mapped_upload(stream):
+    """Memory-map an uploaded file if it is spooled to disk, otherwise read it into memory"""
+    try:
+        stream.seek(0)
+        buffer = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        stream.seek(0)
+        yield stream.read()
+        return
+    try:
+        yield buffer
+    finally:
+        buffer.close()
+
+@contextmanager
+def mapped_file(path):
+    """Memory-map a PDF on disk read-only so only the parts we touch are read"""
+    with open(path, 'rb') as f, mapped_upload(f) as buffer:
+        yield buffer
+
+class ObjectParser:
+    """Parses PDF objects from a byte buffer (bytes or mmap) starting at a position"""
+
+    def __init__(self, buffer, pos):
+        self.buffer = buffer
+        self.pos = pos
+
+    def peek(self, length=1):
+        return self.buffer[self.pos:self.pos + length]
+
+    def skip_whitespace(self):
+        buffer = self.buffer
+        while self.pos < len(buffer):
+            c = buffer[self.pos:self.pos + 1]
+            if c in WHITESPACE:
+                self.pos += 1
+            elif c == b'%':
+                while self.pos < len(buffer) and buffer[self.pos:self.pos + 1] not in b'\r\n':
+                    self.pos += 1
+            else:
+                return
+
+    def read_token(self):
+        """Read a bare keyword or number"""
+        self.skip_whitespace()
+        start = self.pos
+        buffer = self.buffer
+        while self.pos < len(buffer):
+            c = buffer[self.pos:self.pos + 1]
+            if c in WHITESPACE or c in DELIMITERS:
+                break
+            self.pos += 1
+        if start == self.pos:
+            raise FastPathUnavailable(f"Expected a token at offset {start}")
+        return bytes(buffer[start:self.pos])
+
+    def expect(self, keyword):
+        token = self.read_token()
+        if token != keyword:
+            raise FastPathUnavailable(f"Expected {keyword!r}, found {token!r}")
+
+    def parse(self):
+        self.skip_whitespace()
+        c = self.peek()
+        if c == b'<':
+            if self.peek(2) == b'<<':
+                return self._parse_dict()
+            return self._parse_hex_string()
+        if c == b'(':
+            return self._parse_literal_string()
+        if c == b'[':
+            return self._parse_array()
+        if c == b'/':
+            return self._parse_name()
+        if not c:
+            raise FastPathUnavailable("Unexpected end of file")
+
+        token = self.read_token()
+        if token == b'true':
+            return True
+        if token == b'false':
+            return False
+        if token == b'null':
+            return None
+        try:
+            if b'.' in token:
+                return float(token)
+            number = int(token)
+        except ValueError:
+            raise FastPathUnavailable(f"Unexpected token {token!r}")
+
+        # An integer may be the start of an indirect reference: "num gen R"
+        saved = self.pos
+        try:
+            generation = int(self.read_token())
+            if self.read_token() == b'R':
+                return Ref(number, generation)
+        except (ValueError, FastPathUnavailable):
+            pass
+        self.pos = saved
+        return number
+
+    def _parse_dict(self):
+        self.pos += 2
+        result = {}
+        while True:
+            self.skip_whitespace()
+            if self.peek(2) == b'>>':
+                self.pos += 2
+                return result
+            key = self.parse()
+            if not isinstance(key, str) or not key.startswith('/'):
+                raise FastPathUnavailable("Dictionary key is not a name")
+            result[key] = self.parse()
+
+    def _parse_array(self):
+        self.pos += 1
+        result = []
+        while True:
+            self.skip_whitespace()
+            if self.peek() == b']':
+                self.pos += 1
+                return result
+            result.append(self.parse())
+
+    def _parse_name(self):
+        start = self.pos
+        self.pos += 1
+        buffer = self.buffer
+        while self.pos < len(buffer):
+            c = buffer[self.pos:self.pos + 1]
+            if c in WHITESPACE or c in DELIMITERS:
+                break
+            self.pos += 1
+        raw = bytes(buffer[start:self.pos])
+        # Names may escape characters as #xx
+        raw = re.sub(rb'#([0-9A-Fa-f]{2})', lambda m: bytes([int(m.group(1), 16)]), raw)
+        return raw.decode('utf-8', 'replace')
+
+    def _parse_hex_string(self):
+        end = self.buffer.find(b'>', self.pos)
+        if end < 0:
+            raise FastPathUnavailable("Unterminated hex string")
+        digits = re.sub(rb'[^0-9A-Fa-f]', b'', bytes(self.buffer[self.pos + 1:end]))
+        if len(digits) % 2:
+            digits += b'0'
+        self.pos = end + 1
+        return bytes.fromhex(digits.decode('ascii'))
+
+    def _parse_literal_string(self):
+        escapes = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f',
+                   b'(': b'(', b')': b')', b'\\': b'\\'}
+        buffer = self.buffer
+        self.pos += 1
+        depth = 1
+        out = bytearray()
+        while self.pos < len(buffer):
+            c = buffer[self.pos:self.pos + 1]
+            self.pos += 1
+            if c == b'\\':
+                e = buffer[self.pos:self.pos + 1]
+                self.pos += 1
+                if e in escapes:
+                    out += escapes[e]
+                elif e in b'01234567' and e:
+                    digits = e
+                    while len(digits) < 3 and buffer[self.pos:self.pos + 1] in b'01234567' \
+                            and buffer[self.pos:self.pos + 1]:
+                        digits += buffer[self.pos:self.pos + 1]
+                        self.pos += 1
+                    out.append(int(digits, 8) & 0xFF)
+                elif e == b'\r':
+                    # Line continuation
+                    if buffer[self.pos:self.pos + 1] == b'\n':
+                        self.pos += 1
+                elif e != b'\n':
+                    out += e
+            elif c == b'(':
+                depth += 1
+                out += c
+            elif c == b')':
+                depth -= 1
+                if depth == 0:
+                    return bytes(out)
+                out += c
+            else:
+                out += c
+        raise FastPathUnavailable("Unterminated string")
+
+def apply_png_predictor(data, columns):
+    """Undo PNG row predictors (/Predictor >= 10) as used by cross-reference streams"""
+    row_length = columns + 1
+    previous = bytearray(columns)
+    out = bytearray()
+    for start in range(0, len(data), row_length):
+        filter_type = data[start]
+        row = bytearray(data[start + 1:start + row_length])
+        for i in range(len(row)):
+            left = row[i - 1] if i > 0 else 0
+            up = previous[i]
+            if filter_type == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif filter_type == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif filter_type == 3:
+                row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+            elif filter_type == 4:
+                up_left = previous[i - 1] if i > 0 else 0
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                predictor = left if pa <= pb and pa <= pc else (up if pb <= pc else up_left)
+                row[i] = (row[i] + predictor) & 0xFF
+            elif filter_type != 0:
+                raise FastPathUnavailable(f"Unknown PNG predictor {filter_type}")
+        out += row
+        previous = row
+    return bytes(out)
+
+class PdfIndex:
+    """Just enough cross-reference handling to fetch individual objects by number"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.trailer = {}
+        # Newest first: ('table', ([(first, count, pos)], {num: entry})) or ('stream', {num: entry}).
+        # The table's dict holds its /XRefStm entries in hybrid-reference files
+        self._sections = []
+        self._object_streams = {}
+
+        tail_start = max(0, len(buffer) - TAIL_SEARCH_BYTES)
+        marker = buffer.rfind(b'startxref', tail_start)
+        if marker < 0:
+            raise FastPathUnavailable("No startxref found")
+        parser = ObjectParser(buffer, marker + len(b'startxref'))
+        offset = int(parser.read_token())
+
+        seen = set()
+        while offset is not None:
+            if offset in seen or not 0 <= offset < len(buffer):
+                raise FastPathUnavailable("Bad cross-reference offset")
+            seen.add(offset)
+            trailer = self._read_section(offset)
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            if '/XRefStm' in trailer and self._sections[-1][0] == 'table':
+                # Hybrid-reference file: the stream lists the compressed objects that the
+                # table marks free for older readers, and those entries take precedence
+                self._read_section(trailer['/XRefStm'])
+                _, hidden = self._sections.pop()
+                self._sections[-1][1][1].update(hidden)
+            offset = trailer.get('/Prev')
+
+        if '/Encrypt' in self.trailer:
+            raise FastPathUnavailable("Encrypted documents need the full parser")
+
+    def _read_section(self, offset):
+        parser = ObjectParser(self.buffer, offset)
+        parser.skip_whitespace()
+        if parser.peek(4) == b'xref':
+            parser.pos += 4
+            return self._read_table(parser)
+        return self._read_xref_stream(parser)
+
+    def _read_table(self, parser):
+        subsections = []
+        while True:
+            token = parser.read_token()
+            if token == b'trailer':
+                break
+            first, count = int(token), int(parser.read_token())
+            parser.skip_whitespace()
+            subsections.append((first, count, parser.pos))
+            # Entries are nominally 20 bytes each; verify instead of trusting it
+            end = parser.pos + 20 * count
+            if count and not XREF_ENTRY.match(self.buffer[end - 20:end - 2]):
+                raise FastPathUnavailable("Irregular cross-reference table")
+            parser.pos = end
+        self._sections.append(('table', (subsections, {})))
+        trailer = parser.parse()
+        if not isinstance(trailer, dict):
+            raise FastPathUnavailable("Trailer is not a dictionary")
+        return trailer
+
+    def _read_xref_stream(self, parser):
+        parser.read_token()  # object number
+        parser.read_token()  # generation
+        parser.expect(b'obj')
+        stream = self._read_stream_after_dict(parser)
+        info = stream.dict
+        if info.get('/Type') != '/XRef':
+            raise FastPathUnavailable("startxref does not point at cross-reference data")
+        data = self.stream_data(stream)
+        widths = info['/W']
+        index = info.get('/Index', [0, info['/Size']])
+        entries = {}
+        entry_size = sum(widths)
+        pos = 0
+        for first, count in zip(index[0::2], index[1::2]):
+            for num in range(first, first + count):
+                fields = []
+                for field, width in enumerate(widths):
+                    if width:
+                        fields.append(int.from_bytes(data[pos:pos + width], 'big'))
+                    else:
+                        # Omitted fields default to type 1 and zero for the others
+                        fields.append(1 if field == 0 else 0)
+                    pos += width
+                entry_type = fields[0]
+                if entry_type == 1:
+                    entries.setdefault(num, ('offset', fields[1]))
+                elif entry_type == 2:
+                    entries.setdefault(num, ('objstm', fields[1], fields[2]))
+                else:
+                    entries.setdefault(num, ('free',))
+        if pos > len(data) or entry_size == 0:
+            raise FastPathUnavailable("Truncated cross-reference stream")
+        self._sections.append(('stream', entries))
+        return info
+
+    def _read_stream_after_dict(self, parser):
+        stream_dict = parser.parse()
+        if not isinstance(stream_dict, dict):
+            raise FastPathUnavailable("Stream without dictionary")
+        parser.expect(b'stream')
+        if parser.peek(2) == b'\r\n':
+            parser.pos += 2
+        elif parser.peek() in (b'\n', b'\r'):
+            parser.pos += 1
+        return Stream(stream_dict, parser.pos)
+
+    def stream_data(self, stream):
+        length = self.resolve(stream.dict.get('/Length'))
+        if not isinstance(length, int):
+            raise FastPathUnavailable("Stream without usable /Length")
+        data = bytes(self.buffer[stream.data_start:stream.data_start + length])
+        filters = self.resolve(stream.dict.get('/Filter'))
+        if isinstance(filters, list):
+            filters = filters[0] if len(filters) == 1 else filters
+        if filters is None:
+            return data
+        if filters != '/FlateDecode':
+            raise FastPathUnavailable(f"Unsupported stream filter {filters}")
+        data = zlib.decompress(data)
+        params = self.resolve(stream.dict.get('/DecodeParms')) or {}
+        if isinstance(params, list):
+            params = params[0] or {}
+        predictor = params.get('/Predictor', 1)
+        if predictor >= 10:
+            data = apply_png_predictor(data, params.get('/Columns', 1))
+        elif predictor != 1:
+            raise FastPathUnavailable(f"Unsupported predictor {predictor}")
+        return data
+
+    def _lookup(self, num):
+        for kind, section in self._sections:
+            if kind == 'stream':
+                if num in section:
+                    return section[num]
+                continue
+            subsections, hidden = section
+            entry = self._table_entry(subsections, num)
+            if entry is not None and entry[0] != 'free':
+                return entry
+            if num in hidden and hidden[num][0] != 'free':
+                return hidden[num]
+            if entry is not None:
+                return entry
+        return None
+
+    def _table_entry(self, subsections, num):
+        for first, count, pos in subsections:
+            if first <= num < first + count:
+                entry_pos = pos + 20 * (num - first)
+                match = XREF_ENTRY.match(self.buffer[entry_pos:entry_pos + 18])
+                if not match:
+                    raise FastPathUnavailable("Irregular cross-reference entry")
+                if match.group(3) == b'n':
+                    return ('offset', int(match.group(1)))
+                return ('free',)
+        return None
+
+    def get_object(self, ref):
+        entry = self._lookup(ref.num)
+        if entry is None or entry[0] == 'free':
+            return None
+        if entry[0] == 'objstm':
+            return self._object_from_stream(entry[1], entry[2])
+
+        parser = ObjectParser(self.buffer, entry[1])
+        if int(parser.read_token()) != ref.num:
+            raise FastPathUnavailable(f"Object {ref.num} is not at its recorded offset")
+        parser.read_token()
+        parser.expect(b'obj')
+        # For stream objects only the dictionary is returned; bodies are read on demand
+        return parser.parse()
+
+    def _read_stream_object(self, num):
+        entry = self._lookup(num)
+        if not entry or entry[0] != 'offset':
+            raise FastPathUnavailable(f"Object stream {num} not found")
+        parser = ObjectParser(self.buffer, entry[1])
+        parser.read_token()
+        parser.read_token()
+        parser.expect(b'obj')
+        return self._read_stream_after_dict(parser)
+
+    def _object_from_stream(self, stream_num, index):
+        if stream_num not in self._object_streams:
+            stream = self._read_stream_object(stream_num)
+            data = self.stream_data(stream)
+            header = ObjectParser(data, 0)
+            count = stream.dict['/N']
+            offsets = [(int(header.read_token()), int(header.read_token())) for _ in range(count)]
+            self._object_streams[stream_num] = (data, stream.dict['/First'], offsets)
+        data, first, offsets = self._object_streams[stream_num]
+        return ObjectParser(data, first + offsets[index][1]).parse()
+
+    def resolve(self, value):
+        depth = 0
+        while isinstance(value, Ref):
+            depth += 1
+            if depth > 32:
+                raise FastPathUnavailable("Reference loop")
+            value = self.get_object(value)
+        return value
+
+def read_info_and_page_count(buffer):
+    """Return (info, page_count) read via the trailer alone.
+
+    info maps '/Title' style keys to decoded text (the same objects PyPDF2
+    produces), or is None when the document has no Info dictionary.
+    Raises FastPathUnavailable whenever the full parser should be used.
+    """
+    try:
+        index = PdfIndex(buffer)
+
+        root = index.resolve(index.trailer.get('/Root'))
+        pages = index.resolve(root['/Pages']) if isinstance(root, dict) else None
+        page_count = index.resolve(pages.get('/Count')) if isinstance(pages, dict) else None
+        if not isinstance(page_count, int):
+            raise FastPathUnavailable("Page tree has no /Count")
+
+        info = None
+        raw_info = index.resolve(index.trailer.get('/Info'))
+        if isinstance(raw_info, dict):
+            info = {}
+            for key, value in raw_info.items():
+                value = index.resolve(value)
+                if isinstance(value, bytes):
+                    value = create_string_object(value)
+                info[key] = value
+        return info, page_count
+    except FastPathUnavailable:
+        raise
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError, zlib.error) as e:
+        raise FastPathUnavailable(str(e))
+
+def generate_metadata_hash(metadata):
+    """Generate various hashes from PDF metadata for identification and comparison"""
+    try:
+        # Extract key fields for hashing
+        title = metadata.get('title', '')
+        creator = metadata.get('creator', '')
+        producer = metadata.get('producer', '')
+        creation_date = metadata.get('creation_date', '')
+        modification_date = metadata.get('modification_date', '')
+        
+        # Concatenate key metadata fields
+        metadata_string = f"{title}|{creator}|{producer}|{creation_date}|{modification_date}"
+        
+        # Generate different types of hashes
+        hashes = {}
+        
+        # MD5 hash
+        hashes['md5'] = hashlib.md5(metadata_string.encode('utf-8')).hexdigest()
+        
+        # SHA1 hash
+        hashes['sha1'] = hashlib.sha1(metadata_string.encode('utf-8')).hexdigest()
+        
+        # SHA256 hash
+        hashes['sha256'] = hashlib.sha256(metadata_string.encode('utf-8')).hexdigest()
+        
+        # Short ID (first 8 characters of SHA256)
+        hashes['short_id'] = hashes['sha256'][:8]
+        
+        # JSON fingerprint hash (for structured comparison)
+        json_metadata = json.dumps(metadata, sort_keys=True, default=str)
+        hashes['json_fingerprint'] = hashlib.sha256(json_metadata.encode('utf-8')).hexdigest()
+        
+        # Print hash information to console
+        print("METADATA HASHES GENERATED:")
+        print("-" * 30)
+        for hash_type, hash_value in hashes.items():
+            print(f"{hash_type.upper()}: {hash_value}")
+        print("-" * 30)
+        
+        return hashes
+        
+    except Exception as e:
+        print(f"Error generating metadata hash: {e}")
+        return {"error": f"Failed to generate hash: {str(e)}"}
+
+def format_pdf_date(value):
+    """Convert a PDF date (D:YYYYMMDDHHmmSSOHH'mm') to ISO format, or return it as a string"""
+    try:
+        if value.startswith('D:'):
+            date_str = value[2:16]  # Extract YYYYMMDDHHMMSS
+            parsed_date = datetime.strptime(date_str, '%Y%m%d%H%M%S')
+            return parsed_date.isoformat()
+        return str(value)
+    except:
+        return str(value)
+
+def read_pdf_info(pdf_data):
+    """Return (Info dictionary, page count), reading only the trailer when the file allows it"""
+    try:
+        return read_info_and_page_count(pdf_data)
+    except FastPathUnavailable as e:
+        print(f"Metadata fast path unavailable ({e}); using the full parser")
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+    return pdf_reader.metadata, len(pdf_reader.pages)
+
+def extract_pdf_metadata(pdf_bytes):
+    """Extract metadata from PDF bytes (or a memory-mapped PDF)"""
+    try:
+        metadata, page_count = read_pdf_info(pdf_bytes)
+        
+        if not metadata:
+            print("No metadata found in PDF")
+            return {"message": "No metadata found in PDF"}
+        
+        # Extract common metadata fields
+        extracted_metadata = {}
+        
+        # Title
+        if '/Title' in metadata:
+            extracted_metadata['title'] = metadata['/Title']
+        
+        # Author
+        if '/Author' in metadata:
+            extracted_metadata['author'] = metadata['/Author']
+        
+        # Subject
+        if '/Subject' in metadata:
+            extracted_metadata['subject'] = metadata['/Subject']
+        
+        # Creator (application that created the PDF)
+        if '/Creator' in metadata:
+            extracted_metadata['creator'] = metadata['/Creator']
+        
+        # Producer (application that produced the PDF)
+        if '/Producer' in metadata:
+            extracted_metadata['producer'] = metadata['/Producer']
+        
+        # Creation date
+        if '/CreationDate' in metadata:
+            extracted_metadata['creation_date'] = format_pdf_date(metadata['/CreationDate'])
+        
+        # Modification date
+        if '/ModDate' in metadata:
+            extracted_metadata['modification_date'] = format_pdf_date(metadata['/ModDate'])
+        
+        # Additional info
+        extracted_metadata['page_count'] = page_count
+        
+        # Generate hashes from metadata
+        metadata_hashes = generate_metadata_hash(extracted_metadata)
+        extracted_metadata['hashes'] = metadata_hashes
+        
+        # Print metadata to console
+        print("=" * 50)
+        print("PDF METADATA EXTRACTED:")
+        print("=" * 50)
+        for key, value in extracted_metadata.items():
+            if key != 'hashes':  # Print hashes separately
+                print(f"{key.replace('_', ' ').title()}: {value}")
+        print("=" * 50)
+        
+        return extracted_metadata
+        
+    except Exception as e:
+        print(f"Error extracting PDF metadata: {e}")
+        return {"error": f"Failed to extract metadata: {str(e)}"}
+
+def fingerprint_pdf(pdf, pdf_sha256=None):
+    """Batch worker task: content hash of the file plus its extracted metadata and hashes.
+
+    pdf is the PDF's bytes, or the path of a file on disk that is memory-mapped
+    rather than copied; a known pdf_sha256 saves hashing it again.
+    """
+    if isinstance(pdf, str):
+        with mapped_file(pdf) as buffer:
+            return fingerprint_pdf(buffer, pdf_sha256)
+    return {
+        "pdf_sha256": pdf_sha256 or hashlib.sha256(pdf).hexdigest(),
+        "size_bytes": len(pdf),
+        "metadata": extract_pdf_metadata(pdf)
+    }
@@ -0,0 +1,71 @@
+import numpy as np
+from PIL import Image
+from config import config
+
+# Adaptive colour depth for archive PNGs. Rendered forms are nearly always
+# black on white or grayscale, so writing them as 24-bit RGB wastes most of
+# the file; each page is classified on a decimated copy and written as a
+# 1-bit, 8-bit grayscale or palette PNG instead.
+
+COLOR_CLASSES = ('bilevel', 'grayscale', 'color')
+
+def color_class(image):
+    """Classify a page as 'bilevel', 'grayscale' or 'color' from a nearest-neighbour sample"""
+    factor = max(1, config.COLOR_SAMPLE_FACTOR)
+    sample = image
+    if factor > 1 and image.width >= factor and image.height >= factor:
+        # Nearest-neighbour keeps original pixel values; averaging would invent greys and tints
+        sample = image.resize((image.width // factor, image.height // factor), Image.Resampling.NEAREST)
+    if sample.mode in ('1', 'L'):
+        pixels = np.asarray(sample.convert('L'), dtype=np.int16)
+    else:
+        rgb = np.asarray(sample.convert('RGB'), dtype=np.int16)
+        spread = rgb.max(axis=2) - rgb.min(axis=2)
+        if np.count_nonzero(spread > config.COLOR_CHANNEL_TOLERANCE) > config.COLOR_MAX_TINTED_RATIO * spread.size:
+            return 'color'
+        pixels = rgb[..., 1]
+
+    extremes = np.count_nonzero((pixels <= 32) | (pixels >= 223))
+    if extremes >= config.BILEVEL_MIN_EXTREME_RATIO * pixels.size:
+        return 'bilevel'
+    return 'grayscale'
+
+def reduce_color_depth(image, page_class):
+    """The image converted to the smallest PNG mode that keeps its class"""
+    if page_class == 'bilevel':
+        return image.convert('L').point(lambda value: 255 if value >= 128 else 0, mode='1')
+    if page_class == 'grayscale':
+        return image.convert('L')
+    if not config.PNG_COLOR_PALETTE:
+        return image.convert('RGB')
+    rgb = image.convert('RGB')
+    colors = rgb.getcolors(256)
+    if colors is not None:
+        # Few enough distinct colours for an exact palette
+        return rgb.quantize(colors=len(colors), method=Image.Quantize.MAXCOVERAGE, dither=Image.Dither.NONE)
+    return rgb.quantize(colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+
+def stored_mode(page_class):
+    """PNG mode save_page_png writes for a page of page_class"""
+    if page_class == 'bilevel':
+        return '1'
+    if page_class == 'grayscale':
+        return 'L'
+    return 'P' if config.PNG_COLOR_PALETTE else 'RGB'
+
+def save_page_png(image, filepath, page_class=None):
+    """Write a page as PNG at the depth its content needs; returns its colour class (None if not adaptive)
+
+    A page_class the caller already has is used instead of classifying again.
+    """
+    if not config.PNG_ADAPTIVE_COLOR:
+        image.save(filepath, 'PNG', compress_level=config.PNG_COMPRESS_LEVEL)
+        return None
+    page_class = page_class or color_class(image)
+    reduced = reduce_color_depth(image, page_class)
+    try:
+        reduced.save(filepath, 'PNG', compress_level=config.PNG_COMPRESS_LEVEL)
+    finally:
+        if reduced is not image:
+            reduced.close()
+    return page_class
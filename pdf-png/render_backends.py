@@ -0,0 +1,108 @@
+import os
+import threading
+from pdf2image import convert_from_path, pdfinfo_from_path
+from config import config
+
+# Rasterizers that turn a window of PDF pages into PIL images.
+#
+#   poppler  runs pdftoppm (via pdf2image) once per page window; it can also
+#            write the page PNGs itself (RENDER_DIRECT_TO_DISK)
+#   pdfium   renders in this process through pypdfium2, so there is no process
+#            spawn, font set-up or temporary file per window
+#
+# RENDER_BACKEND picks one per deployment. Which one is faster depends on the
+# documents; benchmark_renderers.py compares them on a corpus.
+
+class PopplerBackend:
+    name = 'poppler'
+    writes_files = True
+
+    def page_count(self, pdf_path):
+        """Read the page count from pdfinfo without rendering anything"""
+        info = pdfinfo_from_path(pdf_path, poppler_path=config.POPPLER_PATH)
+        return int(info['Pages'])
+
+    def render(self, pdf_path, first_page, last_page, dpi, thread_count=1):
+        """Render pages first_page..last_page as RGB images"""
+        return convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            fmt='png',
+            first_page=first_page,
+            last_page=last_page,
+            thread_count=thread_count,
+            poppler_path=config.POPPLER_PATH
+        )
+
+    def render_to_files(self, pdf_path, first_page, last_page, dpi, output_dir, prefix):
+        """Have pdftoppm write pages first_page..last_page into output_dir; returns [(page_number, path)]"""
+        paths = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            fmt='png',
+            first_page=first_page,
+            last_page=last_page,
+            output_folder=output_dir,
+            output_file=prefix,
+            paths_only=True,
+            thread_count=1,
+            poppler_path=config.POPPLER_PATH
+        )
+        # pdftoppm names files <prefix...>-<zero padded page number>.png
+        return sorted((int(os.path.splitext(path)[0].rsplit('-', 1)[1]), path) for path in paths)
+
+# PDFium keeps global state and must not be entered from two threads at once;
+# separate render processes each have their own copy
+_pdfium_lock = threading.Lock()
+
+class PdfiumBackend:
+    name = 'pdfium'
+    writes_files = False
+
+    def __init__(self):
+        # Optional dependency, only needed when this backend is selected
+        import pypdfium2
+        self.pdfium = pypdfium2
+
+    def page_count(self, pdf_path):
+        with _pdfium_lock:
+            pdf = self.pdfium.PdfDocument(pdf_path)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+
+    def render(self, pdf_path, first_page, last_page, dpi, thread_count=1):
+        """Render pages first_page..last_page as RGB images (thread_count is ignored)"""
+        images = []
+        with _pdfium_lock:
+            pdf = self.pdfium.PdfDocument(pdf_path)
+            try:
+                # Draw form field values the way poppler does
+                pdf.init_forms()
+                for page_index in range(first_page - 1, last_page):
+                    page = pdf[page_index]
+                    try:
+                        bitmap = page.render(scale=dpi / 72)
+                        images.append(bitmap.to_pil().convert('RGB'))
+                        bitmap.close()
+                    finally:
+                        page.close()
+            finally:
+                pdf.close()
+        return images
+
+BACKENDS = {backend.name: backend for backend in (PopplerBackend, PdfiumBackend)}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(name=None):
+    """The render backend called name (default RENDER_BACKEND), created once per process"""
+    name = (name or config.RENDER_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown render backend '{name}'. Use one of: {', '.join(BACKENDS)}.")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
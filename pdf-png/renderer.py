@@ -0,0 +1,372 @@
+import math
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+from PIL import Image
+from config import config
+from renditions import make_rendition, rendition_filename, save_rendition
+from blank_pages import is_blank_page
+from page_crop import crop_box, crop_details
+from png_encoding import color_class, save_page_png, stored_mode
+from page_fingerprints import perceptual_hash
+from render_backends import get_backend
+
+def iter_page_windows(page_count, window_size, skip_pages=None):
+    """Yield (first_page, last_page) ranges that cover pages 1..page_count in order, leaving out skip_pages"""
+    window_size = max(1, int(window_size))
+    skip_pages = skip_pages or ()
+    first_page = None
+    for page_number in range(1, page_count + 2):
+        if page_number <= page_count and page_number not in skip_pages:
+            if first_page is None:
+                first_page = page_number
+            if page_number - first_page + 1 == window_size:
+                yield first_page, page_number
+                first_page = None
+        elif first_page is not None:
+            yield first_page, page_number - 1
+            first_page = None
+
+def page_dpi(width, height, dpi, max_pixels=None, min_dpi=None):
+    """DPI to render a width x height point page at: dpi, lowered until the raster fits max_pixels.
+
+    min_dpi is a floor for legibility and wins over the budget; max_pixels=0 disables it.
+    """
+    max_pixels = config.RENDER_MAX_PIXELS if max_pixels is None else max_pixels
+    min_dpi = min(dpi, config.RENDER_MIN_DPI if min_dpi is None else min_dpi)
+    if not max_pixels or width <= 0 or height <= 0:
+        return dpi
+    pixels = lambda d: math.ceil(width * d / 72) * math.ceil(height * d / 72)
+    fitting = min(dpi, int(72 * math.sqrt(max_pixels / (width * height))))
+    # Rasterizers round page dimensions up; step down until that still fits
+    while fitting > min_dpi and pixels(fitting) > max_pixels:
+        fitting -= 1
+    return max(fitting, min_dpi)
+
+def get_page_sizes(pdf_path):
+    """{page number: (width, height)} in points from each page's MediaBox, scaled by /UserUnit"""
+    reader = PyPDF2.PdfReader(pdf_path)
+    if reader.is_encrypted and not reader.decrypt(''):
+        raise ValueError("PDF is encrypted.")
+    sizes = {}
+    for page_number, page in enumerate(reader.pages, start=1):
+        box = page.mediabox
+        unit = float(page.get('/UserUnit', 1))
+        sizes[page_number] = (abs(float(box.width)) * unit, abs(float(box.height)) * unit)
+    return sizes
+
+def plan_page_dpis(pdf_path, dpi, max_pixels=None, min_dpi=None):
+    """{page number: DPI} keeping every page within the pixel budget (see page_dpi).
+
+    Reading the page sizes first means an oversized plan or receipt is never
+    rendered at full DPI. When they cannot be read every page gets dpi.
+    """
+    try:
+        sizes = get_page_sizes(pdf_path)
+    except Exception as e:
+        print(f"Could not read page sizes of {pdf_path}, rendering every page at {dpi} DPI: {e}")
+        return {}
+    return {
+        page_number: page_dpi(width, height, dpi, max_pixels, min_dpi)
+        for page_number, (width, height) in sizes.items()
+    }
+
+def iter_render_windows(page_count, window_size, dpi, page_dpis=None, skip_pages=None):
+    """Like iter_page_windows, but yields (first_page, last_page, dpi), splitting windows where the DPI changes"""
+    page_dpis = page_dpis or {}
+    for first_page, last_page in iter_page_windows(page_count, window_size, skip_pages):
+        start = first_page
+        for page_number in range(first_page + 1, last_page + 2):
+            start_dpi = page_dpis.get(start, dpi)
+            if page_number > last_page or page_dpis.get(page_number, dpi) != start_dpi:
+                yield start, page_number - 1, start_dpi
+                start = page_number
+
+def get_page_count(pdf_path, backend=None):
+    """Read the page count without rendering anything"""
+    return get_backend(backend).page_count(pdf_path)
+
+def render_pages(pdf_path, dpi=None, window_size=None, page_count=None, skip_pages=None, backend=None,
+                 page_dpis=None):
+    """Render a PDF a bounded window of pages at a time, yielding (page_number, image).
+
+    Only one window of decoded images is alive at any moment, so peak memory
+    depends on the window size rather than on the number of pages. Pages
+    listed in page_dpis are rendered at that DPI instead of dpi.
+    """
+    dpi = dpi or config.RENDER_DPI
+    window_size = window_size or config.RENDER_WINDOW_SIZE
+    renderer = get_backend(backend)
+    page_count = page_count or renderer.page_count(pdf_path)
+
+    for first_page, last_page, window_dpi in iter_render_windows(page_count, window_size, dpi, page_dpis, skip_pages):
+        images = renderer.render(pdf_path, first_page, last_page, window_dpi, thread_count=last_page - first_page + 1)
+        page_number = first_page
+        while images:
+            # Drop our reference as we go so each page can be freed once saved
+            yield page_number, images.pop(0)
+            page_number += 1
+
+def page_filename(filename_base, page_number):
+    return f"{filename_base}_page_{page_number}.png"
+
+def save_renditions(image, output_dir, filename_base, page_number, dpi, renditions):
+    """Derive and write every extra rendition of one page, returning {profile: filename}"""
+    saved = {}
+    for profile_name in renditions:
+        rendition = make_rendition(image, profile_name, dpi)
+        filename = rendition_filename(filename_base, page_number, profile_name)
+        try:
+            save_rendition(rendition, os.path.join(output_dir, filename), profile_name)
+        finally:
+            if rendition is not image:
+                rendition.close()
+        saved[profile_name] = filename
+    return saved
+
+def classify_blank(page, image, blank_pages):
+    """Record whether a page is blank; returns True if it should be left out of the output.
+
+    blank_pages is None (no detection), 'keep' (flag only) or 'exclude'.
+    Excluded pages keep their dict, with no filename, so callers can report them.
+    """
+    if not blank_pages:
+        return False
+    blank, stats = is_blank_page(image)
+    page["blank"] = blank
+    page["ink_ratio"] = stats["ink_ratio"]
+    if blank and blank_pages == 'exclude':
+        page["filename"] = page["filepath"] = None
+        return True
+    return False
+
+def crop_to_content(page, image, crop_padding, dpi):
+    """Crop a page to its ink plus crop_padding points (None disables cropping).
+
+    Returns the image to save, the original one when there is nothing to trim,
+    and records the crop box on the page so coordinates can be mapped back.
+    """
+    if crop_padding is None:
+        return image
+    box = crop_box(image, crop_padding, dpi)
+    if box is None:
+        return image
+    cropped = image.crop(box)
+    page["crop"] = crop_details(box, image.size, dpi)
+    page["width"], page["height"] = cropped.size
+    return cropped
+
+def write_page_png(page, image, filepath, page_class=None):
+    """Encode the archive PNG at the colour depth the page needs, recording its colour class"""
+    page_class = save_page_png(image, filepath, page_class)
+    if page_class:
+        page["color_class"] = page_class
+
+def save_pages(pages, output_dir, filename_base, dpi=None, renditions=(), blank_pages=None, crop_padding=None,
+               page_dpis=None):
+    """Encode and write each page as soon as it is rendered, yielding one dict per page.
+
+    Besides the archival PNG, every extra rendition profile is derived from the
+    same in-memory raster, so a page is only ever rendered once. page_dpis
+    gives the DPI of pages that were not rendered at dpi.
+
+    Each dict records render_seconds, the time spent waiting for the page
+    from pages, and encode_seconds, the time spent writing it.
+    """
+    dpi = dpi or config.RENDER_DPI
+    page_dpis = page_dpis or {}
+    pages = iter(pages)
+    while True:
+        started = time.perf_counter()
+        try:
+            page_number, image = next(pages)
+        except StopIteration:
+            return
+        rendered = time.perf_counter()
+        page_dpi = page_dpis.get(page_number, dpi)
+        output_filename = page_filename(filename_base, page_number)
+        output_filepath = os.path.join(output_dir, output_filename)
+        page = {
+            "page_number": page_number,
+            "filename": output_filename,
+            "filepath": output_filepath,
+            "width": image.width,
+            "height": image.height,
+            "dpi": page_dpi,
+            "renditions": {},
+            "phash": perceptual_hash(image),
+            "render_seconds": rendered - started
+        }
+        try:
+            if not classify_blank(page, image, blank_pages):
+                output_image = crop_to_content(page, image, crop_padding, page_dpi)
+                try:
+                    write_page_png(page, output_image, output_filepath)
+                    page["renditions"] = save_renditions(output_image, output_dir, filename_base, page_number,
+                                                         page_dpi, renditions)
+                finally:
+                    if output_image is not image:
+                        output_image.close()
+        finally:
+            image.close()
+        page["encode_seconds"] = time.perf_counter() - rendered
+        yield page
+
+def render_window_to_disk(pdf_path, first_page, last_page, dpi, output_dir, filename_base, renditions=(),
+                          blank_pages=None, crop_padding=None):
+    """Have poppler write a page window straight into output_dir, yielding one dict per page.
+
+    The PNGs poppler produces are renamed into the <name>_page_<n>.png
+    convention rather than re-encoded. A file is decoded only when blank
+    detection, cropping, renditions or adaptive colour depth need its pixels;
+    the perceptual hash is taken from that same decode and left out when
+    nothing reads the pixels. poppler writes RGB, so the file is written
+    again only when the page is cropped or its colour class is stored at
+    another depth. The window's render time is shared out evenly over its
+    pages as render_seconds.
+    """
+    started = time.perf_counter()
+    numbered = get_backend('poppler').render_to_files(pdf_path, first_page, last_page, dpi, output_dir,
+                                                      f".render-{uuid.uuid4().hex}")
+    render_seconds = (time.perf_counter() - started) / max(1, len(numbered))
+    decode = bool(blank_pages or crop_padding is not None or renditions or config.PNG_ADAPTIVE_COLOR)
+    for page_number, path in numbered:
+        encode_started = time.perf_counter()
+        output_filename = page_filename(filename_base, page_number)
+        output_filepath = os.path.join(output_dir, output_filename)
+        os.replace(path, output_filepath)
+
+        with Image.open(output_filepath) as image:
+            # Opening only parses the header; pixels are decoded just for the stages that need them
+            page = {
+                "page_number": page_number,
+                "filename": output_filename,
+                "filepath": output_filepath,
+                "width": image.width,
+                "height": image.height,
+                "dpi": dpi,
+                "renditions": {},
+                "render_seconds": render_seconds
+            }
+            if decode:
+                page["phash"] = perceptual_hash(image)
+            excluded = classify_blank(page, image, blank_pages)
+            if not excluded:
+                output_image = crop_to_content(page, image, crop_padding, dpi)
+                try:
+                    page_class = color_class(output_image) if config.PNG_ADAPTIVE_COLOR else None
+                    if output_image is not image or (page_class and stored_mode(page_class) != image.mode):
+                        encoded_path = output_filepath + '.encode.tmp'
+                        write_page_png(page, output_image, encoded_path, page_class)
+                        os.replace(encoded_path, output_filepath)
+                    elif page_class:
+                        page["color_class"] = page_class
+                    page["renditions"] = save_renditions(output_image, output_dir, filename_base, page_number, dpi,
+                                                         renditions)
+                finally:
+                    if output_image is not image:
+                        output_image.close()
+        if excluded:
+            os.remove(output_filepath)
+        page["encode_seconds"] = time.perf_counter() - encode_started
+        yield page
+
+def available_cores():
+    """CPU cores this process may run on (respects container CPU sets)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def resolve_process_count(requested=None):
+    """RENDER_PROCESSES=0 means one worker per available core"""
+    requested = config.RENDER_PROCESSES if requested is None else requested
+    return requested if requested > 0 else available_cores()
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Shared render pool, created lazily so pre-forked servers build it after forking"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=resolve_process_count(),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+def render_and_save_range(pdf_path, first_page, last_page, dpi, output_dir, filename_base, renditions=(), direct=True,
+                          blank_pages=None, crop_padding=None, backend=None):
+    """Worker task: render and encode one page range, returning its page dicts"""
+    if direct:
+        return list(render_window_to_disk(pdf_path, first_page, last_page, dpi, output_dir, filename_base, renditions,
+                                          blank_pages, crop_padding))
+    images = get_backend(backend).render(pdf_path, first_page, last_page, dpi)
+    pages = ((first_page + offset, image) for offset, image in enumerate(images))
+    return list(save_pages(pages, output_dir, filename_base, dpi=dpi, renditions=renditions, blank_pages=blank_pages,
+                           crop_padding=crop_padding))
+
+def render_and_save(pdf_path, output_dir, filename_base, dpi=None, window_size=None, processes=None, renditions=(),
+                    direct=None, blank_pages=None, crop_padding=None, skip_pages=None, backend=None,
+                    max_pixels=None, min_dpi=None):
+    """Render and write every page, yielding page dicts (see save_pages) in page order.
+
+    Page windows are spread over the process pool so rendering and PNG
+    encoding run on all cores; results are still yielded strictly in page
+    order, each as soon as it and every page before it is on disk. Single
+    page documents and single-core deployments render in-process.
+
+    backend names the rasterizer (RENDER_BACKEND by default, see
+    render_backends). With direct (RENDER_DIRECT_TO_DISK) and a backend that
+    writes files, poppler writes the page files itself; otherwise pages are
+    rendered into PIL images and encoded here.
+    blank_pages turns on blank page detection (see classify_blank) and
+    crop_padding trims pages to their content (see crop_to_content).
+    Pages in skip_pages (already available from earlier conversions) are
+    neither rendered nor yielded. Pages too large to render at dpi within
+    max_pixels (RENDER_MAX_PIXELS) get a lower DPI, no lower than min_dpi
+    (RENDER_MIN_DPI); every page dict records the DPI it was rendered at.
+    """
+    renderer = get_backend(backend)
+    direct = (config.RENDER_DIRECT_TO_DISK if direct is None else direct) and renderer.writes_files
+    dpi = dpi or config.RENDER_DPI
+    window_size = window_size or config.RENDER_WINDOW_SIZE
+    processes = resolve_process_count(processes)
+    page_count = renderer.page_count(pdf_path)
+    skip_pages = set(skip_pages or ())
+    render_count = len([number for number in range(1, page_count + 1) if number not in skip_pages])
+    page_dpis = plan_page_dpis(pdf_path, dpi, max_pixels, min_dpi)
+
+    if processes <= 1 or render_count <= 1:
+        if direct:
+            for first_page, last_page, window_dpi in iter_render_windows(page_count, window_size, dpi, page_dpis,
+                                                                         skip_pages):
+                yield from render_window_to_disk(pdf_path, first_page, last_page, window_dpi, output_dir,
+                                                 filename_base, renditions, blank_pages, crop_padding)
+            return
+        pages = render_pages(pdf_path, dpi=dpi, window_size=window_size, page_count=page_count, skip_pages=skip_pages,
+                             backend=renderer.name, page_dpis=page_dpis)
+        yield from save_pages(pages, output_dir, filename_base, dpi=dpi, renditions=renditions, blank_pages=blank_pages,
+                              crop_padding=crop_padding, page_dpis=page_dpis)
+        return
+
+    # Shrink windows on short documents so every worker gets a share of the pages
+    window_size = max(1, min(window_size, -(-render_count // processes)))
+    pool = get_process_pool()
+    futures = [
+        pool.submit(render_and_save_range, pdf_path, first_page, last_page, window_dpi, output_dir, filename_base,
+                    renditions, direct, blank_pages, crop_padding, renderer.name)
+        for first_page, last_page, window_dpi in iter_render_windows(page_count, window_size, dpi, page_dpis,
+                                                                     skip_pages)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,79 @@
+import math
+from PIL import Image
+from config import config
+
+# Extra output profiles, derived from the rendered raster by downscaling and
+# re-encoding. The archive PNG itself is not a profile: its DPI is chosen per
+# page (see renderer.page_dpi) and its depth by png_encoding.
+RENDITION_PROFILES = {
+    'preview': {
+        'dpi': 72,
+        'color_mode': 'RGB',
+        'format': 'JPEG',
+        'quality': 70,
+        'max_pixels': 600_000
+    },
+    # Smallest raster the extraction model still reads form labels from reliably:
+    # grayscale JPEG around 1.5 megapixels (roughly 1000x1450 for A4/Letter)
+    'llm': {
+        'dpi': config.LLM_RENDITION_DPI,
+        'color_mode': 'L',
+        'format': config.LLM_RENDITION_FORMAT,
+        'quality': 85,
+        'max_pixels': config.LLM_RENDITION_MAX_PIXELS
+    }
+}
+
+# Accepted in a renditions list for the archive PNG, which is always produced
+ARCHIVE_RENDITION = 'archive'
+
+FILE_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp'}
+
+def parse_rendition_names(value):
+    """Parse a comma-separated list of extra profiles; raises ValueError on unknown names"""
+    if value is None:
+        value = config.DEFAULT_RENDITIONS
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in RENDITION_PROFILES and name != ARCHIVE_RENDITION]
+    if unknown:
+        raise ValueError(f"Unknown rendition profile(s): {', '.join(unknown)}. "
+                         f"Available: {', '.join(sorted(RENDITION_PROFILES))}")
+    # The archive images are always produced; only the extra profiles are listed
+    return tuple(dict.fromkeys(name for name in names if name != ARCHIVE_RENDITION))
+
+def rendition_scale(width, height, profile, source_dpi):
+    """Downscale factor (never above 1) that satisfies the profile's DPI and pixel budget"""
+    scale = 1.0
+    if profile.get('dpi'):
+        scale = min(scale, profile['dpi'] / source_dpi)
+    if profile.get('max_pixels'):
+        scale = min(scale, math.sqrt(profile['max_pixels'] / float(width * height)))
+    return scale
+
+def make_rendition(image, profile_name, source_dpi):
+    """Return a new image converted for the named profile"""
+    profile = RENDITION_PROFILES[profile_name]
+    width, height = image.size
+    scale = rendition_scale(width, height, profile, source_dpi)
+
+    rendition = image
+    if profile.get('color_mode') and rendition.mode != profile['color_mode']:
+        # Convert before resizing so grayscale profiles resample a third of the data
+        rendition = rendition.convert(profile['color_mode'])
+    if scale < 1.0:
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        rendition = rendition.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return rendition
+
+def rendition_filename(filename_base, page_number, profile_name):
+    extension = FILE_EXTENSIONS[RENDITION_PROFILES[profile_name]['format']]
+    return f"{filename_base}_page_{page_number}.{profile_name}.{extension}"
+
+def save_rendition(image, filepath, profile_name):
+    profile = RENDITION_PROFILES[profile_name]
+    options = {}
+    if profile['format'] in ('JPEG', 'WEBP'):
+        options['quality'] = profile.get('quality', 85)
+    if profile['format'] in ('JPEG', 'PNG'):
+        options['optimize'] = True
+    image.save(filepath, profile['format'], **options)
@@ -0,0 +1,295 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from config import config
+from jobs import job_manager
+
+# Index of the conversion directories under the generated images directory,
+# kept in SQLite so every server process shares it. A directory is recorded
+# when it is created ('pending'), completed once its manifest is written
+# ('ready') and touched when the API hands it out again (a conversion cache
+# hit), so retention never has to walk the tree. The sweeper then removes:
+#
+#   ready directories created more than RETENTION_TTL_SECONDS ago
+#   the least recently used ready directories while the total is over CACHE_MAX_BYTES
+#   pending directories (conversions that died midway) idle for CACHE_STALE_SECONDS
+#
+# Page views are not seen: nginx serves the images straight from disk, so
+# expiry counts from creation and "used" means returned by the API.
+#
+# A new index imports the directories already there once, from their manifests.
+
+STATE_PENDING = 'pending'
+STATE_READY = 'ready'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversions (
+    name TEXT PRIMARY KEY,
+    pdf_sha256 TEXT,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversions_by_access ON conversions (state, last_access);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+class RetentionIndex:
+    """SQLite record of every conversion directory: size, PDF hash, creation and last access"""
+
+    def __init__(self, root_dir=None, db_path=None, ttl_seconds=None, max_bytes=None, stale_seconds=None):
+        self.root_dir = root_dir or config.GENERATED_IMAGES_DIR
+        # Beside the tree rather than in it: the images directory is served as it is
+        self.db_path = db_path or (config.RETENTION_INDEX_PATH if root_dir is None else
+                                   os.path.abspath(self.root_dir.rstrip(os.sep)) + '.retention.sqlite3')
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.RETENTION_TTL_SECONDS
+        self.max_bytes = max_bytes if max_bytes is not None else config.CACHE_MAX_BYTES
+        self.stale_seconds = stale_seconds if stale_seconds is not None else config.CACHE_STALE_SECONDS
+        self._setup_done = False
+        self._setup_lock = threading.Lock()
+        # name -> when this process last wrote its access time
+        self._touched = {}
+
+    @contextmanager
+    def _connect(self):
+        self._setup()
+        with closing(self._open()) as conn:
+            yield conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def _setup(self):
+        if self._setup_done:
+            return
+        with self._setup_lock:
+            if self._setup_done:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            with closing(self._open()) as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    if conn.execute("SELECT 1 FROM settings WHERE key = 'imported'").fetchone() is None:
+                        self._import_existing(conn)
+                        conn.execute("INSERT INTO settings VALUES ('imported', ?)", (time.time(),))
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+                conn.execute('COMMIT')
+            self._setup_done = True
+
+    def _import_existing(self, conn):
+        """Record directories that predate the index; the only time the tree is listed"""
+        from conversion_cache import MANIFEST_FILENAME, load_manifest
+        if not os.path.isdir(self.root_dir):
+            return
+        rows = []
+        for entry in os.scandir(self.root_dir):
+            if entry.name.startswith('.') or not entry.is_dir():
+                continue
+            manifest = load_manifest(entry.path)
+            created_at = entry.stat().st_mtime
+            if manifest:
+                last_access = os.path.getmtime(os.path.join(entry.path, MANIFEST_FILENAME))
+                rows.append((entry.name, manifest.get('pdf_sha256'), manifest.get('size_bytes', 0), STATE_READY,
+                             created_at, last_access))
+            else:
+                rows.append((entry.name, None, 0, STATE_PENDING, created_at, created_at))
+        conn.executemany("INSERT OR IGNORE INTO conversions VALUES (?, ?, ?, ?, ?, ?)", rows)
+        if rows:
+            print(f"Retention index: imported {len(rows)} existing conversion directories")
+
+    def record(self, name, pdf_sha256=None):
+        """A conversion directory was just created (or reclaimed) and is being written"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO conversions VALUES (?, ?, 0, ?, ?, ?)",
+                         (name, pdf_sha256, STATE_PENDING, now, now))
+
+    def complete(self, name, size_bytes, pdf_sha256=None):
+        """A conversion directory has its manifest and may be served"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO conversions VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET "
+                "pdf_sha256 = excluded.pdf_sha256, size_bytes = excluded.size_bytes, state = excluded.state, "
+                "last_access = excluded.last_access",
+                (name, pdf_sha256, size_bytes, STATE_READY, now, now)
+            )
+
+    def get(self, name):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM conversions WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def touch(self, name):
+        """Note that the API handed a directory out again; written at most every RETENTION_ACCESS_RESOLUTION_SECONDS"""
+        now = time.time()
+        last = self._touched.get(name)
+        if last is not None and now - last < config.RETENTION_ACCESS_RESOLUTION_SECONDS:
+            return
+        if len(self._touched) > 10000:
+            self._touched.clear()
+        self._touched[name] = now
+        with self._connect() as conn:
+            conn.execute("UPDATE conversions SET last_access = ? WHERE name = ?", (now, name))
+
+    def remove(self, name):
+        """Forget a directory and delete it"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM conversions WHERE name = ?", (name,))
+        self._delete_dirs([name])
+
+    def _delete_rows(self, conn, names):
+        conn.executemany("DELETE FROM conversions WHERE name = ?", [(name,) for name in names])
+
+    def _delete_dirs(self, names):
+        for name in names:
+            self._touched.pop(name, None)
+            shutil.rmtree(os.path.join(self.root_dir, name), ignore_errors=True)
+
+    def enforce_quota(self, max_bytes=None, keep=None):
+        """Remove least recently used ready directories until the total fits max_bytes; returns their names"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        victims = []
+        with self._transaction() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM conversions").fetchone()[0]
+            if total <= max_bytes:
+                return victims
+            rows = conn.execute("SELECT name, size_bytes FROM conversions WHERE state = ? "
+                                "ORDER BY last_access, created_at", (STATE_READY,)).fetchall()
+            for row in rows:
+                if total <= max_bytes:
+                    break
+                if row['name'] == keep:
+                    continue
+                victims.append(row['name'])
+                total -= row['size_bytes']
+            self._delete_rows(conn, victims)
+        for name in victims:
+            print(f"Evicting conversion {name} to stay within {max_bytes} bytes")
+        self._delete_dirs(victims)
+        return victims
+
+    def sweep(self, now=None):
+        """Apply the TTL, abandoned-conversion and size limits once; returns what was removed"""
+        now = now or time.time()
+        with self._transaction() as conn:
+            expired = []
+            if self.ttl_seconds > 0:
+                expired = [row['name'] for row in conn.execute(
+                    "SELECT name FROM conversions WHERE state = ? AND created_at < ?",
+                    (STATE_READY, now - self.ttl_seconds)
+                ).fetchall()]
+            abandoned = []
+            for row in conn.execute("SELECT name FROM conversions WHERE state = ? AND created_at < ?",
+                                    (STATE_PENDING, now - self.stale_seconds)).fetchall():
+                # Still being written to if the directory itself changed recently
+                try:
+                    if now - os.path.getmtime(os.path.join(self.root_dir, row['name'])) < self.stale_seconds:
+                        continue
+                except OSError:
+                    pass
+                abandoned.append(row['name'])
+            self._delete_rows(conn, expired + abandoned)
+        self._delete_dirs(expired + abandoned)
+        return {"expired": expired, "abandoned": abandoned, "evicted": self.enforce_quota()}
+
+    def claim_sweep(self, interval_seconds):
+        """True for the one process whose turn it is to sweep"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO settings VALUES ('last_sweep', ?) ON CONFLICT (key) DO UPDATE SET "
+                "value = excluded.value WHERE value <= ?",
+                (now, now - interval_seconds)
+            )
+            return cursor.rowcount == 1
+
+    def stats(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS total_bytes, "
+                "MIN(last_access) AS oldest_access FROM conversions WHERE state = ?", (STATE_READY,)
+            ).fetchone()
+            pending = conn.execute("SELECT COUNT(*) FROM conversions WHERE state = ?", (STATE_PENDING,)).fetchone()[0]
+        return {
+            "entries": row['entries'],
+            "pending": pending,
+            "total_bytes": row['total_bytes'],
+            "max_bytes": self.max_bytes,
+            "oldest_access": row['oldest_access']
+        }
+
+class RetentionSweeper:
+    """Background thread that sweeps the index every RETENTION_SWEEP_INTERVAL_SECONDS.
+
+    Each server process runs one, started lazily so pre-forked workers start
+    it after forking; the index hands each interval's sweep to one of them.
+    The same sweep removes job state files left behind by exited workers.
+    """
+
+    def __init__(self, index, interval_seconds=None, jobs=None):
+        self.index = index
+        self.jobs = jobs
+        self.interval_seconds = (interval_seconds if interval_seconds is not None
+                                 else config.RETENTION_SWEEP_INTERVAL_SECONDS)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        if self.interval_seconds <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='retention-sweeper', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_seconds)
+            self.sweep_if_due()
+
+    def sweep_if_due(self):
+        """Sweep unless another process already did this interval; returns the sweep result or None"""
+        try:
+            if not self.index.claim_sweep(self.interval_seconds):
+                return None
+            result = self.index.sweep()
+            result['jobs'] = self.jobs.prune_state_files() if self.jobs is not None else []
+        except Exception as e:
+            print(f"Retention sweep failed: {e}")
+            return None
+        if result['expired'] or result['abandoned'] or result['evicted']:
+            print(f"Retention sweep removed {len(result['expired'])} expired, {len(result['abandoned'])} abandoned "
+                  f"and {len(result['evicted'])} evicted conversions")
+        if result['jobs']:
+            print(f"Retention sweep removed the state of {len(result['jobs'])} orphaned or finished jobs")
+        return result
+
+retention_index = RetentionIndex()
+retention_sweeper = RetentionSweeper(retention_index, jobs=job_manager)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test AcroForm field extraction for fillable PDFs
+"""
+import os
+import pytest
+
+from acroform import extract_form_fields
+from conftest import DATA_DIR
+
+FILLABLE_PDF = os.path.join(DATA_DIR, 'sampleform.pdf')
+FLAT_PDF = os.path.join(DATA_DIR, 'StudentForm.pdf')
+
+requires_samples = pytest.mark.skipif(
+    not (os.path.exists(FILLABLE_PDF) and os.path.exists(FLAT_PDF)),
+    reason="sample PDFs not available"
+)
+
+@requires_samples
+def test_fillable_form_fields_are_described():
+    with open(FILLABLE_PDF, 'rb') as f:
+        form = extract_form_fields(f)
+    assert form["has_acroform"]
+    fields = {field["name"]: field for field in form["forms"][0]["fields"]}
+    assert len(fields) == 17
+
+    given_name = fields["Given Name Text Box"]
+    assert given_name["type"] == "textbox"
+    assert given_name["description"] == "First name"
+    assert given_name["page_number"] == 1
+    assert len(given_name["widgets"][0]["rect"]) == 4
+
+    assert fields["Language 2 Check Box"]["type"] == "checkbox"
+    assert fields["Language 2 Check Box"]["value"] is True
+    assert fields["Language 1 Check Box"]["value"] is False
+
+    gender = fields["Gender List Box"]
+    assert gender["type"] == "select"
+    assert gender["options"] == ["Man", "Woman"]
+    assert gender["value"] == "Man"
+
+@requires_samples
+def test_flat_pdf_has_no_fields():
+    with open(FLAT_PDF, 'rb') as f:
+        form = extract_form_fields(f)
+    assert not form["has_acroform"]
+    assert form["forms"][0]["fields"] == []
+
+@requires_samples
+def test_form_fields_endpoint():
+    from app import app
+
+    with open(FILLABLE_PDF, 'rb') as f:
+        response = app.test_client().post('/conversion/form-fields', data={'pdfFile': (f, 'sampleform.pdf')})
+    assert response.status_code == 200
+    assert response.json["field_count"] == 17
+    assert response.json["forms"][0]["title"] == "PDF Form Example"
+    assert "hashes" in response.json["metadata"]
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
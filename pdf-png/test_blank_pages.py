@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test blank and near-blank page detection
+"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from blank_pages import is_blank_page, parse_blank_page_mode
+from conftest import SAMPLE_PDF, requires_poppler
+
+# Five pages, the last of which is empty
+
+def scanned_page(seed=0):
+    """Grey, noisy paper with a dark scanner edge, like a flatbed scan of an empty sheet"""
+    rng = np.random.default_rng(seed)
+    pixels = np.clip(rng.normal(225, 6, (1100, 850)), 0, 255).astype('uint8')
+    pixels[:, :20] = 20
+    return Image.fromarray(pixels)
+
+def test_empty_scan_with_speckles_is_blank():
+    page = scanned_page()
+    ImageDraw.Draw(page).text((420, 1050), "12", fill=0)
+    blank, stats = is_blank_page(page)
+    assert blank
+    assert stats["paper_level"] < 255
+
+def test_page_with_content_is_not_blank():
+    page = scanned_page()
+    draw = ImageDraw.Draw(page)
+    for row in range(10):
+        draw.text((100, 100 + row * 40), "Name of applicant ____________________", fill=0)
+    blank, _ = is_blank_page(page.convert('RGB'))
+    assert not blank
+
+def test_dark_and_inverted_pages_are_not_blank():
+    # Nothing is darker than a dark ground, so the ink ratio alone would call these blank
+    assert not is_blank_page(Image.new('L', (850, 1100), 0))[0]
+    dark = np.full((1100, 850), 30, dtype='uint8')
+    dark[500:560, 100:750] = 255
+    assert not is_blank_page(Image.fromarray(dark))[0]
+
+    inverted = Image.new('L', (850, 1100), 0)
+    draw = ImageDraw.Draw(inverted)
+    for row in range(10):
+        draw.text((100, 100 + row * 40), "Name of applicant ____________________", fill=255)
+    blank, stats = is_blank_page(inverted.convert('RGB'))
+    assert not blank
+    assert stats["paper_level"] == 0
+
+def test_page_with_large_grey_area_is_not_blank():
+    page = np.asarray(scanned_page()).copy()
+    # A faint photo or shaded panel: lighter than ink, but half the page
+    page[:, 425:] = 170
+    blank, stats = is_blank_page(Image.fromarray(page))
+    assert not blank
+    assert stats["ink_ratio"] == 0
+
+def test_blank_page_mode_is_validated():
+    assert parse_blank_page_mode('Exclude') == 'exclude'
+    with pytest.raises(ValueError):
+        parse_blank_page_mode('drop-everything')
+
+@requires_poppler
+def test_conversion_reports_and_excludes_blank_pages():
+    from app import app
+
+    client = app.test_client()
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = client.post('/conversion/pdf-to-png-save', data={'pdfFile': (f, 'guest.pdf'), 'blank_pages': 'keep'})
+    assert response.status_code == 200
+    assert response.json['blank_pages'] == [5]
+    assert len(response.json['accessible_urls']) == 5
+
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = client.post('/conversion/pdf-to-png-save',
+                               data={'pdfFile': (f, 'guest.pdf'), 'blank_pages': 'exclude', 'renditions': 'llm'})
+    assert response.status_code == 200
+    body = response.json
+    assert body['blank_pages'] == [5]
+    assert len(body['accessible_urls']) == body['saved_files_count'] == 4
+    assert len(body['renditions']['llm']) == 4
+    assert body['pages'][4]['url'] is None
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test resumable chunked uploads
+"""
+import hashlib
+import io
+import os
+import time
+import pytest
+
+from chunked_uploads import (
+    ChunkedUploadStore, UploadConflictError, UploadNotFoundError, merge_ranges, parse_content_range
+)
+from jobs import JOB_COMPLETED
+from conftest import SAMPLE_PDF, requires_poppler
+
+PAYLOAD = bytes(range(256)) * 40  # 10240 bytes
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkedUploadStore(root_dir=str(tmp_path), max_bytes=1024 ** 2, max_chunk_bytes=4096)
+
+def chunks(data, size):
+    return [(offset, data[offset:offset + size]) for offset in range(0, len(data), size)]
+
+def test_ranges_and_content_range_parsing():
+    assert merge_ranges([(4096, 8192), (0, 4096), (10000, 10240)]) == [[0, 8192], [10000, 10240]]
+    assert parse_content_range('bytes 0-4095/10240') == (0, 4096, 10240)
+    assert parse_content_range('bytes 4096-8191/*') == (4096, 8192, None)
+    with pytest.raises(ValueError):
+        parse_content_range('items 0-1/2')
+
+def test_chunks_in_any_order_assemble_the_file(store):
+    upload = store.create('scan.pdf', len(PAYLOAD), hashlib.sha256(PAYLOAD).hexdigest())
+    upload_id = upload['upload_id']
+    assert upload['missing'] == [[0, len(PAYLOAD)]]
+
+    parts = chunks(PAYLOAD, 4096)
+    for offset, data in reversed(parts[1:]):
+        status = store.write_chunk(upload_id, offset, len(data), io.BytesIO(data))
+    assert status['missing'] == [[0, 4096]]
+    assert status['received_bytes'] == len(PAYLOAD) - 4096
+    with pytest.raises(UploadConflictError) as error:
+        store.finalize(upload_id)
+    assert error.value.missing == [[0, 4096]]
+
+    # A resent chunk is harmless
+    for _ in range(2):
+        store.write_chunk(upload_id, 0, 4096, io.BytesIO(parts[0][1]), hashlib.sha256(parts[0][1]).hexdigest())
+    data_path, filename, sha256 = store.finalize(upload_id)
+    assert filename == 'scan.pdf'
+    with open(data_path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    with pytest.raises(UploadConflictError):
+        store.finalize(upload_id)
+    with pytest.raises(UploadConflictError):
+        store.write_chunk(upload_id, 0, 4096, io.BytesIO(parts[0][1]))
+
+    # The job converting it owns the file until it releases it
+    with pytest.raises(UploadConflictError):
+        store.discard(upload_id)
+    store.release(upload_id)
+    with pytest.raises(UploadNotFoundError):
+        store.status(upload_id)
+    # Releasing twice (after a DELETE or a prune) does not fail the job
+    store.release(upload_id)
+
+def test_broken_chunks_are_not_counted(store):
+    upload_id = store.create('scan.pdf', len(PAYLOAD), hashlib.sha256(PAYLOAD).hexdigest())['upload_id']
+    with pytest.raises(ValueError):
+        # Connection dropped halfway through the chunk
+        store.write_chunk(upload_id, 0, 4096, io.BytesIO(PAYLOAD[:1000]))
+    with pytest.raises(ValueError):
+        store.write_chunk(upload_id, 0, 4096, io.BytesIO(PAYLOAD[:4096]), '0' * 64)
+    with pytest.raises(ValueError):
+        store.write_chunk(upload_id, 8192, 4096, io.BytesIO(PAYLOAD[:4096]))
+    assert store.status(upload_id)['received_bytes'] == 0
+
+def test_hash_mismatch_asks_for_everything_again(store):
+    upload_id = store.create('scan.pdf', len(PAYLOAD), hashlib.sha256(PAYLOAD).hexdigest())['upload_id']
+    corrupted = b'\xff' + PAYLOAD[1:]
+    for offset, data in chunks(corrupted, 4096):
+        store.write_chunk(upload_id, offset, len(data), io.BytesIO(data))
+    with pytest.raises(UploadConflictError) as error:
+        store.finalize(upload_id)
+    assert error.value.missing == [[0, len(PAYLOAD)]]
+    status = store.status(upload_id)
+    assert status['received_bytes'] == 0 and status['finalized'] is False
+
+def test_idle_uploads_expire(store):
+    upload_id = store.create('scan.pdf', len(PAYLOAD), hashlib.sha256(PAYLOAD).hexdigest())['upload_id']
+    store.ttl_seconds = 60
+    upload_dir = os.path.join(store.root_dir, upload_id)
+    old = time.time() - 120
+    for name in ('', 'state.json'):
+        os.utime(os.path.join(upload_dir, name), (old, old))
+    store.prune()
+    assert not os.path.exists(upload_dir)
+    with pytest.raises(UploadNotFoundError):
+        store.status('../../etc')
+
+def test_uploads_being_converted_do_not_expire(store):
+    store.ttl_seconds = 60
+    old = time.time() - 120
+    upload_dirs = []
+    for _ in range(2):
+        upload_id = store.create('scan.pdf', len(PAYLOAD), hashlib.sha256(PAYLOAD).hexdigest())['upload_id']
+        store.write_chunk(upload_id, 0, 4096, io.BytesIO(PAYLOAD[:4096]))
+        store.write_chunk(upload_id, 4096, 4096, io.BytesIO(PAYLOAD[4096:8192]))
+        store.write_chunk(upload_id, 8192, 2048, io.BytesIO(PAYLOAD[8192:]))
+        store.finalize(upload_id)
+        upload_dir = os.path.join(store.root_dir, upload_id)
+        for name in ('', 'state.json', 'finalized'):
+            os.utime(os.path.join(upload_dir, name), (old, old))
+        upload_dirs.append(upload_dir)
+    # The second was finalized by a process that has since exited
+    with open(os.path.join(upload_dirs[1], 'finalized'), 'w') as f:
+        f.write(str(2 ** 22 + 1))
+    os.utime(os.path.join(upload_dirs[1], 'finalized'), (old, old))
+
+    store.prune()
+    assert os.path.exists(upload_dirs[0])
+    assert not os.path.exists(upload_dirs[1])
+
+@requires_poppler
+def test_chunked_upload_api_end_to_end():
+    """Create, PUT chunks out of order with Content-Range, resume from status, finalize into a job"""
+    from app import app
+
+    with open(SAMPLE_PDF, 'rb') as f:
+        pdf_bytes = f.read()
+    client = app.test_client()
+    created = client.post('/conversion/uploads', data={
+        'filename': 'guest.pdf', 'size': len(pdf_bytes), 'sha256': hashlib.sha256(pdf_bytes).hexdigest()
+    })
+    assert created.status_code == 201
+    upload_url = created.json['upload_url']
+
+    chunk_size = len(pdf_bytes) // 3 + 1
+    parts = chunks(pdf_bytes, chunk_size)
+    for offset, data in reversed(parts[1:]):
+        response = client.put(upload_url, data=data, headers={
+            'Content-Range': f"bytes {offset}-{offset + len(data) - 1}/{len(pdf_bytes)}"
+        })
+        assert response.status_code == 200
+    assert client.post(created.json['finalize_url']).status_code == 409
+
+    missing = client.get(upload_url).json['missing']
+    assert missing == [[0, chunk_size]]
+    assert client.put(f"{upload_url}?offset=0", data=parts[0][1]).status_code == 200
+
+    finalized = client.post(created.json['finalize_url'], data={'blank_pages': 'exclude'})
+    assert finalized.status_code == 202
+    job_id = finalized.json['job_id']
+    events = client.get(f'/conversion/jobs/{job_id}/events').get_data(as_text=True)
+    assert 'event: completed' in events
+    status = client.get(f'/conversion/jobs/{job_id}').json
+    assert status['status'] == JOB_COMPLETED
+    assert status['result']['pdf_sha256'] == hashlib.sha256(pdf_bytes).hexdigest()
+    assert len(status['result']['accessible_urls']) == 4
+    # The assembled file is removed once the conversion is done with it
+    assert client.get(upload_url).status_code == 404
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
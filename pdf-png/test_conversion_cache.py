@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test the content-addressed conversion cache
+"""
+import os
+import shutil
+import tempfile
+import pytest
+
+from conversion_cache import ConversionCache, make_cache_key
+from conftest import DATA_DIR, poppler_marker
+
+SAMPLE_PDF = os.path.join(DATA_DIR, 'bankers-guarantee-extension.pdf')
+
+requires_poppler = poppler_marker(SAMPLE_PDF)
+
+@pytest.fixture
+def cache_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+def add_entry(cache, key, size):
+    """Render a fake page set of the given size into a claimed entry"""
+    entry_dir = cache.claim(key)
+    with open(os.path.join(entry_dir, 'form_page_1.png'), 'wb') as f:
+        f.write(b'\0' * size)
+    return cache.commit(key, {"files": ['form_page_1.png'], "metadata": {}})
+
+def test_key_depends_on_bytes_and_render_params():
+    """Changing either the document hash or a render parameter changes the address"""
+    key = make_cache_key('a' * 64, {"dpi": 200, "fmt": "png"})
+    assert key == make_cache_key('a' * 64, {"fmt": "png", "dpi": 200})
+    assert key != make_cache_key('b' * 64, {"dpi": 200, "fmt": "png"})
+    assert key != make_cache_key('a' * 64, {"dpi": 150, "fmt": "png"})
+
+def test_hit_after_commit_and_reload(cache_dir):
+    """A committed entry is found again, including by a fresh process scanning the directory"""
+    cache = ConversionCache(cache_dir, max_bytes=10 ** 6)
+    key = make_cache_key('a' * 64, {})
+    assert cache.lookup(key) is None
+    manifest = add_entry(cache, key, 100)
+    assert manifest['size_bytes'] == 100
+    assert cache.lookup(key)['files'] == ['form_page_1.png']
+    assert ConversionCache(cache_dir).lookup(key)['cache_key'] == key
+
+def test_claim_is_exclusive_until_stale(cache_dir):
+    """An in-progress entry cannot be claimed twice unless it has been abandoned for too long"""
+    key = make_cache_key('a' * 64, {})
+    assert ConversionCache(cache_dir).claim(key)
+    assert ConversionCache(cache_dir).claim(key) is None
+    assert ConversionCache(cache_dir, stale_seconds=-1).claim(key)
+
+def test_least_recently_used_entries_are_evicted(cache_dir):
+    """Going over the byte budget removes the least recently used entries first"""
+    cache = ConversionCache(cache_dir, max_bytes=250)
+    first, second, third = (make_cache_key(c * 64, {}) for c in 'abc')
+    add_entry(cache, first, 100)
+    add_entry(cache, second, 100)
+    assert cache.lookup(first)
+    add_entry(cache, third, 100)
+
+    assert cache.lookup(second) is None
+    assert not os.path.exists(cache.entry_dir(second))
+    assert cache.lookup(first) and cache.lookup(third)
+    assert cache.stats()['total_bytes'] == 200
+
+@requires_poppler
+def test_repeat_upload_is_served_from_cache():
+    """Uploading the same PDF twice renders it only once"""
+    from app import app
+
+    client = app.test_client()
+    responses = []
+    for _ in range(2):
+        with open(SAMPLE_PDF, 'rb') as f:
+            responses.append(client.post('/conversion/pdf-to-png-save', data={'pdfFile': (f, 'guarantee.pdf')}).json)
+    assert responses[1]['cache_hit'] is True
+    assert responses[1]['accessible_urls'] == responses[0]['accessible_urls']
+
+@requires_poppler
+def test_precheck_returns_converted_pages_without_an_upload():
+    """A known hash and size with the same options answers with the stored pages; anything else asks for the file"""
+    import hashlib
+    from app import app
+
+    client = app.test_client()
+    with open(SAMPLE_PDF, 'rb') as f:
+        pdf_bytes = f.read()
+    pdf_sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+    with open(SAMPLE_PDF, 'rb') as f:
+        converted = client.post('/conversion/pdf-to-png-save', data={'pdfFile': (f, 'guarantee.pdf'), 'crop': 'true'}).json
+
+    hit = client.post('/conversion/pdf-precheck', data={'sha256': pdf_sha256.upper(), 'size': len(pdf_bytes), 'crop': 'true'})
+    assert hit.status_code == 200
+    assert hit.json['upload_required'] is False
+    assert hit.json['accessible_urls'] == converted['accessible_urls']
+    assert hit.json['metadata'] == converted['metadata']
+
+    for data in (
+        {'sha256': pdf_sha256, 'size': len(pdf_bytes) + 1, 'crop': 'true'},
+        {'sha256': pdf_sha256, 'crop': 'true', 'crop_padding': '1'},
+        {'sha256': '0' * 64}
+    ):
+        miss = client.post('/conversion/pdf-precheck', data=data)
+        assert miss.status_code == 404
+        assert miss.json['upload_required'] is True
+    assert client.post('/conversion/pdf-precheck', data={'sha256': 'abc'}).status_code == 400
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
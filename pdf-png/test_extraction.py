@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Test server-side form extraction against a local fake Ollama server
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+import extraction
+from config import config
+from extraction import (
+    ExtractionError, PageExtractor, extract_page, extraction_prompt, merge_page_results, normalize_forms,
+    parse_model_json
+)
+from conftest import SAMPLE_PDF, requires_poppler
+
+class FakeOllama(ThreadingHTTPServer):
+    """Answers /api/generate with one form per request and records what it was sent"""
+
+    def __init__(self, delay=0.0, failures=0, answer=None):
+        super().__init__(('127.0.0.1', 0), FakeOllamaHandler)
+        self.delay = delay
+        self.failures = failures
+        self.answer = answer
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.requests.append(body)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            fail = server.failures > 0
+            server.failures -= 1
+            number = len(server.requests)
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            self.wfile.write(b'model is loading')
+            return
+        answer = server.answer or json.dumps({"forms": [{"title": "Guest Form", "fields": [
+            {"name": "Form Date", "type": "date", "value": ""},
+            {"name": f"Field {number}", "type": "textbox", "value": ""}
+        ]}]})
+        payload = json.dumps({"model": body["model"], "response": answer, "done": True, "eval_count": 42}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+@pytest.fixture
+def fake_ollama(monkeypatch, request, tmp_path):
+    from page_index import page_index
+    server = FakeOllama(**getattr(request, 'param', {}))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(config, 'OLLAMA_BASE_URL', server.url)
+    monkeypatch.setattr(config, 'EXTRACTION_CONCURRENCY', 2)
+    # A fresh pool so the concurrency setting above applies
+    monkeypatch.setattr(extraction, '_extraction_pool', None)
+    # Nothing answered from earlier runs
+    monkeypatch.setattr(page_index, 'root_dir', str(tmp_path / 'index'))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def page_image(tmp_path):
+    path = tmp_path / 'page.jpg'
+    path.write_bytes(b'\xff\xd8 not really a jpeg')
+    return str(path)
+
+def test_model_json_is_read_with_or_without_a_fence():
+    assert parse_model_json('{"forms": []}') == {"forms": []}
+    assert parse_model_json('Here you go:\n```json\n{"title": "A", "fields": []}\n```') == {"title": "A", "fields": []}
+    assert parse_model_json('The form is {"fields": []} as requested.') == {"fields": []}
+    with pytest.raises(ExtractionError):
+        parse_model_json('no json here')
+
+def test_answer_shapes_are_normalized():
+    fields = [{"name": "Name", "type": "textbox", "value": ""}]
+    assert normalize_forms({"forms": [{"title": "A", "fields": fields}]}) == [{"title": "A", "fields": fields}]
+    assert normalize_forms({"form": {"title": "B", "sections": fields}}) == [{"title": "B", "fields": fields}]
+    assert normalize_forms({"title": "C", "fields": fields + ["stray"]}) == [{"title": "C", "fields": fields}]
+    with pytest.raises(ExtractionError):
+        normalize_forms({"description": "a form"})
+
+def test_pages_merge_into_one_form_with_a_single_form_date():
+    form_date = {"name": "Form Date", "type": "date", "value": ""}
+    merged = merge_page_results([
+        {"page_number": 2, "forms": [{"title": None, "fields": [form_date, {"name": "Signature", "type": "signature", "value": ""}]}]},
+        {"page_number": 3, "error": "timed out"},
+        {"page_number": 1, "forms": [{"title": "Guest Form", "fields": [form_date, {"name": "Name", "type": "textbox", "value": ""}]}]}
+    ])
+    assert merged["title"] == "Guest Form"
+    assert [(field["name"], field["page_number"]) for field in merged["fields"]] == [
+        ("Form Date", 1), ("Name", 1), ("Signature", 2)
+    ]
+
+def test_default_prompt_is_the_shipped_file(monkeypatch, tmp_path):
+    assert extraction_prompt().startswith('Analyze this form image')
+    assert '"Form Date"' in extraction_prompt()
+    custom = tmp_path / 'prompt.txt'
+    custom.write_text('Read the form.\n')
+    monkeypatch.setattr(config, 'EXTRACTION_PROMPT_FILE', str(custom))
+    assert extraction_prompt() == 'Read the form.'
+
+def test_page_is_sent_as_base64_with_the_prompt(fake_ollama, page_image):
+    result = extract_page(1, page_image, "Read the form", "qwen2.5vl:latest")
+    assert "error" not in result
+    assert result["forms"][0]["title"] == "Guest Form"
+    assert result["eval_count"] == 42
+
+    sent = fake_ollama.requests[0]
+    assert sent["prompt"] == "Read the form"
+    assert sent["model"] == "qwen2.5vl:latest"
+    assert sent["stream"] is False
+    assert sent["images"] == ['/9ggbm90IHJlYWxseSBhIGpwZWc=']
+
+@pytest.mark.parametrize('fake_ollama', [{"failures": 1}], indirect=True)
+def test_server_errors_are_retried(fake_ollama, page_image):
+    result = extract_page(1, page_image, "Read the form", "m")
+    assert "error" not in result
+    assert len(fake_ollama.requests) == 2
+
+@pytest.mark.parametrize('fake_ollama', [{"answer": "I cannot read this form."}], indirect=True)
+def test_unreadable_answers_fail_only_their_page(fake_ollama, page_image):
+    result = extract_page(3, page_image, "Read the form", "m")
+    assert result["page_number"] == 3
+    assert "not valid JSON" in result["error"]
+
+def test_unreachable_endpoint_is_reported(monkeypatch, page_image):
+    monkeypatch.setattr(config, 'OLLAMA_BASE_URL', 'http://127.0.0.1:9')
+    monkeypatch.setattr(config, 'EXTRACTION_RETRIES', 0)
+    assert "unreachable" in extract_page(1, page_image, "Read the form", "m")["error"]
+
+@pytest.mark.parametrize('fake_ollama', [{"delay": 0.2}], indirect=True)
+def test_model_calls_are_bounded(fake_ollama, page_image):
+    results = []
+    extractor = PageExtractor("Read the form", "m", on_result=results.append)
+    for page_number in range(1, 7):
+        extractor.submit(page_number, page_image)
+    outcome = extractor.finish()
+
+    assert fake_ollama.max_active == 2
+    assert [page["page_number"] for page in outcome["pages"]] == [1, 2, 3, 4, 5, 6]
+    assert sorted(result["page_number"] for result in results) == [1, 2, 3, 4, 5, 6]
+    assert outcome["failed_pages"] == []
+    assert len(outcome["forms"][0]["fields"]) == 7
+
+@requires_poppler
+def test_extraction_stream_end_to_end(fake_ollama):
+    """Pages stream as they render, each is read by the model, and the result merges them"""
+    from app import app
+
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = app.test_client().post('/conversion/pdf-extract', data={
+            'pdfFile': (f, 'guest.pdf'), 'model': 'test-model'
+        })
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    events = [line['event'] for line in lines]
+    assert events[0] == 'job' and events[-1] == 'completed'
+    assert events.count('page') == 5
+
+    # The blank last page is never sent to the model
+    extracted = sorted(line['page_number'] for line in lines if line['event'] == 'extraction')
+    assert extracted == [1, 2, 3, 4]
+    assert {sent['model'] for sent in fake_ollama.requests} == {'test-model'}
+
+    result = lines[-1]['result']
+    assert result['blank_pages'] == [5]
+    assert result['extraction']['model'] == 'test-model'
+    form = result['extraction']['forms'][0]
+    assert form['title'] == 'Guest Form'
+    assert [field['name'] for field in form['fields']].count('Form Date') == 1
+
+@pytest.mark.parametrize('fake_ollama', [{"delay": 0.05}], indirect=True)
+def test_pages_already_read_are_not_sent_again(fake_ollama, page_image):
+    first = PageExtractor("Read the form", "m")
+    first.submit(1, page_image, 'a' * 64)
+    first.submit(2, page_image, 'b' * 64)
+    first.finish()
+
+    second = PageExtractor("Read the form", "m")
+    second.submit(1, page_image, 'b' * 64)
+    second.submit(2, page_image, 'c' * 64)
+    outcome = second.finish()
+    assert len(fake_ollama.requests) == 3
+    assert outcome["pages"][0]["reused"] is True
+    assert "reused" not in outcome["pages"][1]
+
+    # A different prompt is a different question
+    third = PageExtractor("Read the form again", "m")
+    third.submit(1, page_image, 'a' * 64)
+    third.finish()
+    assert len(fake_ollama.requests) == 4
+
+    # So is the same page rendered differently (another DPI, crop or llm profile)
+    fourth = PageExtractor("Read the form", "m", render_params={"dpi": 100})
+    fourth.submit(1, page_image, 'a' * 64)
+    fourth.finish()
+    assert len(fake_ollama.requests) == 5
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test HTTP caching of generated page images
+"""
+import os
+import shutil
+import uuid
+import pytest
+from PIL import Image
+
+from app import app
+from config import config
+from conversion_cache import write_manifest
+
+@pytest.fixture
+def generated_page():
+    """A conversion directory holding one page and its manifest"""
+    entry_name = str(uuid.uuid4())
+    entry_dir = os.path.join(config.GENERATED_IMAGES_DIR, entry_name)
+    os.makedirs(entry_dir)
+    Image.new('RGB', (200, 300), 'white').save(os.path.join(entry_dir, 'form_page_1.png'))
+    manifest = write_manifest(entry_dir, {"files": ['form_page_1.png']})
+    yield f'/conversion/generated_images/{entry_name}/form_page_1.png', manifest['file_hashes']['form_page_1.png']
+    shutil.rmtree(entry_dir)
+
+def test_strong_etag_and_immutable_cache_control(generated_page):
+    url, content_hash = generated_page
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{content_hash}"'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+
+def test_conditional_get_returns_not_modified(generated_page):
+    url, content_hash = generated_page
+    response = app.test_client().get(url, headers={'If-None-Match': f'"{content_hash}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_byte_ranges_are_supported(generated_page):
+    url, _ = generated_page
+    response = app.test_client().get(url, headers={'Range': 'bytes=0-7'})
+    assert response.status_code == 206
+    assert response.data == b'\x89PNG\r\n\x1a\n'
+
+def test_only_images_are_served(generated_page):
+    url, _ = generated_page
+    client = app.test_client()
+    assert client.get(url.replace('form_page_1.png', 'manifest.json')).status_code == 404
+    assert client.get(url.replace('form_page_1.png', 'manifest.json.tmp')).status_code == 404
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Test the background conversion job manager and its HTTP API
+"""
+import hashlib
+import os
+import shutil
+import threading
+import pytest
+
+import tempfile
+
+from jobs import JobManager, QueueFullError, ShuttingDownError, JOB_COMPLETED, JOB_FAILED
+from conftest import SAMPLE_PDF, requires_poppler
+
+def test_job_reports_progress_and_result():
+    """A job should move through per-page progress to a completed result"""
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+
+    def work(job):
+        job.start(page_count=2)
+        job.page_completed(1, 'http://host/page_1.png')
+        release.wait(5)
+        job.page_completed(2, 'http://host/page_2.png')
+        return {"saved_files_count": 2}
+
+    job = manager.submit('form.pdf', work)
+    assert manager.get(job.job_id) is job
+    version = job.wait_for_update(-1, timeout=5)
+    assert job.wait(timeout=0.05) is False
+
+    release.set()
+    assert job.wait(timeout=5)
+    assert job.version > version
+    state = job.to_dict()
+    assert state['status'] == JOB_COMPLETED
+    assert state['pages_completed'] == 2
+    assert state['accessible_urls'] == ['http://host/page_1.png', 'http://host/page_2.png']
+    assert state['result'] == {"saved_files_count": 2}
+
+def test_job_failure_is_recorded():
+    """Exceptions raised by the work function should fail the job, not the worker"""
+    manager = JobManager(max_workers=1)
+
+    def work(job):
+        raise ValueError("broken PDF")
+
+    job = manager.submit('broken.pdf', work)
+    assert job.wait(timeout=5)
+    assert job.status == JOB_FAILED
+    assert job.error == "broken PDF"
+
+def test_finished_jobs_expire_after_retention():
+    """Finished jobs are forgotten once the retention window has passed"""
+    manager = JobManager(max_workers=1, retention_seconds=0)
+    job = manager.submit('form.pdf', lambda job: {})
+    job.wait(timeout=5)
+    manager.submit('other.pdf', lambda job: {}).wait(timeout=5)
+    assert manager.get(job.job_id) is None
+
+def test_submissions_beyond_the_queue_are_refused():
+    """With every slot and queue position taken, submit fails fast with a retry hint"""
+    manager = JobManager(max_workers=1, queue_size=1)
+    release = threading.Event()
+    first = manager.submit('a.pdf', lambda job: release.wait(5) and {})
+    second = manager.submit('b.pdf', lambda job: {})
+    with pytest.raises(QueueFullError) as excinfo:
+        manager.submit('c.pdf', lambda job: {})
+    assert 1 <= excinfo.value.retry_after <= 60
+    release.set()
+    assert first.wait(timeout=5) and second.wait(timeout=5)
+    assert manager.submit('c.pdf', lambda job: {}).wait(timeout=5)
+
+def test_shutdown_drains_running_jobs_and_refuses_new_ones():
+    manager = JobManager(max_workers=1)
+    job = manager.submit('a.pdf', lambda job: {})
+    manager.shutdown(wait=True)
+    assert job.status == JOB_COMPLETED
+    with pytest.raises(ShuttingDownError):
+        manager.submit('b.pdf', lambda job: {})
+
+def test_other_processes_can_follow_a_job_through_its_state_file():
+    """A manager that did not run the job reads its state from the shared directory"""
+    state_dir = tempfile.mkdtemp()
+    try:
+        owner = JobManager(max_workers=1, state_dir=state_dir)
+        job = owner.submit('a.pdf', lambda job: {"saved_files_count": 1})
+        assert job.wait(timeout=5)
+
+        stored = JobManager(max_workers=1, state_dir=state_dir).get(job.job_id)
+        assert stored is not job
+        assert stored.wait(timeout=1)
+        assert stored.to_dict()['result'] == {"saved_files_count": 1}
+        assert JobManager(max_workers=1, state_dir=state_dir).get('../etc/passwd') is None
+    finally:
+        shutil.rmtree(state_dir)
+
+def test_pages_are_appended_to_the_state_once(tmp_path):
+    """The polled snapshot stays the same size as pages arrive; other processes still see every page"""
+    state_dir = str(tmp_path / 'jobs')
+    manager = JobManager(max_workers=1, state_dir=state_dir)
+    extracted, release = threading.Event(), threading.Event()
+    sizes = []
+
+    def work(job):
+        job.start(page_count=3)
+        for page_number in (1, 2, 3):
+            job.page_completed(page_number, f'http://host/page_{page_number}.png', {"page_number": page_number})
+            sizes.append(os.path.getsize(job.state_path))
+        job.page_extracted({"page_number": 1, "forms": []})
+        extracted.set()
+        release.wait(5)
+        return {"saved_files_count": 3}
+
+    job = manager.submit('a.pdf', work)
+    assert extracted.wait(timeout=5)
+    stored = JobManager(max_workers=1, state_dir=state_dir).get(job.job_id)
+    assert stored.to_dict() == job.to_dict()
+    assert stored.to_dict()['accessible_urls'][-1] == 'http://host/page_3.png'
+    assert max(sizes) - min(sizes) <= 2
+    release.set()
+    assert job.wait(timeout=5)
+
+def test_jobs_of_exited_owners_fail_and_their_state_files_expire(tmp_path):
+    """A running job whose owner died reads as failed; the sweep removes only idle files nobody will finish"""
+    import json
+    import time
+    import uuid
+
+    state_dir = str(tmp_path / 'jobs')
+    os.makedirs(state_dir)
+    def state_file(status, owner_pid, age):
+        job_id = str(uuid.uuid4())
+        path = os.path.join(state_dir, f"{job_id}.json")
+        with open(path, 'w') as f:
+            json.dump({"job_id": job_id, "status": status, "owner_pid": owner_pid}, f)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return job_id
+
+    orphaned = state_file('running', 2 ** 22 + 1, age=7200)
+    finished = state_file(JOB_COMPLETED, os.getpid(), age=7200)
+    alive = state_file('running', os.getpid(), age=7200)
+    recent = state_file('running', 2 ** 22 + 1, age=0)
+
+    manager = JobManager(max_workers=1, retention_seconds=3600, state_dir=state_dir)
+    stored = manager.get(orphaned)
+    assert stored.finished and stored.to_dict()['status'] == JOB_FAILED
+    assert 'owner_pid' not in stored.to_dict()
+    assert manager.get(alive).status == 'running'
+
+    assert sorted(manager.prune_state_files()) == sorted([orphaned, finished])
+    assert sorted(os.listdir(state_dir)) == sorted(f"{job_id}.json" for job_id in (alive, recent))
+
+def test_saturated_server_answers_429(monkeypatch):
+    from app import app, job_manager
+
+    def queue_full():
+        raise QueueFullError(7)
+
+    monkeypatch.setattr(job_manager, 'check_capacity', queue_full)
+    response = app.test_client().post('/conversion/jobs')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+
+@requires_poppler
+def test_job_api_end_to_end():
+    """Submitting returns 202 immediately and the events stream ends with the result"""
+    from app import app
+
+    client = app.test_client()
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = client.post('/conversion/jobs', data={'pdfFile': (f, 'guest.pdf')})
+    assert response.status_code == 202
+    job_id = response.json['job_id']
+
+    events = client.get(f'/conversion/jobs/{job_id}/events').get_data(as_text=True)
+    assert 'event: completed' in events
+
+    status = client.get(f'/conversion/jobs/{job_id}').json
+    assert status['status'] == JOB_COMPLETED
+    assert len(status['result']['accessible_urls']) == 5
+    assert client.get('/conversion/jobs/unknown').status_code == 404
+
+@requires_poppler
+def test_streaming_conversion_emits_each_page_before_the_result():
+    """The NDJSON stream announces the job, then every page with its hash, then the full result"""
+    import json
+    from app import app
+
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = app.test_client().post('/conversion/pdf-to-png-stream', data={'pdfFile': (f, 'guest.pdf')})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    events = [line['event'] for line in lines if line['event'] != 'keep-alive']
+    assert events == ['job'] + ['page'] * 5 + ['completed']
+
+    pages = [line for line in lines if line['event'] == 'page']
+    assert [page['page_number'] for page in pages] == [1, 2, 3, 4, 5]
+    result = lines[-1]['result']
+    for page, saved_path in zip(pages, result['saved_file_paths_on_server']):
+        assert page['width'] > 0 and page['height'] > 0
+        with open(saved_path, 'rb') as f:
+            assert page['sha256'] == hashlib.sha256(f.read()).hexdigest()
+
+if __name__ == "__main__":
+    test_job_reports_progress_and_result()
+    test_job_failure_is_recorded()
+    test_finished_jobs_expire_after_retention()
+    test_submissions_beyond_the_queue_are_refused()
+    test_shutdown_drains_running_jobs_and_refuses_new_ones()
+    test_other_processes_can_follow_a_job_through_its_state_file()
+    test_job_api_end_to_end()
+    test_streaming_conversion_emits_each_page_before_the_result()
+    print("Job tests passed")
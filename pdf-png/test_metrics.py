@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test the Prometheus metrics registry and endpoint
+"""
+import json
+import os
+import pytest
+
+from metrics import Registry
+
+@pytest.fixture
+def registry(tmp_path):
+    return Registry(str(tmp_path / 'metrics'), flush_seconds=3600)
+
+def test_render_uses_the_text_exposition_format(registry):
+    requests = registry.counter('test_requests_total', "Requests", labels=('result',))
+    latency = registry.histogram('test_latency_seconds', "Latency", buckets=(0.1, 1))
+    requests.inc(result='hit')
+    requests.inc(2, result='miss')
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert '# TYPE test_requests_total counter' in lines
+    assert 'test_requests_total{result="hit"} 1' in lines
+    assert 'test_requests_total{result="miss"} 2' in lines
+    assert '# TYPE test_latency_seconds histogram' in lines
+    # Buckets are cumulative and end with +Inf, which equals the count
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_sum 5.55' in lines
+    assert 'test_latency_seconds_count 3' in lines
+
+def test_values_are_summed_across_processes(registry):
+    requests = registry.counter('test_requests_total', "Requests")
+    queued = registry.gauge('test_queued', "Queued")
+    latency = registry.histogram('test_latency_seconds', "Latency", buckets=(1,))
+    requests.inc()
+    queued.set(2)
+    latency.observe(0.5)
+
+    # Files as written by two other workers: one still running (this test's parent), one gone
+    os.makedirs(registry.directory, exist_ok=True)
+    for pid in (os.getppid(), 2 ** 22 + 1):
+        with open(os.path.join(registry.directory, f"{pid}.json"), 'w') as f:
+            json.dump({
+                'test_requests_total': [[[], 3]],
+                'test_queued': [[[], 5]],
+                'test_latency_seconds': [[[], [0, 2.0, 1]]]
+            }, f)
+
+    merged = registry.collect()
+    assert merged['test_requests_total'][()] == 7
+    # Gauges of exited processes are dropped; counters and histograms keep counting
+    assert merged['test_queued'][()] == 7
+    assert merged['test_latency_seconds'][()] == [1, 4.5, 3]
+    assert os.path.exists(os.path.join(registry.directory, f"{os.getpid()}.json"))
+
+def test_timer_observes_its_block(registry):
+    latency = registry.histogram('test_latency_seconds', "Latency", labels=('kind',))
+    with latency.time(kind='form'):
+        pass
+    assert latency.values[('form',)][-1] == 1
+
+def test_endpoint_reports_conversion_internals():
+    from app import app
+
+    client = app.test_client()
+    client.get('/conversion/does-not-exist')
+    response = client.get('/conversion/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    for name in ('pdfpng_page_render_seconds', 'pdfpng_conversion_queue_depth', 'pdfpng_cache_requests_total',
+                 'pdfpng_upload_receive_seconds', 'pdfpng_conversion_errors_total'):
+        assert f"# TYPE {name} " in body
+    assert 'pdfpng_http_errors_total{endpoint="unmatched",status="404"}' in body
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
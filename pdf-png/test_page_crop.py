@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test cropping rendered pages to their content
+"""
+import os
+import pytest
+from PIL import Image, ImageDraw
+
+from page_crop import crop_box, crop_details, ink_bounding_box
+from conftest import DATA_DIR, poppler_marker
+
+SAMPLE_PDF = os.path.join(DATA_DIR, 'Sample-Fillable-PDF.pdf')
+
+requires_poppler = poppler_marker(SAMPLE_PDF)
+
+def page_with_content():
+    """A 200 dpi letter page with a filled block from (300, 400) to (1200, 900) and one stray speck"""
+    page = Image.new('RGB', (1700, 2200), 'white')
+    draw = ImageDraw.Draw(page)
+    draw.rectangle((300, 400, 1199, 899), fill='black')
+    draw.point((1500, 2000), fill='black')
+    return page
+
+def test_ink_bounding_box_ignores_specks():
+    assert ink_bounding_box(page_with_content()) == (300, 400, 1200, 900)
+
+def test_crop_box_is_padded_and_clamped():
+    # 18 pt at 200 dpi is 50 px
+    assert crop_box(page_with_content(), 18, 200) == (250, 350, 1250, 950)
+    assert crop_box(page_with_content(), 1000, 200) is None
+    assert crop_box(Image.new('L', (850, 1100), 255), 18, 200) is None
+
+def test_crop_details_map_back_to_points():
+    details = crop_details((250, 350, 1250, 950), (1700, 2200), 200)
+    assert details["box_points"] == [90.0, 126.0, 450.0, 342.0]
+    assert details["original_width"] == 1700
+
+@requires_poppler
+def test_conversion_crops_archive_and_renditions():
+    from app import app
+
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = app.test_client().post('/conversion/pdf-to-png-save',
+                                          data={'pdfFile': (f, 'fillable.pdf'), 'crop': 'true'})
+    assert response.status_code == 200
+    page = response.json['pages'][0]
+    left, top, right, bottom = page['crop']['box']
+    assert (page['width'], page['height']) == (right - left, bottom - top)
+    assert page['width'] < page['crop']['original_width']
+
+    saved_path = response.json['saved_file_paths_on_server'][0]
+    with Image.open(saved_path) as saved:
+        assert saved.size == (page['width'], page['height'])
+
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = app.test_client().post('/conversion/pdf-to-png-save',
+                                          data={'pdfFile': (f, 'fillable.pdf'), 'crop': 'maybe'})
+    assert response.status_code == 400
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test per-page content fingerprints, perceptual hashes and page reuse
+"""
+import hashlib
+import os
+import uuid
+import PyPDF2
+import pytest
+from PIL import Image, ImageDraw
+
+from page_fingerprints import page_content_fingerprints, perceptual_hash
+from page_index import page_index
+from conftest import DATA_DIR, SAMPLE_PDF, hamming_distance, requires_poppler
+
+OTHER_PDF = os.path.join(DATA_DIR, 'StudentForm.pdf')
+
+requires_samples = pytest.mark.skipif(
+    not os.path.exists(SAMPLE_PDF) or not os.path.exists(OTHER_PDF),
+    reason="sample PDFs not available"
+)
+
+def write_revision(path, replace_page=None, compress=False):
+    """Re-save the sample with new metadata, optionally swapping one page for another form's"""
+    reader = PyPDF2.PdfReader(SAMPLE_PDF)
+    writer = PyPDF2.PdfWriter()
+    for page_number, page in enumerate(reader.pages, start=1):
+        if page_number == replace_page:
+            page = PyPDF2.PdfReader(OTHER_PDF).pages[0]
+        elif compress:
+            # Re-serializes the content stream: same drawing, different bytes
+            page.compress_content_streams()
+        writer.add_page(page)
+    # A fresh title each time, so the file never matches an earlier conversion byte for byte
+    writer.add_metadata({'/Title': f"Revised {uuid.uuid4()}", '/ModDate': "D:20260101000000Z"})
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return str(path)
+
+@requires_samples
+def test_resaved_document_keeps_its_page_fingerprints(tmp_path):
+    original = page_content_fingerprints(SAMPLE_PDF)
+    assert len(original) == 5 and len(set(original.values())) == 5
+    assert page_content_fingerprints(write_revision(tmp_path / 'resaved.pdf', compress=True)) == original
+
+@requires_samples
+def test_revision_changes_only_the_edited_page(tmp_path):
+    original = page_content_fingerprints(SAMPLE_PDF)
+    revised = page_content_fingerprints(write_revision(tmp_path / 'revised.pdf', replace_page=2))
+    assert [original[n] == revised[n] for n in original] == [True, False, True, True, True]
+
+def write_filled_form(path, value, need_appearances=True):
+    """One page with a text widget whose value is kept on its parent field, as many form tools do"""
+    from PyPDF2.generic import (
+        ArrayObject, BooleanObject, DictionaryObject, NameObject, NumberObject, TextStringObject
+    )
+
+    writer = PyPDF2.PdfWriter()
+    writer.add_blank_page(612, 792)
+    field = writer._add_object(DictionaryObject({
+        NameObject('/FT'): NameObject('/Tx'),
+        NameObject('/T'): TextStringObject('applicant'),
+        NameObject('/V'): TextStringObject(value),
+        NameObject('/Kids'): ArrayObject(),
+    }))
+    widget = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Annot'),
+        NameObject('/Subtype'): NameObject('/Widget'),
+        NameObject('/Rect'): ArrayObject([NumberObject(72), NumberObject(700), NumberObject(300), NumberObject(720)]),
+        NameObject('/Parent'): field,
+    }))
+    field.get_object()[NameObject('/Kids')].append(widget)
+    writer.pages[0][NameObject('/Annots')] = ArrayObject([widget])
+    writer._root_object[NameObject('/AcroForm')] = DictionaryObject({
+        NameObject('/Fields'): ArrayObject([field]),
+        NameObject('/NeedAppearances'): BooleanObject(need_appearances),
+    })
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return str(path)
+
+def test_inherited_field_values_and_form_settings_are_fingerprinted(tmp_path):
+    first = page_content_fingerprints(write_filled_form(tmp_path / 'first.pdf', 'Jane Doe'))
+    assert page_content_fingerprints(write_filled_form(tmp_path / 'again.pdf', 'Jane Doe')) == first
+    # The widget itself is identical; only its parent field's value differs
+    assert page_content_fingerprints(write_filled_form(tmp_path / 'second.pdf', 'John Roe')) != first
+    assert page_content_fingerprints(write_filled_form(tmp_path / 'drawn.pdf', 'Jane Doe', False)) != first
+
+def test_perceptual_hash_tolerates_resampling_but_not_other_content():
+    page = Image.new('RGB', (850, 1100), 'white')
+    draw = ImageDraw.Draw(page)
+    for top in range(100, 1000, 120):
+        draw.rectangle((80, top, 770, top + 40), outline='black', width=3)
+    other = Image.new('RGB', (850, 1100), 'white')
+    ImageDraw.Draw(other).ellipse((100, 100, 750, 700), fill='black')
+
+    reference = perceptual_hash(page)
+    assert len(reference) == 16
+    assert perceptual_hash(page.copy()) == reference
+    assert hamming_distance(perceptual_hash(page.resize((425, 550)).convert('L')), reference) <= 4
+    assert hamming_distance(perceptual_hash(other), reference) > 8
+
+@requires_poppler
+def test_revised_upload_renders_only_the_changed_page(tmp_path, monkeypatch):
+    from app import app
+
+    monkeypatch.setattr(page_index, 'root_dir', str(tmp_path / 'index'))
+    client = app.test_client()
+
+    def convert(path):
+        with open(path, 'rb') as f:
+            return client.post('/conversion/pdf-to-png-save', data={'pdfFile': (f, 'guest.pdf'), 'crop': 'true'}).json
+
+    first = convert(SAMPLE_PDF)
+    revised = convert(write_revision(tmp_path / 'revised.pdf', replace_page=2))
+
+    assert revised['cache_hit'] is False
+    assert revised['reused_pages'] == [1, 3, 4, 5]
+    assert len(revised['content_fingerprint']) == 64
+    for before, after in zip(first['pages'], revised['pages']):
+        assert after['content_fingerprint']
+        assert len(after['phash']) == 16
+        if after['page_number'] == 2:
+            assert 'reused' not in after
+            assert after['content_fingerprint'] != before['content_fingerprint']
+            continue
+        assert after['reused'] is True
+        assert after['sha256'] == before['sha256']
+    for saved_path, page in zip(revised['saved_file_paths_on_server'], revised['pages']):
+        with open(saved_path, 'rb') as f:
+            assert hashlib.sha256(f.read()).hexdigest() == page['sha256']
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
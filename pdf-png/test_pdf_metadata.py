@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test PDF metadata extraction: the trailer-only fast path and the batch endpoint
+"""
+import glob
+import hashlib
+import io
+import json
+import os
+import zipfile
+import pytest
+import PyPDF2
+
+from pdf_metadata import FastPathUnavailable, read_info_and_page_count
+from conftest import DATA_DIR
+
+SAMPLE_PDFS = sorted(glob.glob(os.path.join(DATA_DIR, '*.pdf')))
+
+requires_samples = pytest.mark.skipif(not SAMPLE_PDFS, reason="sample PDFs not available")
+
+@requires_samples
+@pytest.mark.parametrize('pdf_path', SAMPLE_PDFS, ids=os.path.basename)
+def test_fast_path_matches_full_parser(pdf_path):
+    with open(pdf_path, 'rb') as f:
+        pdf_bytes = f.read()
+    try:
+        info, page_count = read_info_and_page_count(pdf_bytes)
+    except FastPathUnavailable:
+        pytest.skip("file needs the full parser")
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    assert page_count == len(reader.pages)
+    expected = reader.metadata
+    assert info == (dict(expected) if expected is not None else None)
+
+def test_damaged_file_is_left_to_full_parser():
+    with pytest.raises(FastPathUnavailable):
+        read_info_and_page_count(b'%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\nstartxref\n999999\n%%EOF')
+
+def hybrid_pdf():
+    """A hybrid-reference file: /Info lives in an object stream the classic table marks free"""
+    out = io.BytesIO()
+    out.write(b'%PDF-1.5\n')
+    offsets = {}
+
+    def add(num, body):
+        offsets[num] = out.tell()
+        out.write(b'%d 0 obj\n' % num + body + b'\nendobj\n')
+
+    add(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    add(2, b'<< /Type /Pages /Kids [] /Count 0 >>')
+    header, info = b'3 0 ', b'<< /Title (Hybrid) /Author (Writer) >>'
+    add(4, b'<< /Type /ObjStm /N 1 /First %d /Length %d >>\nstream\n' % (len(header), len(header + info))
+        + header + info + b'\nendstream')
+    entry = bytes([2, 0, 4, 0])  # object 3 is the first in object stream 4
+    add(5, b'<< /Type /XRef /Size 6 /W [1 2 1] /Index [3 1] /Length 4 >>\nstream\n' + entry + b'\nendstream')
+
+    xref_offset = out.tell()
+    out.write(b'xref\n0 6\n0000000000 65535 f \n')
+    for num in range(1, 6):
+        out.write(b'%010d 00000 n \n' % offsets[num] if num != 3 else b'0000000000 00000 f \n')
+    out.write(b'trailer\n<< /Size 6 /Root 1 0 R /Info 3 0 R /XRefStm %d >>\n' % offsets[5])
+    out.write(b'startxref\n%d\n%%%%EOF\n' % xref_offset)
+    return out.getvalue()
+
+def test_hybrid_reference_files_find_compressed_objects():
+    info, page_count = read_info_and_page_count(hybrid_pdf())
+    assert page_count == 0
+    assert info == {'/Title': 'Hybrid', '/Author': 'Writer'}
+
+@requires_samples
+def test_metadata_endpoint_uses_same_result():
+    from app import app
+
+    pdf_path = SAMPLE_PDFS[0]
+    with open(pdf_path, 'rb') as f:
+        response = app.test_client().post('/conversion/pdf-metadata', data={'pdfFile': (f, 'sample.pdf')})
+    assert response.status_code == 200
+    with open(pdf_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        assert response.json['metadata']['page_count'] == len(reader.pages)
+
+@requires_samples
+def test_batch_endpoint_streams_one_line_per_pdf():
+    from app import app
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for pdf_path in SAMPLE_PDFS[:2]:
+            zf.write(pdf_path, os.path.join('forms', os.path.basename(pdf_path)))
+        zf.writestr('readme.txt', 'not a pdf')
+    archive.seek(0)
+
+    data = {
+        'pdfFile': [(open(SAMPLE_PDFS[2], 'rb'), 'third.pdf'), (io.BytesIO(b'text'), 'notes.txt')],
+        'archive': (archive, 'forms.zip')
+    }
+    response = app.test_client().post('/conversion/pdf-metadata/batch', data=data)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert sorted(line['index'] for line in lines) == [0, 1, 2, 3]
+
+    by_name = {line['filename']: line for line in lines}
+    assert 'error' in by_name['notes.txt']
+    with open(SAMPLE_PDFS[2], 'rb') as f:
+        assert by_name['third.pdf']['pdf_sha256'] == hashlib.sha256(f.read()).hexdigest()
+    archived = [line for line in lines if line['filename'].startswith('forms/')]
+    assert len(archived) == 2
+    assert all('sha256' in line['metadata'].get('hashes', {}) or 'message' in line['metadata'] for line in archived)
+
+def test_batch_endpoint_requires_files():
+    from app import app
+
+    assert app.test_client().post('/conversion/pdf-metadata/batch', data={}).status_code == 400
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
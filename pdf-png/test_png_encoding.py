@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test adaptive colour-depth encoding of archive PNGs
+"""
+import os
+import shutil
+import tempfile
+import pytest
+from PIL import Image, ImageDraw
+
+from config import config
+from png_encoding import color_class, save_page_png
+from conftest import DATA_DIR, poppler_marker
+
+SAMPLE_PDF = os.path.join(DATA_DIR, 'bankers-guarantee-extension.pdf')
+
+requires_poppler = poppler_marker(SAMPLE_PDF)
+
+def form_page(fill='black', line='black', background='white'):
+    page = Image.new('RGB', (850, 1100), background)
+    draw = ImageDraw.Draw(page)
+    for row in range(20):
+        draw.rectangle((100, 100 + row * 45, 700, 130 + row * 45), outline=line)
+        draw.rectangle((110, 110 + row * 45, 200, 120 + row * 45), fill=fill)
+    return page
+
+@pytest.fixture
+def output_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+@pytest.mark.parametrize('page, expected_class, expected_mode', [
+    (form_page(), 'bilevel', '1'),
+    (form_page(fill=(128, 128, 128), background=(240, 240, 240)), 'grayscale', 'L'),
+    (form_page(fill=(200, 30, 30), line=(20, 40, 200)), 'color', 'P'),
+], ids=['bilevel', 'grayscale', 'color'])
+def test_pages_are_written_at_the_depth_they_need(output_dir, page, expected_class, expected_mode):
+    assert color_class(page) == expected_class
+    path = os.path.join(output_dir, 'page.png')
+    assert save_page_png(page, path) == expected_class
+    with Image.open(path) as saved:
+        assert saved.mode == expected_mode
+        if expected_class == 'color':
+            # Palette reduction of a page with few colours is exact
+            assert list(saved.convert('RGB').getdata()) == list(page.getdata())
+
+def test_adaptive_encoding_can_be_disabled(output_dir, monkeypatch):
+    monkeypatch.setattr(config, 'PNG_ADAPTIVE_COLOR', False)
+    path = os.path.join(output_dir, 'page.png')
+    assert save_page_png(form_page(), path) is None
+    with Image.open(path) as saved:
+        assert saved.mode == 'RGB'
+
+@requires_poppler
+def test_converted_pages_are_not_stored_as_rgb():
+    from app import app
+
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = app.test_client().post('/conversion/pdf-to-png-save', data={'pdfFile': (f, 'guarantee.pdf')})
+    assert response.status_code == 200
+    for page, path in zip(response.json['pages'], response.json['saved_file_paths_on_server']):
+        with Image.open(path) as saved:
+            assert saved.mode in ('1', 'L', 'P')
+            assert page['color_class'] in ('bilevel', 'grayscale', 'color')
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
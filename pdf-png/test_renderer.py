@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Test the page-at-a-time rendering pipeline
+"""
+import importlib.util
+import os
+import shutil
+import tempfile
+import PyPDF2
+import pytest
+from PIL import Image
+
+from renderer import (
+    iter_page_windows, iter_render_windows, page_dpi, render_pages, save_pages, render_and_save, resolve_process_count
+)
+from render_backends import get_backend
+from conftest import SAMPLE_PDF, hamming_distance, requires_poppler
+
+requires_pdfium = pytest.mark.skipif(
+    importlib.util.find_spec('pypdfium2') is None or not os.path.exists(SAMPLE_PDF),
+    reason="pypdfium2 or sample PDFs not available"
+)
+
+def test_page_windows_cover_every_page_once():
+    """Windows should be contiguous, ordered and bounded by the window size"""
+    assert list(iter_page_windows(5, 2)) == [(1, 2), (3, 4), (5, 5)]
+    assert list(iter_page_windows(3, 10)) == [(1, 3)]
+    assert list(iter_page_windows(2, 0)) == [(1, 1), (2, 2)]
+    assert list(iter_page_windows(0, 2)) == []
+    assert list(iter_page_windows(7, 2, skip_pages={3, 4})) == [(1, 2), (5, 6), (7, 7)]
+    assert list(iter_page_windows(3, 2, skip_pages={1, 2, 3})) == []
+
+@requires_poppler
+def test_pages_are_written_in_order():
+    """Every page should be saved with the <name>_page_<n>.png convention"""
+    output_dir = tempfile.mkdtemp()
+    try:
+        saved = list(save_pages(render_pages(SAMPLE_PDF, dpi=30, window_size=2), output_dir, 'guest'))
+        assert len(saved) == 5
+        assert [page['page_number'] for page in saved] == list(range(1, len(saved) + 1))
+        for page in saved:
+            assert page['filename'] == f"guest_page_{page['page_number']}.png"
+            assert os.path.getsize(page['filepath']) > 0
+    finally:
+        shutil.rmtree(output_dir)
+
+@requires_poppler
+def test_direct_to_disk_matches_pil_path():
+    """poppler writing the files itself should produce the same pages as decoding and re-encoding"""
+    direct_dir, pil_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        direct = list(render_and_save(SAMPLE_PDF, direct_dir, 'guest', dpi=30, processes=1, direct=True,
+                                      renditions=('preview',)))
+        decoded = list(render_and_save(SAMPLE_PDF, pil_dir, 'guest', dpi=30, processes=1, direct=False,
+                                       renditions=('preview',)))
+        strip = lambda pages: [{k: v for k, v in page.items() if k not in ('filepath', 'render_seconds', 'encode_seconds')}
+                               for page in pages]
+        assert strip(direct) == strip(decoded)
+        assert sorted(os.listdir(direct_dir)) == sorted(os.listdir(pil_dir))
+    finally:
+        shutil.rmtree(direct_dir)
+        shutil.rmtree(pil_dir)
+
+class FileWritingBackend:
+    """Stands in for poppler: writes the given RGB rasters as PNG files and counts its calls"""
+    name = 'poppler'
+    writes_files = True
+
+    def __init__(self, images):
+        self.images = images
+        self.calls = []
+
+    def page_count(self, pdf_path):
+        return len(self.images)
+
+    def render(self, *args, **kwargs):
+        raise AssertionError("the direct path must not render pages into memory")
+
+    def render_to_files(self, pdf_path, first_page, last_page, dpi, output_dir, prefix):
+        self.calls.append((first_page, last_page))
+        numbered = []
+        for page_number in range(first_page, last_page + 1):
+            path = os.path.join(output_dir, f"{prefix}-{page_number:02d}.png")
+            self.images[page_number - 1].save(path)
+            numbered.append((page_number, path))
+        return numbered
+
+def test_direct_to_disk_renders_each_window_once(monkeypatch, tmp_path):
+    """One poppler call per window; only pages stored at another depth than poppler's RGB are encoded again"""
+    import renderer
+    from config import config
+
+    color = Image.new('RGB', (80, 100), 'white')
+    color.paste((200, 30, 30), (10, 10, 70, 50))
+    gray = Image.new('RGB', (80, 100), (150, 150, 150))
+    bilevel = Image.new('RGB', (80, 100), 'white')
+    bilevel.paste((0, 0, 0), (10, 10, 70, 20))
+    backend = FileWritingBackend([color, gray, bilevel])
+    monkeypatch.setattr(renderer, 'get_backend', lambda name=None: backend)
+    monkeypatch.setattr(config, 'PNG_COLOR_PALETTE', False)
+    encoded = []
+    write_page_png = renderer.write_page_png
+    def recording_write(page, *args):
+        encoded.append(page['page_number'])
+        write_page_png(page, *args)
+    monkeypatch.setattr(renderer, 'write_page_png', recording_write)
+
+    pages = list(render_and_save(str(tmp_path / 'missing.pdf'), str(tmp_path), 'form', dpi=30, window_size=2,
+                                 processes=1, direct=True))
+    assert backend.calls == [(1, 2), (3, 3)]
+    assert [page['color_class'] for page in pages] == ['color', 'grayscale', 'bilevel']
+    assert encoded == [2, 3]
+    for page, mode in zip(pages, ('RGB', 'L', '1')):
+        assert len(page['phash']) == 16
+        with Image.open(page['filepath']) as saved:
+            assert saved.mode == mode
+
+def test_direct_to_disk_leaves_pages_undecoded_when_nothing_reads_them(monkeypatch, tmp_path):
+    """Without blank detection, cropping, renditions or adaptive colour there is no decode and no phash"""
+    import renderer
+    from config import config
+
+    backend = FileWritingBackend([Image.new('RGB', (80, 100), 'white')])
+    monkeypatch.setattr(renderer, 'get_backend', lambda name=None: backend)
+    monkeypatch.setattr(config, 'PNG_ADAPTIVE_COLOR', False)
+    monkeypatch.setattr(renderer, 'perceptual_hash', lambda image: pytest.fail("page was decoded"))
+
+    page, = render_and_save(str(tmp_path / 'missing.pdf'), str(tmp_path), 'form', dpi=30, processes=1, direct=True)
+    assert 'phash' not in page and 'color_class' not in page
+
+def test_process_count_defaults_to_available_cores():
+    """Zero means size the pool to the host"""
+    assert resolve_process_count(3) == 3
+    assert resolve_process_count(0) >= 1
+
+@requires_poppler
+def test_parallel_rendering_matches_serial_page_order():
+    """The process pool should produce the same files, yielded in page order"""
+    serial_dir, parallel_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        serial = list(render_and_save(SAMPLE_PDF, serial_dir, 'guest', dpi=30, processes=1))
+        parallel = list(render_and_save(SAMPLE_PDF, parallel_dir, 'guest', dpi=30, window_size=1, processes=3))
+        assert [page['filename'] for page in parallel] == [page['filename'] for page in serial]
+        assert sorted(os.listdir(parallel_dir)) == sorted(os.listdir(serial_dir))
+    finally:
+        shutil.rmtree(serial_dir)
+        shutil.rmtree(parallel_dir)
+
+def test_oversized_pages_get_a_lower_dpi():
+    """Letter stays at full DPI, an A0 plan and a long receipt are brought under the budget, the floor holds"""
+    assert page_dpi(612, 792, 200, max_pixels=12_000_000, min_dpi=72) == 200
+    a0 = page_dpi(2384, 3370, 200, max_pixels=12_000_000, min_dpi=72)
+    assert a0 < 200
+    assert -(-2384 * a0 // 72) * -(-3370 * a0 // 72) <= 12_000_000
+    assert page_dpi(2384, 3370, 200, max_pixels=1_000_000, min_dpi=72) == 72
+    assert page_dpi(2384, 3370, 200, max_pixels=0, min_dpi=72) == 200
+    assert page_dpi(612, 792, 50, max_pixels=12_000_000, min_dpi=72) == 50
+
+def test_render_windows_split_where_the_dpi_changes():
+    assert list(iter_render_windows(5, 3, 200, {2: 100, 3: 100})) == [(1, 1, 200), (2, 3, 100), (4, 5, 200)]
+    assert list(iter_render_windows(4, 2, 200, {}, skip_pages={2})) == [(1, 1, 200), (3, 4, 200)]
+
+@requires_poppler
+@pytest.mark.parametrize('direct', [True, False])
+def test_oversized_page_is_rendered_within_the_pixel_budget(direct):
+    """Each page of a mixed document is rendered at its own DPI, reported on the page"""
+    output_dir = tempfile.mkdtemp()
+    try:
+        pdf_path = os.path.join(output_dir, 'plans.pdf')
+        writer = PyPDF2.PdfWriter()
+        writer.add_blank_page(612, 792)
+        writer.add_blank_page(2384, 3370)
+        writer.add_blank_page(612, 792)
+        with open(pdf_path, 'wb') as f:
+            writer.write(f)
+
+        pages = list(render_and_save(pdf_path, output_dir, 'plans', dpi=30, window_size=3, processes=1,
+                                     direct=direct, max_pixels=200_000, min_dpi=10))
+        assert [page['dpi'] for page in pages] == [30, 11, 30]
+        for page in pages:
+            assert page['width'] * page['height'] <= 200_000
+            with Image.open(os.path.join(output_dir, page['filename'])) as image:
+                assert image.size == (page['width'], page['height'])
+    finally:
+        shutil.rmtree(output_dir)
+
+def test_unknown_backend_is_refused():
+    with pytest.raises(ValueError):
+        get_backend('ghostscript')
+
+@requires_poppler
+@requires_pdfium
+def test_pdfium_backend_matches_poppler_pages():
+    """Both backends should produce the same pages, named and sized alike and looking the same"""
+    poppler_dir, pdfium_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        poppler = list(render_and_save(SAMPLE_PDF, poppler_dir, 'guest', dpi=30, processes=1, backend='poppler',
+                                       blank_pages='keep'))
+        pdfium = list(render_and_save(SAMPLE_PDF, pdfium_dir, 'guest', dpi=30, processes=1, backend='pdfium',
+                                      blank_pages='keep'))
+        assert get_backend('pdfium').page_count(SAMPLE_PDF) == 5
+        assert sorted(os.listdir(pdfium_dir)) == sorted(os.listdir(poppler_dir))
+        for expected, page in zip(poppler, pdfium):
+            assert (page['page_number'], page['width'], page['height']) == \
+                (expected['page_number'], expected['width'], expected['height'])
+            assert page['blank'] == expected['blank']
+            assert hamming_distance(page['phash'], expected['phash']) <= 6
+    finally:
+        shutil.rmtree(poppler_dir)
+        shutil.rmtree(pdfium_dir)
+
+@requires_poppler
+@requires_pdfium
+def test_benchmark_reports_every_backend():
+    from benchmark_renderers import benchmark_file, summarize
+
+    results = [benchmark_file(SAMPLE_PDF, backend, dpi=30, repeat=1) for backend in ('poppler', 'pdfium')]
+    for result in results:
+        assert 'error' not in result
+        assert result['pages'] == 5
+        assert 0 < result['first_page_seconds'] <= result['convert_seconds']
+    summary = summarize(results)
+    assert {total['backend'] for total in summary} == {'poppler', 'pdfium'}
+    assert sum(total['wins'] for total in summary) == 1
+    assert summary[0]['convert_seconds'] <= summary[1]['convert_seconds']
+
+if __name__ == "__main__":
+    test_page_windows_cover_every_page_once()
+    test_pages_are_written_in_order()
+    test_direct_to_disk_matches_pil_path()
+    test_process_count_defaults_to_available_cores()
+    test_parallel_rendering_matches_serial_page_order()
+    test_oversized_pages_get_a_lower_dpi()
+    test_render_windows_split_where_the_dpi_changes()
+    test_oversized_page_is_rendered_within_the_pixel_budget(True)
+    test_oversized_page_is_rendered_within_the_pixel_budget(False)
+    test_unknown_backend_is_refused()
+    test_pdfium_backend_matches_poppler_pages()
+    test_benchmark_reports_every_backend()
+    print("Renderer tests passed")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test rendition profiles derived from rendered pages
+"""
+import os
+import shutil
+import tempfile
+import pytest
+from PIL import Image
+
+from renditions import RENDITION_PROFILES, make_rendition, parse_rendition_names, rendition_scale, save_rendition
+from conftest import DATA_DIR, poppler_marker
+
+SAMPLE_PDF = os.path.join(DATA_DIR, 'CIF-Retail-15042025.pdf')
+
+requires_poppler = poppler_marker(SAMPLE_PDF)
+
+def test_parse_rendition_names():
+    """Profiles are de-duplicated, archive is implicit and unknown names are rejected"""
+    assert parse_rendition_names('llm, preview,llm') == ('llm', 'preview')
+    assert parse_rendition_names('archive') == ()
+    assert parse_rendition_names('') == ()
+    # Only clients that ask get extra files
+    assert parse_rendition_names(None) == ()
+    with pytest.raises(ValueError):
+        parse_rendition_names('thumbnail')
+
+def test_llm_rendition_respects_pixel_budget():
+    """An A4 page at 200 dpi is reduced to the llm pixel budget in grayscale"""
+    page = Image.new('RGB', (1654, 2339), 'white')
+    rendition = make_rendition(page, 'llm', source_dpi=200)
+    assert rendition.mode == 'L'
+    assert rendition.width * rendition.height <= RENDITION_PROFILES['llm']['max_pixels']
+    assert rendition.width / rendition.height == pytest.approx(page.width / page.height, rel=0.01)
+
+def test_renditions_never_upscale():
+    """A small source raster is left at its own size"""
+    assert rendition_scale(100, 100, RENDITION_PROFILES['preview'], source_dpi=50) == 1.0
+
+def test_rendition_is_encoded_in_profile_format():
+    page = Image.new('RGB', (800, 1000), 'white')
+    output_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(output_dir, 'page.preview.jpg')
+        save_rendition(make_rendition(page, 'preview', source_dpi=200), path, 'preview')
+        with Image.open(path) as saved:
+            assert saved.format == 'JPEG'
+    finally:
+        shutil.rmtree(output_dir)
+
+@requires_poppler
+def test_conversion_returns_llm_renditions_alongside_archive():
+    from app import app
+
+    client = app.test_client()
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = client.post('/conversion/pdf-to-png-save', data={'pdfFile': (f, 'cif.pdf'), 'renditions': 'llm'})
+    assert response.status_code == 200
+    body = response.json
+    assert len(body['renditions']['llm']) == len(body['accessible_urls']) == 3
+    assert all(url.endswith('.llm.jpg') for url in body['renditions']['llm'])
+
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = client.post('/conversion/pdf-to-png-save', data={'pdfFile': (f, 'cif.pdf'), 'renditions': 'huge'})
+    assert response.status_code == 400
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
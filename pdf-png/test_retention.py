@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test the retention index and sweeper for generated images
+"""
+import os
+import time
+import pytest
+
+from conversion_cache import ConversionCache, make_cache_key, write_manifest
+from retention import RetentionIndex, RetentionSweeper, STATE_PENDING, STATE_READY
+
+@pytest.fixture
+def root_dir(tmp_path):
+    return str(tmp_path / 'generated')
+
+def add_conversion(index, name, size, pdf_sha256='a' * 64):
+    """Write a finished conversion directory of the given size and record it"""
+    entry_dir = os.path.join(index.root_dir, name)
+    os.makedirs(entry_dir)
+    index.record(name, pdf_sha256)
+    with open(os.path.join(entry_dir, 'form_page_1.png'), 'wb') as f:
+        f.write(b'\0' * size)
+    manifest = write_manifest(entry_dir, {"pdf_sha256": pdf_sha256, "files": ['form_page_1.png']})
+    index.complete(name, manifest['size_bytes'], pdf_sha256)
+    return entry_dir
+
+def age(index, name, seconds):
+    """Pretend a conversion was created and last used seconds ago"""
+    past = time.time() - seconds
+    with index._connect() as conn:
+        conn.execute("UPDATE conversions SET created_at = ?, last_access = ? WHERE name = ?", (past, past, name))
+
+def test_conversions_are_recorded_with_size_hash_and_times(root_dir):
+    index = RetentionIndex(root_dir)
+    add_conversion(index, 'first', 100, 'b' * 64)
+    record = index.get('first')
+    assert record['state'] == STATE_READY
+    assert record['size_bytes'] == 100
+    assert record['pdf_sha256'] == 'b' * 64
+    assert record['created_at'] <= record['last_access']
+    assert index.stats()['entries'] == 1 and index.stats()['total_bytes'] == 100
+
+    # The index lives beside the conversions, not among them, and is shared by a second process
+    assert not os.path.abspath(index.db_path).startswith(os.path.abspath(root_dir) + os.sep)
+    assert RetentionIndex(root_dir).get('first')['size_bytes'] == 100
+
+def test_default_index_is_outside_the_served_tree():
+    from config import config
+    from retention import retention_index
+
+    served = os.path.abspath(config.GENERATED_IMAGES_DIR) + os.sep
+    assert not os.path.abspath(retention_index.db_path).startswith(served)
+
+def test_sweep_removes_expired_and_abandoned_conversions(root_dir):
+    index = RetentionIndex(root_dir, ttl_seconds=3600, stale_seconds=600)
+    add_conversion(index, 'recent', 100)
+    add_conversion(index, 'unused', 100)
+    age(index, 'unused', 7200)
+
+    abandoned_dir = os.path.join(root_dir, 'abandoned')
+    os.makedirs(abandoned_dir)
+    index.record('abandoned')
+    age(index, 'abandoned', 1200)
+    rendering_dir = os.path.join(root_dir, 'rendering')
+    os.makedirs(rendering_dir)
+    index.record('rendering')
+    age(index, 'rendering', 1200)
+    old = time.time() - 1200
+    os.utime(abandoned_dir, (old, old))
+
+    # Handed out again recently, but created too long ago: nginx serves the pages unseen,
+    # so expiry counts from creation
+    add_conversion(index, 'old', 100)
+    age(index, 'old', 7200)
+    index.touch('old')
+
+    result = index.sweep()
+    assert sorted(result['expired']) == ['old', 'unused']
+    assert result['abandoned'] == ['abandoned'] and result['evicted'] == []
+    assert [name for name in sorted(os.listdir(root_dir)) if not name.startswith('.')] == ['recent', 'rendering']
+    assert index.get('unused') is None and index.get('abandoned') is None
+    # Still written to recently, so not abandoned yet
+    assert index.get('rendering')['state'] == STATE_PENDING
+
+def test_quota_evicts_least_recently_used(root_dir):
+    index = RetentionIndex(root_dir, ttl_seconds=0, max_bytes=250)
+    for name in ('first', 'second', 'third'):
+        add_conversion(index, name, 100)
+    age(index, 'first', 30)
+    age(index, 'second', 20)
+    index.touch('first')
+
+    assert index.sweep()['evicted'] == ['second']
+    assert not os.path.exists(os.path.join(root_dir, 'second'))
+    assert index.stats()['total_bytes'] == 200
+
+def test_existing_directories_are_imported_once(root_dir):
+    os.makedirs(root_dir)
+    # Written while tracked by an index kept elsewhere, so the default one starts out empty
+    cache = ConversionCache(root_dir, index=RetentionIndex(root_dir, db_path=os.path.join(root_dir, '..', 'old.db')))
+    key = make_cache_key('c' * 64, {})
+    entry_dir = cache.claim(key)
+    with open(os.path.join(entry_dir, 'form_page_1.png'), 'wb') as f:
+        f.write(b'\0' * 50)
+    cache.commit(key, {"pdf_sha256": 'c' * 64, "files": ['form_page_1.png']})
+    os.makedirs(os.path.join(root_dir, 'interrupted'))
+
+    # A deployment that predates the index (or lost it) lists the directory once
+    index = RetentionIndex(root_dir)
+    assert index.get(key)['size_bytes'] == 50
+    assert index.get(key)['pdf_sha256'] == 'c' * 64
+    assert index.get('interrupted')['state'] == STATE_PENDING
+    assert ConversionCache(root_dir).lookup(key)['files'] == ['form_page_1.png']
+
+    os.makedirs(os.path.join(root_dir, 'later'))
+    assert RetentionIndex(root_dir).get('later') is None
+
+def test_one_process_sweeps_per_interval(root_dir):
+    index = RetentionIndex(root_dir)
+    first, second = RetentionSweeper(index, 300), RetentionSweeper(RetentionIndex(root_dir), 300)
+    assert first.sweep_if_due() is not None
+    assert second.sweep_if_due() is None
+
+def test_index_is_not_served():
+    from app import app
+
+    client = app.test_client()
+    assert client.get('/conversion/generated_images/.retention.sqlite3').status_code == 404
+    assert client.get('/conversion/generated_images/x/.render-1.png').status_code == 404
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
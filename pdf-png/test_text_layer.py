@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test text-layer extraction and the text-bearing page check
+"""
+import io
+import os
+import pytest
+from PIL import Image, ImageDraw
+
+from text_layer import is_text_bearing, parse_bbox_layout
+from conftest import DATA_DIR, poppler_marker
+
+SAMPLE_PDF = os.path.join(DATA_DIR, 'CIF-Retail-15042025.pdf')
+
+requires_poppler = poppler_marker(SAMPLE_PDF, tool='pdftotext')
+
+BBOX_LAYOUT = """<!DOCTYPE html><html xmlns="http://www.w3.org/1999/xhtml"><head><title></title></head><body>
+<doc>
+  <page width="612.000000" height="792.000000">
+    <flow><block xMin="72" yMin="100" xMax="300" yMax="140">
+      <line xMin="72" yMin="120" xMax="200" yMax="132"><word xMin="72" yMin="120" xMax="120" yMax="132">Second</word><word xMin="124" yMin="120" xMax="200" yMax="132">line</word></line>
+      <line xMin="72" yMin="100" xMax="300" yMax="112"><word xMin="72" yMin="100" xMax="150" yMax="112">Application</word><word xMin="154" yMin="100" xMax="300" yMax="112">Form &amp; Terms</word></line>
+    </block></flow>
+  </page>
+  <page width="612.000000" height="792.000000">
+  </page>
+</doc>
+</body></html>"""
+
+def test_bbox_layout_is_parsed_in_reading_order():
+    pages = parse_bbox_layout(BBOX_LAYOUT, include_words=True)
+    assert [page["page_number"] for page in pages] == [1, 2]
+    first = pages[0]
+    assert first["text"] == "Application Form & Terms\nSecond line"
+    assert first["lines"][0]["bbox"] == [72.0, 100.0, 300.0, 112.0]
+    assert [word["text"] for word in first["lines"][1]["words"]] == ["Second", "line"]
+    assert first["text_bearing"]
+    assert not pages[1]["text_bearing"]
+
+def test_garbled_or_sparse_text_is_not_text_bearing():
+    assert not is_text_bearing("Page 1")
+    assert not is_text_bearing("■■■ □□□□ ■■■■ □□□□ ■■■■ □□")
+    assert is_text_bearing("Customer Information Form (Retail)")
+
+@requires_poppler
+def test_text_layer_endpoint_flags_scanned_pages():
+    from app import app
+
+    client = app.test_client()
+    with open(SAMPLE_PDF, 'rb') as f:
+        response = client.post('/conversion/text-layer', data={'pdfFile': (f, 'cif.pdf')})
+    assert response.status_code == 200
+    assert response.json["text_bearing_pages"] == [1, 2, 3]
+    assert response.json["image_pages"] == []
+    assert "CUSTOMER INFORMATION FORM" in response.json["pages"][0]["text"]
+
+    # A page that is only a picture of text has no text layer
+    scan = Image.new('RGB', (850, 1100), 'white')
+    ImageDraw.Draw(scan).text((100, 100), "Scanned application form", fill='black')
+    scanned_pdf = io.BytesIO()
+    scan.save(scanned_pdf, format='PDF')
+    scanned_pdf.seek(0)
+    response = client.post('/conversion/text-layer', data={'pdfFile': (scanned_pdf, 'scan.pdf')})
+    assert response.status_code == 200
+    assert response.json["image_pages"] == [1]
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test upload spooling: single copy on disk, hashing on receipt and the size limit
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import pytest
+from flask import Flask, jsonify, request
+
+from uploads import SpoolingRequest, UploadSpool, spool_upload
+
+@pytest.fixture
+def spool_app():
+    """A bare app using SpoolingRequest that reports what it received"""
+    spool_dir = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.request_class = SpoolingRequest
+    seen = {}
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        stream = request.files['pdfFile'].stream
+        seen['path'] = stream.path
+        if request.form.get('keep'):
+            path, sha256 = spool_upload(request.files['pdfFile'])
+            seen['kept'] = path
+            return jsonify({"sha256": sha256})
+        return jsonify({"sha256": stream.sha256, "spooled": isinstance(stream, UploadSpool)})
+
+    from config import config
+    original_dir = config.UPLOAD_SPOOL_DIR
+    config.UPLOAD_SPOOL_DIR = spool_dir
+    yield app, seen
+    config.UPLOAD_SPOOL_DIR = original_dir
+    shutil.rmtree(spool_dir)
+
+def test_upload_is_hashed_while_spooled(spool_app):
+    app, seen = spool_app
+    payload = os.urandom(700 * 1024)
+    response = app.test_client().post('/upload', data={'pdfFile': (io.BytesIO(payload), 'a.pdf')})
+    assert response.json == {"sha256": hashlib.sha256(payload).hexdigest(), "spooled": True}
+    # The spool file goes away with the request
+    assert not os.path.exists(seen['path'])
+
+def test_detached_upload_outlives_request(spool_app):
+    app, seen = spool_app
+    payload = b'%PDF-1.4 small'
+    response = app.test_client().post('/upload', data={'pdfFile': (io.BytesIO(payload), 'a.pdf'), 'keep': '1'})
+    assert response.json['sha256'] == hashlib.sha256(payload).hexdigest()
+    with open(seen['kept'], 'rb') as f:
+        assert f.read() == payload
+    os.remove(seen['kept'])
+
+def test_oversized_upload_is_refused():
+    from app import app
+
+    original = app.config['MAX_CONTENT_LENGTH']
+    app.config['MAX_CONTENT_LENGTH'] = 1024
+    try:
+        response = app.test_client().post(
+            '/conversion/pdf-metadata', data={'pdfFile': (io.BytesIO(b'0' * 4096), 'big.pdf')}
+        )
+    finally:
+        app.config['MAX_CONTENT_LENGTH'] = original
+    assert response.status_code == 413
+    assert 'error' in response.json
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
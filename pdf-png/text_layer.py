@@ -0,0 +1,87 @@
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+from config import config
+
+# Text-layer extraction with poppler's pdftotext -bbox-layout. Born-digital
+# pages give their text and layout for a few kilobytes of JSON; only pages
+# without a usable text layer (scans) need to be sent on as images.
+
+XHTML = '{http://www.w3.org/1999/xhtml}'
+
+class TextLayerError(Exception):
+    """pdftotext failed or produced output we could not parse"""
+
+def pdftotext_command():
+    if config.POPPLER_PATH:
+        return os.path.join(config.POPPLER_PATH, 'pdftotext')
+    return 'pdftotext'
+
+def bbox(element):
+    """[x0, y0, x1, y1] in PDF points, origin at the top left of the page"""
+    return [round(float(element.get(key)), 2) for key in ('xMin', 'yMin', 'xMax', 'yMax')]
+
+def is_text_bearing(text):
+    """Enough real characters to stand in for the page image.
+
+    Scans often carry no text layer or only a few stray glyphs, and broken
+    font encodings produce runs of symbols; neither is useful to a model.
+    """
+    characters = [c for c in text if not c.isspace()]
+    if len(characters) < config.TEXT_LAYER_MIN_CHARS:
+        return False
+    readable = sum(1 for c in characters if c.isalnum())
+    return readable / len(characters) >= config.TEXT_LAYER_MIN_READABLE_RATIO
+
+def parse_bbox_layout(xhtml, first_page=1, include_words=False):
+    """Turn pdftotext -bbox-layout output into one dict per page"""
+    try:
+        root = ET.fromstring(xhtml)
+    except ET.ParseError as e:
+        raise TextLayerError(f"Could not parse pdftotext output: {e}")
+
+    pages = []
+    for page_number, page in enumerate(root.iter(f'{XHTML}page'), start=first_page):
+        lines = []
+        for line in page.iter(f'{XHTML}line'):
+            words = [(word.text or '', word) for word in line.iter(f'{XHTML}word')]
+            text = ' '.join(word_text for word_text, _ in words if word_text)
+            if not text:
+                continue
+            entry = {"text": text, "bbox": bbox(line)}
+            if include_words:
+                entry["words"] = [{"text": word_text, "bbox": bbox(word)} for word_text, word in words]
+            lines.append(entry)
+        # Reading order: top to bottom, then left to right within a row
+        lines.sort(key=lambda entry: (round(entry["bbox"][1] / 4), entry["bbox"][0]))
+        page_text = '\n'.join(entry["text"] for entry in lines)
+        pages.append({
+            "page_number": page_number,
+            "width": round(float(page.get('width')), 2),
+            "height": round(float(page.get('height')), 2),
+            "text_bearing": is_text_bearing(page_text),
+            "char_count": len(page_text),
+            "text": page_text,
+            "lines": lines
+        })
+    return pages
+
+def extract_text_layer(pdf_path, first_page=None, last_page=None, include_words=False):
+    """Per-page text, line boxes (and optionally word boxes) for the PDF at pdf_path"""
+    command = [pdftotext_command(), '-bbox-layout', '-enc', 'UTF-8']
+    if first_page:
+        command += ['-f', str(first_page)]
+    if last_page:
+        command += ['-l', str(last_page)]
+    command += [pdf_path, '-']
+    try:
+        result = subprocess.run(
+            command, capture_output=True, timeout=config.TEXT_LAYER_TIMEOUT_SECONDS, check=True
+        )
+    except FileNotFoundError:
+        raise TextLayerError("pdftotext is not installed (poppler-utils).")
+    except subprocess.TimeoutExpired:
+        raise TextLayerError("pdftotext timed out.")
+    except subprocess.CalledProcessError as e:
+        raise TextLayerError(f"pdftotext failed: {e.stderr.decode('utf-8', 'replace').strip()}")
+    return parse_bbox_layout(result.stdout, first_page or 1, include_words)
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from flask import Request
+from config import config
+import metrics
+
+class UploadSpool:
+    """Disk-backed container for one uploaded file that hashes the bytes as they arrive.
+
+    Werkzeug writes each multipart file part into the container returned by
+    the request's stream factory, so the upload lands on disk exactly once
+    and its SHA-256 is ready as soon as the body has been parsed. The file
+    is removed when the request closes unless a conversion takes ownership
+    of it with detach().
+    """
+
+    def __init__(self, spool_dir=None):
+        spool_dir = spool_dir or config.UPLOAD_SPOOL_DIR
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix='.upload', dir=spool_dir)
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.detached = False
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        # read, readline, seek, tell, fileno, flush... come from the underlying file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def detach(self):
+        """Hand the spooled file over to the caller, who becomes responsible for removing it"""
+        self._file.flush()
+        self.detached = True
+        return self.path
+
+    def close(self):
+        self._file.close()
+        if not self.detached and os.path.exists(self.path):
+            os.remove(self.path)
+
+class SpoolingRequest(Request):
+    """Request whose file uploads go straight to hashing spool files on disk"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadSpool()
+
+    def _load_form_data(self):
+        started = time.perf_counter()
+        super()._load_form_data()
+        if any(isinstance(file.stream, UploadSpool) for file in self.files.values()):
+            metrics.upload_receive_seconds.observe(time.perf_counter() - started, kind='form')
+
+def spool_upload(file):
+    """Return (path, sha256) of an uploaded file, taking ownership of its spool file.
+
+    Uploads parsed by SpoolingRequest are detached without copying; any other
+    stream is copied into a new spool file once.
+    """
+    stream = file.stream
+    if not isinstance(stream, UploadSpool):
+        spool = UploadSpool()
+        try:
+            stream.seek(0)
+            shutil.copyfileobj(stream, spool)
+        except Exception:
+            spool.close()
+            raise
+        stream = spool
+    path = stream.detach()
+    stream.close()
+    return path, stream.sha256